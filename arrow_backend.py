@@ -0,0 +1,399 @@
+'''This module defines the score calculations on Arrow tables.
+
+Details:
+    The calculators, work_aggregation and the category counts take either
+    pandas dataframes or pyarrow Tables. Tables are calculated here with
+    pyarrow.compute kernels (joins, value_counts, hash aggregations and
+    arithmetic), so the data read from parquet stays columnar until the
+    score store. Outputs have the same columns as the pandas calculations,
+    their row order is not defined.
+        decoded              - dictionary columns decoded to their values
+        assign               - table with a column added or replaced
+        timestamp_ns         - timestamp column as int64 nano seconds
+        floor_divide         - floor division like the pandas // operator
+        rows_since           - rows from a date
+        drop_duplicates      - unique rows of the columns
+        ratio_join           - left join of a population ratio table
+        category_values      - value of every category
+        work_aggregation     - work aggregation of every employee
+        category_counts      - no. of rows of every category
+        counts_ratio         - ratio of every category from the counts
+        nunique_score        - no. of unique values of every employee
+        valid_certificate_score - no. of valid certificates of every employee
+        interview_score      - interview score of every employee
+    Dense rank of the interview dates has no Arrow kernel, it is calculated
+    with segment_kernels on the sorted dates.
+'''
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+
+import segment_kernels as sk
+
+
+def decoded(table, columns=None):
+    '''Returns the table with its dictionary columns decoded, joins and hash
+            aggregations take the plain values
+
+    Args:
+        table (table): Arrow table
+        columns (list, optional): columns to decode.
+                                    Defaults to None (all the columns).
+
+    Returns:
+        table: table without dictionary columns
+    '''
+    for position, field in enumerate(table.schema):
+        if (pa.types.is_dictionary(field.type)
+                and (columns is None or field.name in columns)):
+            table = table.set_column(
+                position, field.name,
+                table.column(position).cast(field.type.value_type))
+
+    return table
+
+
+def assign(table, name, values):
+    '''Returns the table with a column added, or replaced when the table
+            has the column already. The input table is not changed.
+
+    Args:
+        table (table): Arrow table
+        name (str): column name
+        values (array): column values
+
+    Returns:
+        table: table with the column
+    '''
+    position = table.schema.get_field_index(name)
+
+    if position >= 0:
+        return table.set_column(position, name, values)
+
+    return table.append_column(name, values)
+
+
+def timestamp_ns(values):
+    '''Returns a timestamp column as int64 nano seconds, nulls are kept
+
+    Args:
+        values (array): timestamp column
+
+    Returns:
+        array: nano seconds since epoch
+    '''
+    return values.cast(pa.timestamp('ns')).cast(pa.int64())
+
+
+def floor_divide(values, divisor):
+    '''Floor division of the values, integer division of pyarrow.compute
+            truncates towards zero
+
+    Args:
+        values (array): numerator
+        divisor (array or int): denominator
+
+    Returns:
+        array: floor of the division, floating values stay floating
+    '''
+    if pa.types.is_floating(values.type):
+        return pc.floor(pc.divide(values, divisor))
+
+    quotient = pc.divide(values, divisor)
+    inexact = pc.not_equal(pc.multiply(quotient, divisor), values)
+    negative = pc.xor(pc.less(values, 0), pc.less(divisor, 0))
+
+    return pc.if_else(pc.and_(inexact, negative),
+                      pc.subtract(quotient, 1), quotient)
+
+
+def rows_since(table, date_col, since):
+    '''Returns the rows of the table from a date
+
+    Args:
+        table (table): Arrow table
+        date_col (str): date column
+        since (datetime): first date
+
+    Returns:
+        table: rows whose date is since or later
+    '''
+    since_ns = int(np.datetime64(since, 'ns').view('int64'))
+
+    return table.filter(pc.greater_equal(
+        timestamp_ns(table.column(date_col)), since_ns))
+
+
+def drop_duplicates(table, columns):
+    '''Returns the unique rows of the columns
+
+    Args:
+        table (table): Arrow table
+        columns (list): column names
+
+    Returns:
+        table: unique rows of the columns, dictionary columns are decoded
+    '''
+    return decoded(table.select(columns)).group_by(columns).aggregate(
+        [(columns[0], 'count')]).select(columns)
+
+
+def ratio_join(table, ratio_table, join_col, inverse=False):
+    '''Left join of the population ratio of every join column value, the
+            values without ratio are 0
+
+    Args:
+        table (table): person rows
+        ratio_table (table or dataframe): join_col and {join_col}_ratio
+        join_col (str): joining column
+        inverse (bool, optional): 100 - ratio, low ratio gets high score.
+                                    Defaults to False.
+
+    Returns:
+        table: person rows with the {join_col}_ratio column
+    '''
+    ratio_col = f'{join_col}_ratio'
+
+    if not isinstance(ratio_table, pa.Table):
+        ratio_table = pa.Table.from_pandas(ratio_table, preserve_index=False)
+
+    table = decoded(table, [join_col])
+    ratio_table = decoded(ratio_table.select([join_col, ratio_col]))
+
+    # Join keys must have the same type, Ex. float total_exp of pandas
+    key_type = table.schema.field(join_col).type
+    if ratio_table.schema.field(join_col).type != key_type:
+        ratio_table = ratio_table.set_column(
+            0, join_col, ratio_table.column(join_col).cast(key_type))
+
+    if inverse:
+        ratio_table = ratio_table.set_column(
+            1, ratio_col, pc.subtract(100, ratio_table.column(ratio_col)))
+
+    score_table = table.join(ratio_table, keys=join_col,
+                             join_type='left outer')
+
+    return assign(score_table, ratio_col,
+                  pc.fill_null(score_table.column(ratio_col), 0))
+
+
+def category_values(categories, category_values):
+    '''Maps every category to its value, other categories are null
+
+    Args:
+        categories (array): category column
+        category_values (dict): value of every category
+
+    Returns:
+        array: value of every row
+    '''
+    if pa.types.is_dictionary(categories.type):
+        categories = categories.cast(categories.type.value_type)
+
+    positions = pc.index_in(categories, value_set=pa.array(
+        list(category_values), type=categories.type))
+
+    return pa.array(list(category_values.values())).take(positions)
+
+
+def work_aggregation(table, work_start_date, work_end_date, emp_type_col,
+                     year_ns):
+    '''Aggregates the work rows of every employee like
+            DataManipulation.work_aggregation
+
+    Args:
+        table (table): work rows
+        work_start_date (str): start date of work column
+        work_end_date (str): end date of work column
+        emp_type_col (str): type of employment column
+        year_ns (int): one year in nano seconds
+
+    Returns:
+        table: emp_id, total_exp, total_switch, switch_rel and no_of_domain
+    '''
+    table = decoded(table, ['emp_id', 'domain', emp_type_col])
+
+    exp_years = floor_divide(
+        pc.subtract(timestamp_ns(table.column(work_end_date)),
+                    timestamp_ns(table.column(work_start_date))),
+        year_ns)
+
+    # Missing type or experience is not a short contract
+    contract_2y = pc.invert(pc.and_(
+        pc.fill_null(pc.equal(table.column(emp_type_col), 'Contracting'),
+                     False),
+        pc.fill_null(pc.less_equal(exp_years, 2), False)))
+
+    exp_table = pa.Table.from_arrays(
+        [table.column('emp_id'), table.column('work_exp_id'),
+         table.column('domain'), exp_years, contract_2y.cast(pa.int64())],
+        names=['emp_id', 'work_exp_id', 'domain', 'exp_years',
+               'contract_2y'])
+
+    agg_table = exp_table.group_by('emp_id').aggregate([
+        ('exp_years', 'sum'), ('work_exp_id', 'count'),
+        ('contract_2y', 'sum'), ('domain', 'count_distinct')])
+
+    return pa.Table.from_arrays(
+        [agg_table.column('emp_id'), agg_table.column('exp_years_sum'),
+         agg_table.column('work_exp_id_count'),
+         agg_table.column('contract_2y_sum'),
+         agg_table.column('domain_count_distinct')],
+        names=['emp_id', 'total_exp', 'total_switch', 'switch_rel',
+               'no_of_domain'])
+
+
+def category_counts(table, category_cols):
+    '''Counts the rows of every category, rows with a missing category are
+            not counted
+
+    Args:
+        table (table): table with the category columns
+        category_cols (list): category column names
+
+    Returns:
+        table: category_cols and count
+    '''
+    table = decoded(table.select(category_cols))
+
+    if len(category_cols) == 1:
+        counts = pc.value_counts(
+            table.column(0).drop_null().combine_chunks())
+        return pa.Table.from_arrays(
+            [counts.field('values'), counts.field('counts')],
+            names=[category_cols[0], 'count'])
+
+    valid = pc.is_valid(table.column(0))
+    for col in category_cols[1:]:
+        valid = pc.and_(valid, pc.is_valid(table.column(col)))
+
+    count_table = table.filter(valid).group_by(category_cols).aggregate(
+        [(category_cols[0], 'count')])
+
+    return pa.Table.from_arrays(
+        [count_table.column(col) for col in category_cols]
+        + [count_table.column(f'{category_cols[0]}_count')],
+        names=category_cols + ['count'])
+
+
+def counts_ratio(count_table, category_col):
+    '''Calculates the ratio of every category from the category counts
+            like DataManipulation.counts_ratio
+
+    Args:
+        count_table (table): category and count
+        category_col (str): category column name
+
+    Returns:
+        table: category_col and {category_col}_ratio, highest count first
+    '''
+    counts = decoded(count_table.select([category_col, 'count'])).group_by(
+        category_col).aggregate([('count', 'sum')])
+
+    total = pc.sum(counts.column('count_sum')).as_py() or 0
+    ratio = pc.floor(pc.multiply(
+        pc.divide(counts.column('count_sum').cast(pa.float64()), total),
+        100)).cast(pa.int64())
+
+    ratio_table = pa.Table.from_arrays(
+        [counts.column(category_col), ratio, counts.column('count_sum')],
+        names=[category_col, f'{category_col}_ratio', 'count'])
+
+    return ratio_table.sort_by([('count', 'descending')]).select(
+        [category_col, f'{category_col}_ratio'])
+
+
+def nunique_score(table, value_col, count_col, score_col):
+    '''Counts the unique values of every employee, score is 10 for every
+            value
+
+    Args:
+        table (table): emp_id and the value column
+        value_col (str): value column name
+        count_col (str): output column of the no. of values
+        score_col (str): output column of the score
+
+    Returns:
+        table: emp_id, count_col and score_col
+    '''
+    count_table = decoded(table.select(['emp_id', value_col])).group_by(
+        'emp_id').aggregate([(value_col, 'count_distinct')])
+    counts = count_table.column(f'{value_col}_count_distinct')
+
+    return pa.Table.from_arrays(
+        [count_table.column('emp_id'), counts, pc.multiply(counts, 10)],
+        names=['emp_id', count_col, score_col])
+
+
+def valid_certificate_score(table, today_ns, valid_years, year_ns):
+    '''Counts the certificates of every employee completed within the
+            valid years
+
+    Args:
+        table (table): certificate rows
+        today_ns (int): current time in nano seconds
+        valid_years (int): valid years
+        year_ns (int): one year in nano seconds
+
+    Returns:
+        table: emp_id, no_of_certs and cert_score
+    '''
+    cert_years = floor_divide(
+        pc.subtract(today_ns,
+                    timestamp_ns(table.column('certificate_completion_date'))),
+        year_ns)
+
+    # Certificates without completion date are not valid
+    valid_table = table.select(['emp_id', 'certificate_id']).filter(
+        pc.less_equal(cert_years, valid_years))
+
+    return nunique_score(valid_table, 'certificate_id', 'no_of_certs',
+                         'cert_score')
+
+
+def interview_score(table, interview_status, status_values):
+    '''Calculates the interview score of every employee like
+            PersonalScoreCalculator.interview_score. Every interview date
+            gets dense rank within the employee, interviews without date
+            are not scored.
+
+    Args:
+        table (table): interview rows
+        interview_status (list): valid interview status
+        status_values (dict): value of every interview status
+
+    Returns:
+        table: emp_id and interview_score
+    '''
+    table = decoded(table.select(['emp_id', 'int_date', 'int_status_desc']))
+    table = table.filter(pc.is_in(table.column('int_status_desc'),
+                                  value_set=pa.array(interview_status)))
+
+    table = table.sort_by([('emp_id', 'ascending'),
+                           ('int_date', 'ascending')]).combine_chunks()
+
+    # Codes of the sorted emp_id are in emp_id order
+    emp_codes = pc.dictionary_encode(
+        table.column('emp_id').combine_chunks()).indices.to_numpy()
+    int_dates = timestamp_ns(table.column('int_date').combine_chunks())
+    dated = pc.is_valid(int_dates).to_numpy(zero_copy_only=False)
+
+    int_order = np.zeros(table.num_rows, dtype='int64')
+    int_order[dated] = sk.segment_dense_rank(
+        emp_codes[dated], int_dates.fill_null(0).to_numpy()[dated])
+
+    scores = pc.multiply(pc.multiply(category_values(
+        table.column('int_status_desc'), status_values), 10),
+        pa.array(int_order))
+
+    score_table = pa.Table.from_arrays(
+        [table.column('emp_id'), scores],
+        names=['emp_id', 'interview_score']).group_by('emp_id').aggregate(
+            [('interview_score', 'sum')])
+
+    # Float scores like the pandas calculation
+    return pa.Table.from_arrays(
+        [score_table.column('emp_id'),
+         score_table.column('interview_score_sum').cast(pa.float64())],
+        names=['emp_id', 'interview_score'])
@@ -1,57 +1,345 @@
 ''' This module is used to connect the cassandra database
 
 class       : CassandraCluster
-functions   : cassandra_session (Creates session for the given credentials)
+functions   : cassandra_session (returns the session of the process, it is
+                                    created for the given credentials once)
+              prepare (returns the cached prepared statement of a query)
               pandas_result_set (returns pandas df for the given query)
+              paged_result_set (yields pandas df page by page)
+              arrow_result_set (yields Arrow record batch page by page)
+              parquet_result_set (writes query result into parquet file)
+              export_tables (writes several tables into parquet concurrently)
+              token_range_scan (writes one table into parquet dataset
+                                    by token range subqueries)
               cluster_shutdown (close the connection)
+
+Details:
+    CassandraCluster is a context manager holding one Cluster and Session
+    for the whole process
+        with CassandraCluster(ip, port, user, pwd) as session:
+            ...
+    Queries are sent as prepared statements, which are prepared once per
+    keyspace and query. Row factories, retry and speculative execution
+    policies are set by execution profiles, all the queries are reads so
+    they are marked idempotent and can be retried and speculated.
 '''
 
 import logging.config
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 from cassandra.auth import PlainTextAuthProvider
-from cassandra.cluster import Cluster
-from cassandra.policies import DCAwareRoundRobinPolicy
+from cassandra.cluster import EXEC_PROFILE_DEFAULT, Cluster, ExecutionProfile
+from cassandra.policies import (ConstantSpeculativeExecutionPolicy,
+                                DCAwareRoundRobinPolicy,
+                                DowngradingConsistencyRetryPolicy,
+                                FallthroughRetryPolicy, HostDistance,
+                                RetryPolicy, TokenAwarePolicy)
 
 # Initialize log
 logger = logging.getLogger(__name__)
 
+# Murmur3Partitioner token boundaries
+MIN_TOKEN = -2 ** 63
+MAX_TOKEN = 2 ** 63 - 1
+
+# Arrow types of the CQL types, other types (tuple, map, user defined
+# types) are kept as text
+CQL_ARROW_TYPES = {
+    'ascii': pa.string(), 'text': pa.string(), 'varchar': pa.string(),
+    'tinyint': pa.int8(), 'smallint': pa.int16(), 'int': pa.int32(),
+    'bigint': pa.int64(), 'counter': pa.int64(),
+    'float': pa.float32(), 'double': pa.float64(), 'boolean': pa.bool_(),
+    'timestamp': pa.timestamp('us'), 'date': pa.date32(),
+    'time': pa.time64('us'), 'blob': pa.binary(),
+    'uuid': pa.string(), 'timeuuid': pa.string(), 'inet': pa.string(),
+    'decimal': pa.string(), 'varint': pa.string(), 'duration': pa.string(),
+}
+
+# Driver values which are converted before they are added into Arrow
+CQL_CONVERTERS = {
+    'date': lambda value: value.date(),
+    'time': lambda value: value.time(),
+    'uuid': str, 'timeuuid': str, 'decimal': str, 'varint': str,
+    'duration': str,
+}
+
+
+def add_condition(query, condition, allow_filtering=False):
+    '''Returns the query with the condition added into its where clause
+
+        Input arguments:
+            query (str)             - select query, it can have a where
+                                        clause and ALLOW FILTERING
+            condition (str)         - condition to be added
+            allow_filtering (bool)  - adds ALLOW FILTERING
+                                        default value is False
+        Output argument:
+            query (str)
+    '''
+    if query.endswith(' ALLOW FILTERING'):
+        query = query[:-len(' ALLOW FILTERING')]
+        allow_filtering = True
+
+    query += (' AND ' if ' WHERE ' in query else ' WHERE ') + condition
+
+    return query + (' ALLOW FILTERING' if allow_filtering else '')
+
+
+def pandas_factory(colnames, rows):
+    '''Row factory which builds a pandas dataframe for every page'''
+    return pd.DataFrame(rows, columns=colnames)
+
+
+def column_factory(colnames, rows):
+    '''Row factory which keeps every page as columns of driver values'''
+    if not rows:
+        return [() for _ in colnames]
+
+    return list(zip(*rows))
+
+
+def arrow_field(name, cql_type):
+    '''Returns the Arrow field and the value converter of a CQL column
+
+        Input arguments:
+            name (str)          - column name
+            cql_type (class)    - CQL type of the column (cassandra.cqltypes)
+        Output argument:
+            field, converter    - Arrow field and the function which converts
+                                    a driver value, None when the value is
+                                    added as it is
+    '''
+    typename = cql_type.typename
+
+    if typename in CQL_ARROW_TYPES:
+        return (pa.field(name, CQL_ARROW_TYPES[typename]),
+                CQL_CONVERTERS.get(typename))
+
+    # Lists and sets of the types added as they are become list columns
+    subtypes = getattr(cql_type, 'subtypes', ())
+    if (typename in ('list', 'set') and len(subtypes) == 1
+            and subtypes[0].typename in CQL_ARROW_TYPES
+            and subtypes[0].typename not in CQL_CONVERTERS):
+        return (pa.field(name,
+                         pa.list_(CQL_ARROW_TYPES[subtypes[0].typename])),
+                list)
+
+    return pa.field(name, pa.string()), str
+
+
+def result_fields(result):
+    '''Returns the Arrow fields and the value converters of the columns of
+                                                                a result set
+
+        Input arguments:
+            result (obj)        - result set of the cassandra driver
+        Output argument:
+            fields, converters  - tuples of the output of arrow_field
+    '''
+    return tuple(zip(*[arrow_field(name, cql_type) for name, cql_type in
+                       zip(result.column_names, result.column_types)]))
+
+
+def pandas_page_table(page_df, fields, converters):
+    '''Returns the Arrow table of a pandas page with the Arrow types of the
+            CQL columns. Every page has the same schema, even when a column
+            of the page has only missing values or integers with NaN.
+
+        Input arguments:
+            page_df (dataframe) - result page of pandas_factory
+            fields (tuple)      - Arrow fields of the columns
+            converters (tuple)  - value converters of the columns
+        Output argument:
+            page_table          - Arrow table
+    '''
+    columns = []
+
+    for field, converter in zip(fields, converters):
+        values = page_df[field.name]
+
+        if converter is not None:
+            values = [None if value is None else converter(value)
+                      for value in values]
+        columns.append(pa.array(values, type=field.type, from_pandas=True))
+
+    return pa.Table.from_arrays(columns, schema=pa.schema(fields))
+
 
 class CassandraCluster:
     '''Cassandra cluster connection.'''
 
-    def __init__(self, ip, port, user, pwd):
+    # Execution profiles of the row factories
+    PANDAS_PROFILE = 'pandas'
+    ARROW_PROFILE = 'arrow'
+
+    RETRY_POLICIES = {
+        'default': RetryPolicy,
+        'fallthrough': FallthroughRetryPolicy,
+        'downgrading': DowngradingConsistencyRetryPolicy,
+    }
+
+    # Session options, default values are used for the missing options
+    #   local_dc             - data center of the load balancing policy
+    #   protocol_version     - native protocol version
+    #   token_aware          - sends the queries to a replica of the token
+    #   connect_timeout      - control connection timeout in seconds
+    #   executor_threads     - driver threads of the responses
+    #   core_connections     - connections per host (protocol 1 and 2,
+    #   max_connections        newer protocols use one connection per host)
+    #   retry_policy         - default, fallthrough or downgrading
+    #   speculative_delay_ms - a query is sent to the next host when there is
+    #                          no response within the delay, 0 is disabled
+    #   speculative_attempts - no. of speculative executions of a query
+    SESSION_OPTIONS = {
+        'local_dc': 'datacenter1',
+        'protocol_version': 3,
+        'token_aware': True,
+        'connect_timeout': 100,
+        'executor_threads': 2,
+        'core_connections': 2,
+        'max_connections': 8,
+        'retry_policy': 'default',
+        'speculative_delay_ms': 0,
+        'speculative_attempts': 2,
+    }
+
+    def __init__(self, ip, port, user, pwd, pull_engine='arrow',
+                 session_options=None):
         self.logger = logging.getLogger(__name__)
         self.ip = ip
         self.port = port
         self.user = user
         self.pwd = pwd
+        self.pull_engine = pull_engine
+        self.session_options = {**self.SESSION_OPTIONS,
+                                **(session_options or {})}
+        self.cluster = None
+        self.session = None
+        self.prepared = {}
+        self.lock = threading.Lock()
         self.logger.debug(self)
 
+    def __enter__(self):
+        return self.cassandra_session()[1]
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.cluster_shutdown(self.cluster)
+
+    def _execution_profile(self, row_factory=None):
+        '''Returns an execution profile with the session options'''
+        options = self.session_options
+
+        load_balancing_policy = DCAwareRoundRobinPolicy(
+            local_dc=options['local_dc'])
+        if options['token_aware']:
+            load_balancing_policy = TokenAwarePolicy(load_balancing_policy)
+
+        speculative_execution_policy = None
+        if options['speculative_delay_ms'] > 0:
+            speculative_execution_policy = ConstantSpeculativeExecutionPolicy(
+                options['speculative_delay_ms'] / 1000,
+                options['speculative_attempts'])
+
+        profile = ExecutionProfile(
+            load_balancing_policy=load_balancing_policy,
+            retry_policy=self.RETRY_POLICIES[options['retry_policy']](),
+            speculative_execution_policy=speculative_execution_policy,
+            request_timeout=None)
+
+        if row_factory is not None:
+            profile.row_factory = row_factory
+
+        return profile
+
     def cassandra_session(self):
-        '''Creates session for the cassandra cluser
-                Uses policy as DCAwareRoundRobinPolicy,
-                    protocol version as 3 and
-                    control connection timeout as 100
+        '''Returns the session of the cassandra cluster, the cluster is
+                connected on the first call only and the session is shared
+                by all the callers.
+                IP address can have several comma separated contact points.
+
+            Returns cluster, session
+        '''
+        with self.lock:
+            if self.session is not None and not self.cluster.is_shutdown:
+                return self.cluster, self.session
+
+            options = self.session_options
+            auth_provider = PlainTextAuthProvider(
+                username=self.user, password=self.pwd)
+            cluster = Cluster(
+                contact_points=[ip.strip() for ip in self.ip.split(',')],
+                port=self.port,
+                auth_provider=auth_provider,
+                control_connection_timeout=options['connect_timeout'],
+                protocol_version=options['protocol_version'],
+                executor_threads=options['executor_threads'],
+                execution_profiles={
+                    EXEC_PROFILE_DEFAULT: self._execution_profile(),
+                    self.PANDAS_PROFILE: self._execution_profile(
+                        pandas_factory),
+                    self.ARROW_PROFILE: self._execution_profile(
+                        column_factory),
+                })
+
+            # Connection pool size is configurable for protocol 1 and 2
+            # only, newer protocols multiplex the requests on a connection
+            if options['protocol_version'] < 3:
+                for distance in (HostDistance.LOCAL, HostDistance.REMOTE):
+                    cluster.set_core_connections_per_host(
+                        distance, options['core_connections'])
+                    cluster.set_max_connections_per_host(
+                        distance, options['max_connections'])
+
+            self.cluster = cluster
+            self.session = cluster.connect()
+            self.prepared = {}
+
+        self.logger.debug(self.session)
+
+        return self.cluster, self.session
+
+    def prepare(self, session, query):
+        '''Returns the prepared statement of a query, every query is
+                prepared once for a keyspace. Queries are reads, so the
+                statements are idempotent.
 
-            Returns session
+            Input arguments:
+                session (obj) - Cassandra cluster session object
+                query (str)   - query to be prepared
+            Output argument:
+                statement     - prepared statement
         '''
-        auth_provider = PlainTextAuthProvider(
-            username=self.user, password=self.pwd)
-        cluster = Cluster(
-            contact_points=[self.ip],
-            load_balancing_policy=DCAwareRoundRobinPolicy(
-                local_dc='datacenter1'),
-            port=self.port,
-            auth_provider=auth_provider,
-            control_connection_timeout=100,
-            protocol_version=3
-        )
-        session = cluster.connect()
-
-        self.logger.debug(session)
-
-        return cluster, session
+        key = (session.keyspace, query)
+
+        with self.lock:
+            statement = self.prepared.get(key)
+
+        if statement is None:
+            statement = session.prepare(query)
+            statement.is_idempotent = True
+
+            with self.lock:
+                statement = self.prepared.setdefault(key, statement)
+
+        return statement
+
+    def _bind(self, session, query, parameters=None, fetch_size=None):
+        '''Returns the bound statement of a query or prepared statement.
+                Fetch size None pulls the whole result in one page.'''
+        if isinstance(query, str):
+            query = self.prepare(session, query)
+
+        statement = query.bind(parameters or ())
+        statement.fetch_size = fetch_size
+
+        return statement
 
     def pandas_result_set(self, session, keyspace, query):
         '''Creates result set as pandas dataframe
@@ -67,25 +355,350 @@ class CassandraCluster:
                 https://groups.google.com/a/lists.datastax.com/g/python-driver-user/c/1v-KHtyA0Zs
                 https://www.thetopsites.net/article/59318754.shtml
         '''
-        session.set_keyspace(keyspace)
-
-        def pandas_factory(colnames, rows):
-            return pd.DataFrame(rows, columns=colnames)
+        if session.keyspace != keyspace:
+            session.set_keyspace(keyspace)
 
-        session.row_factory = pandas_factory
-        session.default_fetch_size = None
-
-        result = session.execute(query, timeout=None)
+        result = session.execute(self._bind(session, query), timeout=None,
+                                 execution_profile=self.PANDAS_PROFILE)
         df = result._current_rows
 
         return df
 
+    def _execute_paged(self, session, keyspace, query, fetch_size,
+                       parameters, execution_profile):
+        '''Executes a paged query, returns the result set of the first page'''
+        if session.keyspace != keyspace:
+            session.set_keyspace(keyspace)
+
+        return session.execute(
+            self._bind(session, query, parameters, fetch_size), timeout=None,
+            execution_profile=execution_profile)
+
+    @staticmethod
+    def _pages(result):
+        '''Yields the rows of every page of a result set, the next page is
+                                            fetched after the page is used'''
+        while True:
+            yield result._current_rows
+
+            if not result.has_more_pages:
+                break
+
+            result.fetch_next_page()
+
+    def paged_result_set(self, session, keyspace, query, fetch_size=5000,
+                         parameters=None):
+        '''Yields the result set page by page as pandas dataframes.
+                Only one page is held in memory at a time, so the memory
+                usage depends on the fetch size and not on the table size.
+
+            Input arguments:
+                session (obj)      - Cassandra cluster session object
+                keyspace (str)     - keyspace value
+                query (str or obj) - query to be executed (prepared once) or
+                                        prepared statement
+                fetch_size (int)   - no. of rows per page
+                                        default value is 5000
+                parameters (tuple) - bind values of the prepared statement
+                                        default value is None
+            Output argument:
+                page_df          - Query result page as Pandas dataframe
+        '''
+        yield from self._pages(self._execute_paged(
+            session, keyspace, query, fetch_size, parameters,
+            self.PANDAS_PROFILE))
+
+    def arrow_result_set(self, session, keyspace, query, fetch_size=5000,
+                         parameters=None):
+        '''Yields the result set page by page as Arrow record batches.
+                Columns of the page are built directly from the driver
+                values with the Arrow types of the CQL column types, without
+                a pandas dataframe in between. Missing values are nulls, so
+                integer columns with missing values stay integer.
+
+            Input arguments:
+                session (obj)      - Cassandra cluster session object
+                keyspace (str)     - keyspace value
+                query (str or obj) - query to be executed (prepared once) or
+                                        prepared statement
+                fetch_size (int)   - no. of rows per page
+                                        default value is 5000
+                parameters (tuple) - bind values of the prepared statement
+                                        default value is None
+            Output argument:
+                page_batch         - Query result page as Arrow record batch
+        '''
+        result = self._execute_paged(session, keyspace, query, fetch_size,
+                                     parameters, self.ARROW_PROFILE)
+
+        fields, converters = result_fields(result)
+        schema = pa.schema(fields)
+
+        for page in self._pages(result):
+            columns = []
+
+            for field, converter, values in zip(fields, converters, page):
+                if converter is not None:
+                    values = [None if value is None else converter(value)
+                              for value in values]
+                columns.append(pa.array(values, type=field.type))
+
+            yield pa.RecordBatch.from_arrays(columns, schema=schema)
+
+    def parquet_result_set(self, session, keyspace, query, file_path,
+                           fetch_size=5000, parameters=None, tables=None):
+        '''Writes the result set into a parquet file as it arrives.
+                Every page is written as a parquet row group. Pages are
+                built as Arrow record batches when the pull engine is arrow,
+                as pandas dataframes otherwise. Both engines write the Arrow
+                types of the CQL column types.
+
+            Input arguments:
+                session (obj)      - Cassandra cluster session object
+                keyspace (str)     - keyspace value
+                query (str or obj) - query to be executed (prepared once) or
+                                        prepared statement
+                file_path (str)    - parquet file path
+                fetch_size (int)   - no. of rows per page
+                                        default value is 5000
+                parameters (tuple) - bind values of the prepared statement
+                                        default value is None
+                tables (list)      - written pages are appended as Arrow
+                                        tables, so the result is kept in
+                                        memory as well
+                                        default value is None
+            Output argument:
+                rows (int)         - no. of rows written
+        '''
+        if self.pull_engine == 'arrow':
+            return self._arrow_parquet_result_set(
+                session, keyspace, query, file_path, fetch_size, parameters,
+                tables)
+
+        result = self._execute_paged(session, keyspace, query, fetch_size,
+                                     parameters, self.PANDAS_PROFILE)
+
+        # Schema comes from the CQL column types as in the arrow engine, so
+        # the pages do not infer their own types
+        fields, converters = result_fields(result)
+        rows = 0
+
+        with pq.ParquetWriter(file_path, pa.schema(fields)) as writer:
+            for page_df in self._pages(result):
+                page_table = pandas_page_table(page_df, fields, converters)
+
+                if page_table.num_rows:
+                    writer.write_table(page_table)
+                    rows += page_table.num_rows
+
+                # First page is kept even when empty for the column types
+                if tables is not None and (page_table.num_rows
+                                           or not tables):
+                    tables.append(page_table)
+
+        self.logger.debug(f'{rows} rows written into {file_path}')
+
+        return rows
+
+    def _arrow_parquet_result_set(self, session, keyspace, query, file_path,
+                                  fetch_size=5000, parameters=None,
+                                  tables=None):
+        '''Writes the Arrow record batches of the result set into a parquet
+                file. Schema comes from the CQL column types, so an empty
+                result is written with its column types.'''
+        writer = None
+        rows = 0
+
+        try:
+            for page_batch in self.arrow_result_set(
+                    session, keyspace, query, fetch_size, parameters):
+                if writer is None:
+                    writer = pq.ParquetWriter(file_path, page_batch.schema)
+
+                page_table = pa.Table.from_batches([page_batch])
+
+                if page_batch.num_rows:
+                    writer.write_table(page_table)
+                    rows += page_batch.num_rows
+
+                # First page is kept even when empty for the column types
+                if tables is not None and (page_batch.num_rows
+                                           or not tables):
+                    tables.append(page_table)
+        finally:
+            if writer is not None:
+                writer.close()
+
+        self.logger.debug(f'{rows} rows written into {file_path}')
+
+        return rows
+
+    def export_tables(self, session, keyspace, table_queries, data_folder,
+                      max_in_flight=4, fetch_size=5000, token_splits=None):
+        '''Writes several tables into parquet files concurrently.
+                All the tables share the given session, at most max_in_flight
+                queries are run at a time. Every table is written into
+                {data_folder}/{keyspace}_{table}.parquet, tables listed in
+                token_splits are written as parquet dataset directory by
+                token_range_scan. Token ranges of the tables share the
+                max_in_flight budget with the other tables.
+
+            Input arguments:
+                session (obj)        - Cassandra cluster session object
+                keyspace (str)       - keyspace value
+                table_queries (dict) - query to be executed for every table
+                data_folder (str)    - parquet files folder
+                max_in_flight (int)  - no. of queries run at a time
+                                        default value is 4
+                fetch_size (int)     - no. of rows per page
+                                        default value is 5000
+                token_splits (dict)  - no. of token ranges for the tables
+                                        scanned by token_range_scan
+                                        default value is None
+            Output argument:
+                export_df            - rows and seconds taken for every table
+                                        as Pandas dataframe
+        '''
+        token_splits = token_splits or {}
+
+        # Keyspace is set once, so the worker threads do not switch it
+        if session.keyspace != keyspace:
+            session.set_keyspace(keyspace)
+
+        # Every query holds the semaphore, a token range table waits for
+        # its ranges without holding it
+        in_flight = threading.BoundedSemaphore(max_in_flight)
+
+        def export_table(table, query):
+            start_time = time.perf_counter()
+            file_path = f'{data_folder}/{keyspace}_{table}.parquet'
+
+            if table in token_splits:
+                rows = self.token_range_scan(
+                    session, keyspace, table, query, file_path,
+                    token_splits[table], max_in_flight, fetch_size,
+                    in_flight=in_flight)
+            else:
+                # Previous run may have written a token range dataset
+                if os.path.isdir(file_path):
+                    shutil.rmtree(file_path)
+
+                with in_flight:
+                    rows = self.parquet_result_set(
+                        session, keyspace, query, file_path, fetch_size)
+            seconds = round(time.perf_counter() - start_time, 3)
+
+            self.logger.info(f'{table} - {rows} rows in {seconds} seconds')
+
+            return table, rows, seconds
+
+        export_stats = []
+
+        with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+            futures = {executor.submit(export_table, table, query): table
+                       for table, query in table_queries.items()}
+
+            for future, table in futures.items():
+                try:
+                    export_stats.append(future.result())
+                except Exception:
+                    self.logger.exception(f'{table} export is failed')
+                    raise
+
+        export_df = pd.DataFrame(export_stats,
+                                 columns=['table', 'rows', 'seconds'])
+
+        return export_df
+
+    def token_range_scan(self, session, keyspace, table, query,
+                         dataset_path, splits=16, max_in_flight=4,
+                         fetch_size=5000, parameters=None, in_flight=None):
+        '''Writes one table into a parquet dataset directory by splitting the
+                full scan into token range subqueries. Every token range is
+                pulled on a worker thread and written as its own parquet
+                fragment, so the scan is spread over the replicas instead of
+                one coordinator. The directory is read as one table by
+                pd.read_parquet.
+
+            Input arguments:
+                session (obj)       - Cassandra cluster session object
+                keyspace (str)      - keyspace value
+                table (str)         - table name
+                query (str)         - query, Ex. SELECT * FROM table
+                dataset_path (str)  - parquet dataset directory
+                splits (int)        - no. of token ranges
+                                        default value is 16
+                max_in_flight (int) - no. of token ranges pulled at a time
+                                        default value is 4
+                fetch_size (int)    - no. of rows per page
+                                        default value is 5000
+                parameters (tuple)  - values of the placeholders of the
+                                        query, bound before the token range
+                                        default value is None
+                in_flight (obj)     - semaphore of the queries run at a time
+                                        shared with the other tables
+                                        default value is None (max_in_flight
+                                        ranges of this table)
+            Output argument:
+                rows (int)          - no. of rows written
+        '''
+        parameters = tuple(parameters or ())
+        in_flight = in_flight or threading.BoundedSemaphore(max_in_flight)
+        partition_key = ', '.join(
+            column.name for column in
+            session.cluster.metadata.keyspaces[keyspace]
+            .tables[table].partition_key)
+
+        range_query = self.prepare(session, add_condition(
+            query, f'token({partition_key}) > ? '
+            f'AND token({partition_key}) <= ?'))
+
+        # Murmur3 tokens are in (MIN_TOKEN, MAX_TOKEN]
+        bounds = [MIN_TOKEN + (MAX_TOKEN - MIN_TOKEN) * split // splits
+                  for split in range(splits)] + [MAX_TOKEN]
+
+        self.logger.debug(f'{table} token range query - {range_query}')
+
+        # Fragments are written into a temporary directory and swapped in
+        # after all the token ranges are completed
+        temp_path = f'{dataset_path}.tmp'
+        if os.path.exists(temp_path):
+            shutil.rmtree(temp_path)
+        os.makedirs(temp_path)
+
+        def scan_range(split):
+            with in_flight:
+                return self.parquet_result_set(
+                    session, keyspace, range_query,
+                    f'{temp_path}/part-{split:05d}.parquet', fetch_size,
+                    parameters + (bounds[split], bounds[split + 1]))
+
+        with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+            range_rows = list(executor.map(scan_range, range(splits)))
+
+        # Empty token ranges are dropped, so the readers do not open empty
+        # files. Every fragment has the CQL column types, the first one is
+        # kept for the schema when the whole table is empty.
+        for split, rows in enumerate(range_rows):
+            if rows == 0 and (split > 0 or any(range_rows)):
+                os.remove(f'{temp_path}/part-{split:05d}.parquet')
+
+        if os.path.isdir(dataset_path):
+            shutil.rmtree(dataset_path)
+        elif os.path.exists(dataset_path):
+            os.remove(dataset_path)
+        os.rename(temp_path, dataset_path)
+
+        return sum(range_rows)
+
     def cluster_shutdown(self, cluster):
         '''Shut down the cassandra cluster'''
-        if not cluster.is_shutdown:
+        if cluster is not None and not cluster.is_shutdown:
             cluster.shutdown()
             self.logger.info('Cassandra cluster is shutdown')
 
     def __repr__(self):
         return f'''CassandraCluster('{self.ip}', {self.port},
-                                        '{self.user}', '{self.pwd}')'''
+                                        '{self.user}', '{self.pwd}',
+                                        '{self.pull_engine}',
+                                        {self.session_options})'''
@@ -11,6 +11,8 @@ import os
 import sys
 
 import cassandra_connection as cc
+from delta_pull import DeltaPull
+from sorted_snapshot import SortedSnapshot
 
 # Configurations
 c_cfg = configparser.ConfigParser()
@@ -30,6 +32,14 @@ if not os.path.exists(c_cfg.get('FOLDER_DETAILS', 'DATA_FOLDER')):
 logging.config.fileConfig('logging.conf', disable_existing_loggers=False)
 logger = logging.getLogger(__name__)
 
+# Session options which are not set use the default values
+session_options = {
+    option: (c_cfg.getboolean('SESSION_DETAILS', option)
+             if isinstance(default, bool)
+             else type(default)(c_cfg.get('SESSION_DETAILS', option)))
+    for option, default in cc.CassandraCluster.SESSION_OPTIONS.items()
+    if c_cfg.has_option('SESSION_DETAILS', option)}
+
 
 def main():
     '''Makes cassandra connection and pulls all table data in parquet file.'''
@@ -45,45 +55,80 @@ def main():
         c_cfg.get('CASSANDRA_SERVER_DETAILS', 'IP_ADDRESS'),
         c_cfg.getint('CASSANDRA_SERVER_DETAILS', 'PORT'),
         c_cfg.get('CASSANDRA_SERVER_DETAILS', 'USER'),
-        c_cfg.get('CASSANDRA_SERVER_DETAILS', 'PWD'),)
-
-    cluster, session = cas_con.cassandra_session()
-    logger.info('Cassandra connection is established.')
-
-    # Get all tables from the key space
-    all_tables_df = cas_con.pandas_result_set(session, c_cfg.get(
-        'CASSANDRA_SERVER_DETAILS', 'KEY_SPACE'), all_tables_query)
+        c_cfg.get('CASSANDRA_SERVER_DETAILS', 'PWD'),
+        c_cfg.get('PULL_DETAILS', 'PULL_ENGINE', fallback='arrow'),
+        session_options)
 
-    all_tables = all_tables_df['table_name'].tolist()
-    all_tables_df.to_csv(
-        f'''{
-            c_cfg.get('FOLDER_DETAILS', 'DATA_FOLDER')}/{
-                c_cfg.get('CASSANDRA_SERVER_DETAILS', 'KEY_SPACE')
-                }_all_tables.csv''', index=False)
+    # One session for the whole pull, it is shut down at the end
+    with cas_con as session:
+        logger.info('Cassandra connection is established.')
 
-    logger.info('Data pull is processing...')
+        # Get all tables from the key space
+        all_tables_df = cas_con.pandas_result_set(session, c_cfg.get(
+            'CASSANDRA_SERVER_DETAILS', 'KEY_SPACE'), all_tables_query)
 
-    # Write all table data into parquet file
-    for table in all_tables:
-        table_data_query = s_cfg.get('DATA', 'TABLES_DATA_QUERY') + ' ' + table
-        logger.debug(f'table data query - {table_data_query}')
-        table_data_df = cas_con.pandas_result_set(
-            session, c_cfg.get('CASSANDRA_SERVER_DETAILS', 'KEY_SPACE'),
-            table_data_query)
-
-        table_data_df.to_parquet(
+        all_tables = all_tables_df['table_name'].tolist()
+        all_tables_df.to_csv(
             f'''{
                 c_cfg.get('FOLDER_DETAILS', 'DATA_FOLDER')}/{
                     c_cfg.get('CASSANDRA_SERVER_DETAILS', 'KEY_SPACE')
-                    }_{table}.parquet''', index=False)
-
-        # table_data_df.to_csv(
-        #     f'''{
-        #         c_cfg.get('FOLDER_DETAILS', 'DATA_FOLDER')}/{
-        #             c_cfg.get('CASSANDRA_SERVER_DETAILS', 'KEY_SPACE')
-        #             }_{t}.csv''', index=False)
-
-    cas_con.cluster_shutdown(cluster)
+                    }_all_tables.csv''', index=False)
+
+        logger.info('Data pull is processing...')
+
+        # Write all table data into parquet file
+        table_queries = {
+            table: s_cfg.get('DATA', 'TABLES_DATA_QUERY') + ' ' + table
+            for table in all_tables}
+
+        logger.debug(f'table data queries - {table_queries}')
+
+        # Large tables are scanned by token range subqueries
+        token_splits = {
+            table.strip(): c_cfg.getint('PULL_DETAILS', 'TOKEN_RANGE_SPLITS',
+                                        fallback=16)
+            for table in c_cfg.get('PULL_DETAILS', 'TOKEN_RANGE_TABLES',
+                                   fallback='').split(',') if table.strip()}
+
+        # Incremental mode pulls only the rows changed since the last run
+        pull_mode = c_cfg.get('PULL_DETAILS', 'PULL_MODE', fallback='full')
+
+        if pull_mode == 'incremental':
+            export_df = DeltaPull(
+                cas_con, session,
+                c_cfg.get('CASSANDRA_SERVER_DETAILS', 'KEY_SPACE'),
+                c_cfg.get('FOLDER_DETAILS', 'DATA_FOLDER'),
+                delta_splits=c_cfg.getint(
+                    'PULL_DETAILS', 'DELTA_TOKEN_SPLITS',
+                    fallback=16)).pull_tables(
+                    table_queries,
+                    c_cfg.getint('PULL_DETAILS', 'MAX_IN_FLIGHT', fallback=4),
+                    c_cfg.getint('PULL_DETAILS', 'FETCH_SIZE', fallback=5000),
+                    token_splits)
+        else:
+            export_df = cas_con.export_tables(
+                session, c_cfg.get('CASSANDRA_SERVER_DETAILS', 'KEY_SPACE'),
+                table_queries, c_cfg.get('FOLDER_DETAILS', 'DATA_FOLDER'),
+                c_cfg.getint('PULL_DETAILS', 'MAX_IN_FLIGHT', fallback=4),
+                c_cfg.getint('PULL_DETAILS', 'FETCH_SIZE', fallback=5000),
+                token_splits)
+
+        logger.info(f'Data pull summary -\n{export_df.to_string(index=False)}')
+
+        # Snapshots are clustered by emp_id for the merge joins and lookups,
+        # only the snapshots changed by this pull are sorted again
+        if c_cfg.getboolean('PULL_DETAILS', 'SORTED_SNAPSHOT',
+                            fallback=True):
+            SortedSnapshot(
+                row_group_bytes=c_cfg.getint(
+                    'PULL_DETAILS', 'SNAPSHOT_ROW_GROUP_MB',
+                    fallback=16) * 1024 ** 2,
+                compression=c_cfg.get('PULL_DETAILS', 'SNAPSHOT_COMPRESSION',
+                                      fallback='zstd')).rewrite_tables(
+                    [f'{c_cfg.get("FOLDER_DETAILS", "DATA_FOLDER")}/'
+                     f'{c_cfg.get("CASSANDRA_SERVER_DETAILS", "KEY_SPACE")}'
+                     f'_{table}.parquet' for table in table_queries],
+                    c_cfg.getint('PULL_DETAILS', 'MAX_IN_FLIGHT', fallback=4))
 
 
 if __name__ == '__main__':
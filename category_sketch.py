@@ -0,0 +1,213 @@
+'''This module approximates the population ratio of a category column.
+
+class       : CategorySketch
+functions   : update (adds the values of a batch of rows)
+              merge (adds another sketch)
+              estimate (returns the approximate counts of the values)
+              ratio_frame (returns the approximate ratio dataframe)
+              error_report (compares the ratios with the exact ratios)
+              to_frames (returns the sketch as dataframes)
+              from_frames (returns a sketch from to_frames output)
+
+Details:
+    High cardinality category columns (technology_description,
+    certificate_name) are summarized with fixed memory
+        count-min sketch - depth x width counters, the count of a value is
+                           over estimated by at most epsilon * total rows
+                           with probability 1 - delta
+        heavy hitters    - Misra-Gries counters of the most frequent values.
+                           Every value with more than total / (k + 1) rows
+                           is kept, so every value with a ratio of 1% or
+                           more is kept when k >= 100.
+    Ratios are integer percentages, so the values which are not heavy
+    hitters have ratio 0 like in the exact ratio dataframe. Sketches with
+    the same epsilon and delta can be added, so they are built by
+    partitions and runs and merged.
+'''
+
+import logging.config
+import math
+
+import numpy as np
+import pandas as pd
+
+# Initialize log
+logger = logging.getLogger(__name__)
+
+
+class CategorySketch:
+    '''Count-min sketch with Misra-Gries heavy hitters of a category.'''
+
+    # Hash keys of the two hash functions of the count-min rows
+    HASH_KEYS = ('category_sketch1', 'category_sketch2')
+
+    def __init__(self, epsilon=0.001, delta=0.01, heavy_hitters=200):
+        self.logger = logging.getLogger(__name__)
+        self.width = math.ceil(math.e / epsilon)
+        self.depth = math.ceil(math.log(1 / delta))
+        self.heavy_hitters = heavy_hitters
+        self.table = np.zeros((self.depth, self.width), dtype='int64')
+        self.candidates = pd.Series(dtype='int64')
+
+    @property
+    def total(self):
+        '''No. of rows added into the sketch'''
+        return int(self.table[0].sum())
+
+    def _columns(self, values):
+        '''Returns the counter column of every value for every row'''
+        hash1, hash2 = (pd.util.hash_array(values, hash_key=hash_key)
+                        for hash_key in self.HASH_KEYS)
+
+        rows = np.arange(self.depth, dtype='uint64')[:, None]
+
+        return ((hash1[None, :] + rows * (hash2[None, :] | np.uint64(1)))
+                % np.uint64(self.width)).astype('int64')
+
+    def _merge_candidates(self, candidates):
+        '''Merges Misra-Gries counters, only k counters are kept'''
+        candidates = pd.concat([self.candidates, candidates])
+        candidates = candidates.groupby(level=0, sort=False).sum()
+
+        if len(candidates) > self.heavy_hitters:
+            cut = np.partition(candidates.values,
+                               -(self.heavy_hitters + 1))[
+                                   -(self.heavy_hitters + 1)]
+            candidates = candidates[candidates > cut] - cut
+
+        self.candidates = candidates
+
+    def update(self, values):
+        '''Adds the values of a batch of rows, missing values are not
+                                                                    counted
+
+            Input arguments:
+                values (series) - category values
+        '''
+        value_counts = pd.Series(
+            np.asarray(values, dtype='object')).value_counts()
+
+        if value_counts.empty:
+            return
+
+        columns = self._columns(value_counts.index.values)
+
+        for row in range(self.depth):
+            np.add.at(self.table[row], columns[row], value_counts.values)
+
+        self._merge_candidates(value_counts)
+
+    def merge(self, sketch):
+        '''Adds another sketch of the same epsilon and delta
+
+            Input arguments:
+                sketch (CategorySketch) - sketch to be added
+        '''
+        if self.table.shape != sketch.table.shape:
+            raise ValueError(f'Sketch of {sketch.table.shape} counters can '
+                             f'not be merged with {self.table.shape}')
+
+        self.table += sketch.table
+        self._merge_candidates(sketch.candidates)
+
+    def estimate(self, values):
+        '''Returns the approximate count of the values
+
+            Input arguments:
+                values (array) - category values
+            Output argument:
+                counts (array)
+        '''
+        values = np.asarray(values, dtype='object')
+
+        if len(values) == 0:
+            return np.zeros(0, dtype='int64')
+
+        columns = self._columns(values)
+
+        return np.min([self.table[row, columns[row]]
+                       for row in range(self.depth)], axis=0)
+
+    def ratio_frame(self, category_col):
+        '''Returns the approximate ratio of the heavy hitters, same format
+                                        as DataManipulation.counts_ratio
+
+            Input arguments:
+                category_col (str) - category column name
+            Output argument:
+                ratio_df - category and {category_col}_ratio columns
+                                                        (pandas dataframe)
+        '''
+        values = self.candidates.index.values
+        total = self.total
+
+        ratios = (self.estimate(values) / total * 100 if total
+                  else np.zeros(len(values)))
+
+        return pd.DataFrame({category_col: values,
+                             f'{category_col}_ratio': ratios.astype('int')})
+
+    def error_report(self, exact_ratio_df, category_col):
+        '''Compares the approximate ratios with the exact ratios
+
+            Input arguments:
+                exact_ratio_df (dataframe) - output of counts_ratio
+                category_col (str)         - category column name
+            Output argument:
+                error_df - exact, approximate ratio and error of every
+                            category (pandas dataframe)
+        '''
+        ratio_col = f'{category_col}_ratio'
+        exact_df = exact_ratio_df.astype({category_col: 'object'})
+
+        error_df = pd.merge(
+            exact_df, self.ratio_frame(category_col), on=category_col,
+            how='outer', suffixes=('_exact', '_approx')).fillna(0)
+
+        error_df = error_df.astype({f'{ratio_col}_exact': 'int',
+                                    f'{ratio_col}_approx': 'int'})
+        error_df['error'] = (error_df[f'{ratio_col}_approx']
+                             - error_df[f'{ratio_col}_exact'])
+
+        self.logger.info(
+            f'{category_col} sketch - {len(exact_df)} categories, '
+            f'{(error_df["error"] != 0).sum()} ratios differ, max error '
+            f'{error_df["error"].abs().max()}, '
+            f'{self.table.nbytes} counter bytes')
+
+        return error_df
+
+    def to_frames(self):
+        '''Returns the counters and the heavy hitters as dataframes'''
+        return {
+            'table': pd.DataFrame(self.table.T,
+                                  columns=[str(row)
+                                           for row in range(self.depth)]),
+            'candidates': pd.DataFrame({
+                'value': self.candidates.index.values.astype('object'),
+                'count': self.candidates.values}),
+        }
+
+    @classmethod
+    def from_frames(cls, frames, heavy_hitters=200):
+        '''Returns a sketch from to_frames output
+
+            Input arguments:
+                frames (dict)       - output of to_frames
+                heavy_hitters (int) - no. of heavy hitter counters
+            Output argument:
+                sketch (CategorySketch)
+        '''
+        sketch = cls(heavy_hitters=heavy_hitters)
+        sketch.table = np.ascontiguousarray(
+            frames['table'].values.T, dtype='int64')
+        sketch.depth, sketch.width = sketch.table.shape
+        sketch.candidates = pd.Series(
+            frames['candidates']['count'].values.astype('int64'),
+            index=frames['candidates']['value'].values)
+
+        return sketch
+
+    def __repr__(self):
+        return (f'CategorySketch({self.depth} x {self.width}, '
+                f'{self.heavy_hitters} heavy hitters)')
@@ -1,9 +1,17 @@
-'''This module is used for data preparation.'''
+'''This module is used for data preparation.
+
+Details:
+    Functions take pandas dataframes or pyarrow Tables, Tables are prepared
+    with the pyarrow.compute kernels of arrow_backend.
+'''
 
 import logging.config
 from datetime import datetime, timedelta
 
 import numpy as np
+import pyarrow as pa
+
+import arrow_backend as ab
 
 # Initialize log
 logger = logging.getLogger(__name__)
@@ -16,8 +24,13 @@ class DataManipulation:
             certificate_trend
             work_aggregation
             category_ratio
+            category_counts
+            counts_ratio
     '''
 
+    # np.timedelta64(1, 'Y') in nano seconds (365.2425 days)
+    YEAR_NS = 31556952 * 10 ** 9
+
     def __init__(self):
         self.logger = logging.getLogger(__name__)
 
@@ -38,6 +51,10 @@ class DataManipulation:
         '''
         active_datetime = datetime.today() - timedelta(active_days)
         self.logger.debug(f'Active profiles from the date-{active_datetime}')
+
+        if isinstance(dataframe, pa.Table):
+            return ab.rows_since(dataframe, date_col, active_datetime)
+
         active_profile_df = dataframe[dataframe[date_col] >= active_datetime]
 
         return active_profile_df
@@ -61,6 +78,10 @@ class DataManipulation:
         active_datetime = datetime.today() - timedelta(active_days)
         self.logger.debug(
             f'Certificate trends from the date - {active_datetime}')
+
+        if isinstance(certificate_df, pa.Table):
+            return ab.rows_since(certificate_df, compl_col, active_datetime)
+
         cert_trend_df = certificate_df[certificate_df[compl_col]
                                        >= active_datetime]
 
@@ -84,22 +105,26 @@ class DataManipulation:
                 work_agg_df : dataframe of work aggregated value
                                             (pandas dataframe)
         '''
+        if isinstance(dataframe, pa.Table):
+            return ab.work_aggregation(dataframe, work_start_date,
+                                       work_end_date, emp_type_col,
+                                       self.YEAR_NS)
 
-        dataframe.loc[:, 'exp_date_diff'] = (
+        # Derived columns are kept in a new dataframe, input is not modified
+        exp_df = dataframe[['emp_id', 'work_exp_id', 'domain']].copy()
+
+        exp_df.loc[:, 'exp_date_diff'] = (
             dataframe[work_end_date].values
             - dataframe[work_start_date].values)
 
-        dataframe.loc[:, 'exp_days'] = (dataframe['exp_date_diff']
-                                        // np.timedelta64(1, 'D'))
-
-        dataframe.loc[:, 'exp_years'] = (dataframe['exp_date_diff']
-                                         // np.timedelta64(1, 'Y'))
+        exp_df.loc[:, 'exp_years'] = (exp_df['exp_date_diff']
+                                      // np.timedelta64(1, 'Y'))
 
-        dataframe.loc[:, 'contract_2y'] = ~(
+        exp_df.loc[:, 'contract_2y'] = ~(
             (dataframe[emp_type_col] == 'Contracting')
-            & (dataframe['exp_years'] <= 2))
+            & (exp_df['exp_years'] <= 2))
 
-        work_agg_df = (dataframe.groupby('emp_id').agg(
+        work_agg_df = (exp_df.groupby('emp_id').agg(
             total_exp=('exp_years', 'sum'),
             total_switch=('work_exp_id', 'count'),
             switch_rel=('contract_2y', 'sum'),
@@ -117,12 +142,52 @@ class DataManipulation:
                 category_ratio_df : dataframe of a categorical value ratio
                                                     (pandas dataframe)
         '''
+        category_ratio_df = self.counts_ratio(
+            self.category_counts(dataframe, [category_col]), category_col)
+
+        return category_ratio_df
+
+    def category_counts(self, dataframe, category_cols):
+        '''Count rows of every category, returns the count dataframe.
+                Count dataframes can be added and subtracted, so they are
+                kept between the runs instead of the ratio.
+            Inputs:
+                dataframe       : dataframe of a table (pandas dataframe)
+                category_cols   : category column names (list)
+            Output:
+                category_count_df : dataframe of category_cols and count
+                                                    (pandas dataframe)
+        '''
+        if isinstance(dataframe, pa.Table):
+            return ab.category_counts(dataframe, category_cols)
+
+        # Only the observed categories of the categorical columns are counted
+        category_count_df = (dataframe.groupby(category_cols, observed=True)
+                             .size().rename('count').reset_index())
+
+        return category_count_df
+
+    def counts_ratio(self, category_count_df, category_col):
+        '''Calculate category ratio from the category counts,
+                                        returns the ratio dataframe
+            Inputs:
+                category_count_df : dataframe of category and count
+                                                    (pandas dataframe)
+                category_col      : category column name (str)
+            Output:
+                category_ratio_df : dataframe of a categorical value ratio
+                                                    (pandas dataframe)
+        '''
+        if isinstance(category_count_df, pa.Table):
+            return ab.counts_ratio(category_count_df, category_col)
+
+        counts = (category_count_df.groupby(category_col, observed=True)
+                  ['count'].sum().sort_values(ascending=False))
+
         category_ratio_df = (
-            (dataframe[category_col].value_counts(normalize=True) * 100)
+            (counts / counts.sum() * 100)
             .astype('int')
-            .to_frame()
-            .reset_index()
-            .rename(columns={'index': category_col,
-                             category_col: f'{category_col}_ratio'}))
+            .rename(f'{category_col}_ratio')
+            .reset_index())
 
         return category_ratio_df
@@ -0,0 +1,351 @@
+'''This module is used to pull only the changed rows of the tables.
+
+class       : DeltaPull
+functions   : load_watermarks (returns the last pulled updated_time values)
+              save_watermarks (writes the updated_time values)
+              pull_table (pulls changed rows and upserts them into parquet)
+              pull_tables (pulls several tables concurrently)
+
+Details:
+    Every table keeps a high-water mark of the updated_time column.
+    A run pulls only the rows updated since the last successful run and
+    upserts them by primary key into the existing parquet snapshot.
+    Tables without the updated_time column or without a snapshot are
+    pulled in full.
+    updated_time is a regular column, so the replicas read every row of
+    the table to filter the changed rows (ALLOW FILTERING), only the
+    changed rows are sent back. The delta query is split into token
+    ranges, every subquery filters one token range on its replicas
+    instead of one coordinator scanning the whole ring. Tables with an
+    index on updated_time are pulled by one query served by the index.
+    Upsert keeps the rows as Arrow tables with the schema of the snapshot
+    and rewrites only the snapshot files holding an upserted key.
+    Deleted rows are not removed from the snapshot, a full pull is
+    needed for that.
+'''
+
+import json
+import logging.config
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from datetime import datetime
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from cassandra_connection import add_condition
+
+# Initialize log
+logger = logging.getLogger(__name__)
+
+
+class DeltaPull:
+    '''Incremental pull of the tables based on the updated_time watermark.'''
+
+    def __init__(self, cas_con, session, keyspace, data_folder,
+                 watermark_col='updated_time', delta_splits=16):
+        self.logger = logging.getLogger(__name__)
+        self.cas_con = cas_con
+        self.session = session
+        self.keyspace = keyspace
+        self.data_folder = data_folder
+        self.watermark_col = watermark_col
+        self.delta_splits = delta_splits
+        self.watermark_file = f'{data_folder}/{keyspace}_watermarks.json'
+        self.watermarks = self.load_watermarks()
+        self.lock = threading.Lock()
+        self.logger.debug(self)
+
+    def load_watermarks(self):
+        '''Returns the last pulled updated_time value of every table
+
+            Output argument:
+                watermarks (dict) - updated_time value for every table
+        '''
+        if not os.path.exists(self.watermark_file):
+            return {}
+
+        with open(self.watermark_file) as f:
+            watermarks = {table: datetime.fromisoformat(value)
+                          for table, value in json.load(f).items()}
+
+        self.logger.debug(f'Watermarks - {watermarks}')
+
+        return watermarks
+
+    def save_watermarks(self):
+        '''Writes the updated_time value of every table'''
+        temp_file = f'{self.watermark_file}.tmp'
+
+        with open(temp_file, 'w') as f:
+            json.dump({table: value.isoformat()
+                       for table, value in self.watermarks.items()},
+                      f, indent=4)
+
+        os.replace(temp_file, self.watermark_file)
+
+    def pull_table(self, table, query, fetch_size=5000, token_splits=None,
+                   in_flight=None):
+        '''Pulls the changed rows of a table and upserts them into
+                {data_folder}/{keyspace}_{table}.parquet
+
+            Input arguments:
+                table (str)        - table name
+                query (str)        - query, Ex. SELECT * FROM table
+                fetch_size (int)   - no. of rows per page
+                                        default value is 5000
+                token_splits (int) - no. of token ranges for the full and
+                                        the delta pull
+                                        default value is None (full pull is
+                                        not split, delta pull is split into
+                                        delta_splits ranges)
+                in_flight (obj)    - semaphore of the queries run at a time
+                                        default value is None (the ranges
+                                        of token_range_scan are limited by
+                                        its own default)
+            Output argument:
+                rows (int)         - no. of rows pulled
+        '''
+        file_path = f'{self.data_folder}/{self.keyspace}_{table}.parquet'
+        table_meta = self.session.cluster.metadata.keyspaces[
+            self.keyspace].tables[table]
+
+        has_watermark = self.watermark_col in table_meta.columns
+        watermark = self.watermarks.get(table)
+
+        if not has_watermark or watermark is None or not os.path.exists(
+                file_path):
+            self.logger.debug(f'{table} is pulled in full')
+
+            if token_splits:
+                rows = self.cas_con.token_range_scan(
+                    self.session, self.keyspace, table, query, file_path,
+                    token_splits, fetch_size=fetch_size, in_flight=in_flight)
+            else:
+                if os.path.isdir(file_path):
+                    shutil.rmtree(file_path)
+
+                with in_flight or nullcontext():
+                    rows = self.cas_con.parquet_result_set(
+                        self.session, self.keyspace, query, file_path,
+                        fetch_size)
+
+            if not has_watermark:
+                return rows
+
+            changed_table = pq.read_table(file_path,
+                                          columns=[self.watermark_col])
+        else:
+            # Rows updated at the watermark itself are pulled again, the
+            # upsert replaces them
+            delta_query = add_condition(
+                query, f'{self.watermark_col} >= ?', allow_filtering=True)
+            delta_path = f'{file_path}.delta'
+            splits = token_splits or self.delta_splits
+
+            # Without an index the replicas filter every row, the token
+            # range subqueries spread the filtering over the replicas
+            if self._indexed(table_meta) or not splits:
+                with in_flight or nullcontext():
+                    rows = self.cas_con.parquet_result_set(
+                        self.session, self.keyspace,
+                        self.cas_con.prepare(self.session, delta_query),
+                        delta_path, fetch_size, (watermark,))
+            else:
+                rows = self.cas_con.token_range_scan(
+                    self.session, self.keyspace, table, delta_query,
+                    delta_path, splits, fetch_size=fetch_size,
+                    parameters=(watermark,), in_flight=in_flight)
+
+            changed_table = self.upsert_snapshot(
+                file_path, delta_path,
+                [column.name for column in table_meta.primary_key])
+
+            if os.path.isdir(delta_path):
+                shutil.rmtree(delta_path)
+            else:
+                os.remove(delta_path)
+
+        new_watermark = pc.max(changed_table.column(
+            self.watermark_col)).as_py()
+
+        if new_watermark is not None:
+            new_watermark = pd.Timestamp(new_watermark).to_pydatetime()
+
+            with self.lock:
+                if watermark is None or new_watermark > watermark:
+                    self.watermarks[table] = new_watermark
+
+        return rows
+
+    def _indexed(self, table_meta):
+        '''Returns True when the watermark column has a secondary index'''
+        return any(index.index_options.get('target') == self.watermark_col
+                   for index in table_meta.indexes.values())
+
+    @staticmethod
+    def _upserted(table, primary_key, delta_keys):
+        '''Returns the mask of the rows of a table whose primary key is
+                                                            upserted'''
+        keys = pd.MultiIndex.from_frame(
+            table.select(primary_key).to_pandas())
+
+        return keys.isin(delta_keys)
+
+    @staticmethod
+    def _write_table(table, file_path):
+        '''Writes a parquet file, it replaces the file only after it is
+                                                                written'''
+        pq.write_table(table, f'{file_path}.tmp')
+        os.replace(f'{file_path}.tmp', file_path)
+
+    def upsert_snapshot(self, file_path, delta_path, primary_key):
+        '''Upserts the delta rows into the parquet snapshot by primary key.
+                Delta rows are cast to the schema of the snapshot, so the
+                nullable integer columns stay integer. Only the snapshot
+                files holding an upserted key are rewritten, the delta rows
+                are written as a new fragment of a dataset directory or
+                appended to a single file snapshot.
+
+            Input arguments:
+                file_path (str)    - parquet snapshot file or dataset
+                                        directory
+                delta_path (str)   - parquet file or dataset directory of
+                                        the changed rows
+                primary_key (list) - primary key columns
+            Output argument:
+                delta_table        - upserted rows (Arrow table)
+        '''
+        delta_table = pq.read_table(delta_path)
+
+        if delta_table.num_rows == 0:
+            return delta_table
+
+        if os.path.isdir(file_path):
+            fragment_paths = sorted(
+                f'{file_path}/{file_name}'
+                for file_name in os.listdir(file_path)
+                if file_name.endswith('.parquet'))
+        else:
+            fragment_paths = [file_path]
+
+        schema = pq.read_schema(fragment_paths[0])
+        delta_table = delta_table.select(schema.names).cast(schema)
+
+        # Last row of a primary key is kept
+        delta_keys = delta_table.select(primary_key).to_pandas()
+        latest = ~delta_keys.duplicated(subset=primary_key, keep='last')
+        delta_table = delta_table.filter(pa.array(latest.values))
+        delta_keys = pd.MultiIndex.from_frame(delta_keys[latest])
+
+        if not os.path.isdir(file_path):
+            snapshot_table = pq.read_table(file_path)
+            snapshot_table = snapshot_table.filter(pa.array(~self._upserted(
+                snapshot_table, primary_key, delta_keys)))
+
+            self._write_table(pa.concat_tables(
+                [snapshot_table, delta_table]), file_path)
+        else:
+            rewritten = 0
+
+            for fragment_path in fragment_paths:
+                # Primary key columns are read to find the upserted rows
+                upserted = self._upserted(
+                    pq.read_table(fragment_path, columns=primary_key),
+                    primary_key, delta_keys)
+
+                if not upserted.any():
+                    continue
+
+                fragment_table = pq.read_table(fragment_path).filter(
+                    pa.array(~upserted))
+
+                if fragment_table.num_rows:
+                    self._write_table(fragment_table, fragment_path)
+                else:
+                    os.remove(fragment_path)
+                rewritten += 1
+
+            deltas = [int(file_name[len('delta-'):-len('.parquet')])
+                      for file_name in os.listdir(file_path)
+                      if file_name.startswith('delta-')
+                      and file_name.endswith('.parquet')]
+            self._write_table(
+                delta_table,
+                f'{file_path}/delta-{max(deltas, default=-1) + 1:05d}'
+                f'.parquet')
+
+            self.logger.debug(f'{rewritten} of {len(fragment_paths)} '
+                              f'fragments of {file_path} rewritten')
+
+        self.logger.debug(f'{delta_table.num_rows} rows upserted into '
+                          f'{file_path}')
+
+        return delta_table
+
+    def pull_tables(self, table_queries, max_in_flight=4, fetch_size=5000,
+                    token_splits=None):
+        '''Pulls the changed rows of several tables concurrently and
+                saves the watermarks of the successful tables.
+
+            Input arguments:
+                table_queries (dict) - query for every table
+                max_in_flight (int)  - no. of queries run at a time, the
+                                        token ranges of the tables share it
+                                        default value is 4
+                fetch_size (int)     - no. of rows per page
+                                        default value is 5000
+                token_splits (dict)  - no. of token ranges for the tables
+                                        pulled in full by token_range_scan
+                                        default value is None
+            Output argument:
+                pull_df              - rows and seconds taken for every table
+                                        as Pandas dataframe
+        '''
+        token_splits = token_splits or {}
+
+        if self.session.keyspace != self.keyspace:
+            self.session.set_keyspace(self.keyspace)
+
+        in_flight = threading.BoundedSemaphore(max_in_flight)
+
+        def pull(table, query):
+            start_time = time.perf_counter()
+            rows = self.pull_table(table, query, fetch_size,
+                                   token_splits.get(table), in_flight)
+            seconds = round(time.perf_counter() - start_time, 3)
+
+            self.logger.info(f'{table} - {rows} rows in {seconds} seconds')
+
+            return table, rows, seconds
+
+        pull_stats = []
+
+        try:
+            with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+                futures = {executor.submit(pull, table, query): table
+                           for table, query in table_queries.items()}
+
+                for future, table in futures.items():
+                    try:
+                        pull_stats.append(future.result())
+                    except Exception:
+                        self.logger.exception(f'{table} pull is failed')
+                        raise
+        finally:
+            self.save_watermarks()
+
+        pull_df = pd.DataFrame(pull_stats,
+                               columns=['table', 'rows', 'seconds'])
+
+        return pull_df
+
+    def __repr__(self):
+        return f'''DeltaPull('{self.keyspace}', '{self.data_folder}',
+                                        '{self.watermark_col}')'''
@@ -2,17 +2,29 @@
 
 '''
 
+import asyncio
 import configparser
 import json
 import logging.config
 import os
+from datetime import date
 
 import pandas as pd
+import pyarrow as pa
 
 import cassandra_connection as cc
-from data_manipulation import DataManipulation
-from market_score_calculator import MarketScoreCalculator
-from personal_score_calculator import PersonalScoreCalculator
+from delta_pull import DeltaPull
+from interview_score_state import InterviewScoreState
+from parquet_loader import ParquetLoader
+from partitioned_scoring import PartitionedScorer
+from pipelined_scoring import PipelinedScorer
+from population_statistics import PopulationStatistics
+from pull_planner import PullPlanner
+from score_pipeline import ScorePipeline
+from score_store import ScoreStore
+from sorted_snapshot import SortedSnapshot
+from stage_cache import StageCache
+from stage_metrics import StageMetrics
 
 # Configurations
 c_cfg = configparser.ConfigParser()
@@ -35,212 +47,438 @@ logger = logging.getLogger(__name__)
 
 logger.info('Started.')
 
+# Wall time, cpu time, rows and peak memory of the stages
+metrics = StageMetrics(
+    c_cfg.get('METRICS_DETAILS', 'METRICS_FOLDER', fallback='metrics'),
+    c_cfg.getboolean('METRICS_DETAILS', 'METRICS_ENABLED', fallback=True),
+    c_cfg.getboolean('METRICS_DETAILS', 'TRACE_MEMORY', fallback=False),
+    [stage.strip() for stage in c_cfg.get(
+        'METRICS_DETAILS', 'PROFILE_STAGES', fallback='').split(',')
+     if stage.strip()],
+    c_cfg.getint('METRICS_DETAILS', 'PROFILE_INTERVAL_MS',
+                 fallback=10) / 1000)
+
 # Read SQL details
 with open('sql_config.json') as f:
     sql_details = json.load(f)
 
 logger.debug(f'SQL details - {json.dumps(sql_details, indent=2)}')
 
+with open('data_file_meta_data.json') as f:
+    data_file_details = json.load(f)
+
+logger.debug(
+    f'Data file meta data - {json.dumps(data_file_details, indent=4)}')
+
+# Session options which are not set use the default values
+session_options = {
+    option: (c_cfg.getboolean('SESSION_DETAILS', option)
+             if isinstance(default, bool)
+             else type(default)(c_cfg.get('SESSION_DETAILS', option)))
+    for option, default in cc.CassandraCluster.SESSION_OPTIONS.items()
+    if c_cfg.has_option('SESSION_DETAILS', option)}
+
 # Cassandra connection
 cas_con = cc.CassandraCluster(
     c_cfg.get('CASSANDRA_SERVER_DETAILS', 'IP_ADDRESS'),
     c_cfg.getint('CASSANDRA_SERVER_DETAILS', 'PORT'),
     c_cfg.get('CASSANDRA_SERVER_DETAILS', 'USER'),
-    c_cfg.get('CASSANDRA_SERVER_DETAILS', 'PWD'),)
+    c_cfg.get('CASSANDRA_SERVER_DETAILS', 'PWD'),
+    c_cfg.get('PULL_DETAILS', 'PULL_ENGINE', fallback='arrow'),
+    session_options)
 
 cluster, session = cas_con.cassandra_session()
+metrics.instrument(cas_con, methods=['export_tables'])
 
 logger.info('Cassandra connection is established.')
 logger.info('Data pull is processing...')
 
-# Write all table data into parquet file
-if sql_details.get('TABLES_LIST') is not None:
-    for table in sql_details.get('TABLES_LIST'):
-        table_data_query = f'SELECT * FROM {table}'
-
-        logger.debug(f'Table data query - {table_data_query}')
-
-        table_data_df = cas_con.pandas_result_set(
-            session, c_cfg.get('CASSANDRA_SERVER_DETAILS', 'KEY_SPACE'),
-            table_data_query)
-
-        table_data_df.to_parquet(
-            f'''{c_cfg.get('FOLDER_DETAILS', 'DATA_FOLDER')}/{
-                c_cfg.get('CASSANDRA_SERVER_DETAILS', 'KEY_SPACE')}_{
-                    table}.parquet''', index=False)
-
-cas_con.cluster_shutdown(cluster)
-
-with open('data_file_meta_data.json') as f:
-    data_file_details = json.load(f)
-
-logger.debug(
-    f'Data file meta data - {json.dumps(data_file_details, indent=4)}')
-
-dm = DataManipulation()
-msc = MarketScoreCalculator()
-psc = PersonalScoreCalculator()
-
-personal_info_df = pd.read_parquet(
-    f'''data/{data_file_details['personal_info']['file_name']}''',
-    columns=data_file_details['personal_info']['rel_cols'])
-
-score_eligible_prof_df = personal_info_df[
-    personal_info_df.recalculate_score_eligible == 'Y']
-
-logger.info(f'Score eligible profiles - {score_eligible_prof_df.shape[0]}')
-
-work_df = pd.read_parquet(
-    f'''data/{data_file_details['work_info']['file_name']}''',
-    columns=data_file_details['work_info']['rel_cols'])
-
-technology_stack_df = pd.read_parquet(
-    f'''data/{data_file_details['employee_technology_stack']['file_name']}''',
-    columns=data_file_details['employee_technology_stack']['rel_cols'])
-
-certificate_df = pd.read_parquet(
-    f'''data/{data_file_details['certificate_info']['file_name']}''',
-    columns=data_file_details['certificate_info']['rel_cols'])
-
-education_df = pd.read_parquet(
-    f'''data/{data_file_details['education_info']['file_name']}''')
-
-interview_schedule_df = pd.read_parquet(
-    f'''data/{data_file_details['interview_schedule']['file_name']}''',
-    columns=data_file_details['interview_schedule']['rel_cols'])
-
-# Merging person and work
-eligible_person_work_df = pd.merge(score_eligible_prof_df, work_df,
-                                   on='emp_id', suffixes=('_person', '_work'))
-
-# Population person_work_df. No population time limit filter for exp score
-population_person_work_df = pd.merge(personal_info_df, work_df,
-                                     on='emp_id', suffixes=('_person', '_work'))
-
-logger.info('Market score calculation is started...')
-
-
-logger.debug('Toal experience with population score is processing...')
+# Incremental mode pulls only the rows changed since the last run
+pull_mode = c_cfg.get('PULL_DETAILS', 'PULL_MODE', fallback='full')
 
-eligible_person_work_agg_df = dm.work_aggregation(eligible_person_work_df)
-population_person_work_agg_df = dm.work_aggregation(population_person_work_df)
+# Pipelined mode scores the tables while the other tables are pulled
+pipelined = (c_cfg.getboolean('PULL_DETAILS', 'PIPELINED', fallback=False)
+             and sql_details.get('TABLES_LIST') is not None
+             and pull_mode == 'full'
+             and c_cfg.get('SCORE_DETAILS', 'SCORE_MODE',
+                           fallback='full') == 'full')
 
-exp_ratio_df = dm.category_ratio(population_person_work_agg_df, 'total_exp')
+# Snapshots are clustered by emp_id for the merge joins and lookups
+snapshot = None
 
-tot_exp_score_df = msc.total_exp_with_population(
-    eligible_person_work_agg_df, exp_ratio_df, 'total_exp')
+if c_cfg.getboolean('PULL_DETAILS', 'SORTED_SNAPSHOT', fallback=True):
+    snapshot = metrics.instrument(SortedSnapshot(
+        row_group_bytes=c_cfg.getint(
+            'PULL_DETAILS', 'SNAPSHOT_ROW_GROUP_MB', fallback=16) * 1024 ** 2,
+        compression=c_cfg.get('PULL_DETAILS', 'SNAPSHOT_COMPRESSION',
+                              fallback='zstd')),
+        methods=['rewrite', 'rewrite_tables'])
 
-logger.debug('Toal experience with population score is completed.')
-
-logger.debug('Domain with population score is processing...')
-
-# Population domain. No population time limit filter for domain score
-population_person_domain_df = pd.merge(personal_info_df, work_df,
-                                       on='emp_id',
-                                       suffixes=('_person', '_work'))
-
-population_domain_df = population_person_domain_df[[
-    'emp_id', 'domain']].drop_duplicates()
-
-domain_ratio_df = dm.category_ratio(population_domain_df, 'domain')
-
-eligible_person_domain_df = eligible_person_work_df[[
-    'emp_id', 'domain']].drop_duplicates()
-
-domain_score_df = msc.domain_with_population(
-    eligible_person_domain_df, domain_ratio_df, 'domain')
-
-logger.debug('Domain with population score is completed.')
-
-logger.debug('Skill set with population score is processing...')
-
-# Population Skillset. No population time limit filter for Skillset score
-population_person_skillset_df = pd.merge(personal_info_df, technology_stack_df,
-                                         on='emp_id',
-                                         suffixes=('_person', '_tech'))
-
-# Merging person and technology
-eligible_person_tech_df = pd.merge(score_eligible_prof_df, technology_stack_df,
-                                   on='emp_id', suffixes=('_person', '_tech'))
-
-
-population_skill_set_df = population_person_skillset_df[[
-    'emp_id', 'technology_description']].drop_duplicates()
-
-skill_set_ratio_df = dm.category_ratio(population_skill_set_df,
-                                       'technology_description')
-
-eligible_person_tech_df = eligible_person_tech_df[[
-    'emp_id', 'technology_description']].drop_duplicates()
-
-
-skill_set_score_df = msc.skill_set_with_population(
-    eligible_person_tech_df, skill_set_ratio_df, 'technology_description')
-
-logger.debug('Skillset with population score is completed.')
-
-logger.debug('Certificate trend score is processing...')
-
-# Population certificate trend.
-# Last 2 years completed certificates are considered as trend
-cert_trend_df = dm.certificate_trend(certificate_df, active_days=730)
-
-cert_trend_ratio_df = dm.category_ratio(cert_trend_df, 'certificate_name')
-
-eligible_person_cert_df = pd.merge(score_eligible_prof_df, certificate_df,
-                                   on='emp_id', suffixes=('_person', '_cert'))
-
-cert_trend_score_df = msc.certificate_with_trend(
-    eligible_person_cert_df, cert_trend_ratio_df)
-
-logger.debug('Certificate trend score is completed.')
-
-tot_exp_score_df.to_csv(
-    'score/MS_Total_Experience_With_Population_Score.csv', index=False)
-domain_score_df.to_csv(
-    'score/MS_Domain_With_Population_Score.csv', index=False)
-skill_set_score_df.to_csv(
-    'score/MS_Skillset_With_Population_Score.csv', index=False)
-cert_trend_score_df.to_csv(
-    'score/MS_Certificate_Trend_Score.csv', index=False)
-
-logger.info('Market score calculation is completed...')
-logger.info('Personal score calculation is started...')
-
-
-eligible_person_edu_df = pd.merge(score_eligible_prof_df, education_df,
-                                  on='emp_id', suffixes=('_person', '_edu'))
-
-
-eligible_person_int_df = pd.merge(score_eligible_prof_df, interview_schedule_df,
-                                  on='emp_id', suffixes=('_person', '_int'))
-
-logger.debug('Education score is processing...')
-education_score_df = psc.education_score(eligible_person_edu_df)
-logger.debug('Education score is completed...')
-logger.debug('Valid certificate score is processing...')
-valid_cert_score_df = psc.valid_certificate_score(eligible_person_cert_df)
-logger.debug('Valid certificate score is completed...')
-logger.debug('Domain score is processing...')
-domain_score_df = psc.domain_score(eligible_person_work_agg_df)
-logger.debug('Domain score is completed...')
-logger.debug('Reliablity score is processing...')
-reliablity_score_df = psc.reliablity_score(eligible_person_work_agg_df)
-logger.debug('Reliablity score is completed...')
-logger.debug('Skill set score is processing...')
-skill_set_score_df = psc.skill_set_score(eligible_person_tech_df)
-logger.debug('Skil set score is completed...')
-logger.debug('Interview score is processing...')
-interview_score_df = psc.interview_score(eligible_person_int_df)
-logger.debug('Interview score is completed...')
-
-education_score_df.to_csv('score/PS_Education_Score.csv', index=False)
-valid_cert_score_df.to_csv('score/PS_Certificate_Score.csv', index=False)
-domain_score_df.to_csv('score/PS_Domain_Score.csv', index=False)
-reliablity_score_df.to_csv('score/PS_Reliability_Score.csv', index=False)
-skill_set_score_df.to_csv('score/PS_Skill_Set_Score.csv', index=False)
-interview_score_df.to_csv('score/PS_Interview_Score.csv', index=False)
-
-logger.info('Personal score calculation is completed...')
+# Write all table data into parquet file
+if sql_details.get('TABLES_LIST') is not None:
+    # Only the tables and columns of the data files are pulled
+    if c_cfg.getboolean('PULL_DETAILS', 'PROJECTED_PULL', fallback=True):
+        table_queries = PullPlanner(
+            data_file_details,
+            c_cfg.getboolean('PULL_DETAILS', 'ALLOW_FILTERING',
+                             fallback=True)).table_queries(
+                cluster.metadata.keyspaces[
+                    c_cfg.get('CASSANDRA_SERVER_DETAILS', 'KEY_SPACE')],
+                sql_details.get('TABLES_LIST'))
+    else:
+        table_queries = {table: f'SELECT * FROM {table}'
+                         for table in sql_details.get('TABLES_LIST')}
+
+    logger.debug(f'Table data queries - {table_queries}')
+
+    # Large tables are scanned by token range subqueries
+    token_splits = {
+        table.strip(): c_cfg.getint('PULL_DETAILS', 'TOKEN_RANGE_SPLITS',
+                                    fallback=16)
+        for table in c_cfg.get('PULL_DETAILS', 'TOKEN_RANGE_TABLES',
+                               fallback='').split(',') if table.strip()}
+
+    if pipelined:
+        logger.info('Tables are pulled by the pipelined score calculation.')
+    elif pull_mode == 'incremental':
+        export_df = metrics.instrument(DeltaPull(
+            cas_con, session,
+            c_cfg.get('CASSANDRA_SERVER_DETAILS', 'KEY_SPACE'),
+            c_cfg.get('FOLDER_DETAILS', 'DATA_FOLDER'),
+            delta_splits=c_cfg.getint('PULL_DETAILS', 'DELTA_TOKEN_SPLITS',
+                                      fallback=16)),
+            methods=['pull_tables']).pull_tables(
+                table_queries,
+                c_cfg.getint('PULL_DETAILS', 'MAX_IN_FLIGHT', fallback=4),
+                c_cfg.getint('PULL_DETAILS', 'FETCH_SIZE', fallback=5000),
+                token_splits)
+    else:
+        export_df = cas_con.export_tables(
+            session, c_cfg.get('CASSANDRA_SERVER_DETAILS', 'KEY_SPACE'),
+            table_queries, c_cfg.get('FOLDER_DETAILS', 'DATA_FOLDER'),
+            c_cfg.getint('PULL_DETAILS', 'MAX_IN_FLIGHT', fallback=4),
+            c_cfg.getint('PULL_DETAILS', 'FETCH_SIZE', fallback=5000),
+            token_splits)
+
+    if not pipelined:
+        logger.info(
+            f'Data pull summary -\n{export_df.to_string(index=False)}')
+
+        # Only the snapshots changed by this pull are sorted again
+        if snapshot is not None:
+            snapshot.rewrite_tables(
+                [f'{c_cfg.get("FOLDER_DETAILS", "DATA_FOLDER")}/'
+                 f'{c_cfg.get("CASSANDRA_SERVER_DETAILS", "KEY_SPACE")}_'
+                 f'{table}.parquet' for table in table_queries],
+                c_cfg.getint('PULL_DETAILS', 'MAX_IN_FLIGHT', fallback=4))
+
+# Pipelined mode keeps the session until the tables are pulled
+if not pipelined:
+    cas_con.cluster_shutdown(cluster)
+
+# Interview score state keeps the running interview scores between the runs
+interview_state = None
+
+if c_cfg.getboolean('SCORE_DETAILS', 'INTERVIEW_SCORE_STATE',
+                    fallback=False):
+    interview_state = InterviewScoreState(
+        c_cfg.get('SCORE_DETAILS', 'STATE_FOLDER', fallback='state'),
+        partitions=c_cfg.getint('SCORE_DETAILS', 'STATE_PARTITIONS',
+                                fallback=16))
+
+    if interview_state.exists():
+        interview_state.load()
+
+sp = ScorePipeline(c_cfg.get('SCORE_DETAILS', 'PERSONAL_SCORE_ENGINE',
+                             fallback='pandas'), interview_state,
+                   c_cfg.getboolean('SCORE_DETAILS', 'LEAN_SCORES',
+                                    fallback=False),
+                   c_cfg.get('SCORE_DETAILS', 'SCORE_BACKEND',
+                             fallback='pandas'))
+# High cardinality categories can be approximated with fixed memory sketches
+approximate_categories = [
+    category.strip() for category in c_cfg.get(
+        'SCORE_DETAILS', 'APPROXIMATE_CATEGORIES', fallback='').split(',')
+    if category.strip()]
+sketch_params = {
+    'epsilon': c_cfg.getfloat('SCORE_DETAILS', 'SKETCH_EPSILON',
+                              fallback=0.001),
+    'delta': c_cfg.getfloat('SCORE_DETAILS', 'SKETCH_DELTA', fallback=0.01),
+    'heavy_hitters': c_cfg.getint('SCORE_DETAILS', 'SKETCH_HEAVY_HITTERS',
+                                  fallback=200),
+}
+
+stats = PopulationStatistics(
+    c_cfg.get('SCORE_DETAILS', 'STATS_FOLDER', fallback='stats'),
+    approximate_categories, sketch_params, cert_active_days=730,
+    partitions=c_cfg.getint('SCORE_DETAILS', 'STATS_PARTITIONS',
+                            fallback=16))
+
+# Incremental mode rescores only the score eligible profiles and updates
+# the population statistics of the previous runs with them
+score_mode = c_cfg.get('SCORE_DETAILS', 'SCORE_MODE', fallback='full')
+incremental = score_mode == 'incremental'
+
+# Arrow backend reads the data files as Arrow tables in the full and
+# incremental modes, the other modes read dataframes
+arrow = sp.backend == 'arrow'
+
+if arrow and (pipelined or score_mode == 'partitioned'):
+    logger.warning(f'Arrow backend is not used by the '
+                   f'{"pipelined" if pipelined else score_mode} mode')
+
+if incremental and not stats.exists():
+    logger.info('No population statistics found, full score calculation.')
+    incremental = False
+
+cache = StageCache(
+    c_cfg.get('SCORE_DETAILS', 'CACHE_FOLDER', fallback='cache'),
+    c_cfg.getint('SCORE_DETAILS', 'CACHE_SIZE_MB', fallback=2048) * 1024 ** 2,
+    c_cfg.get('SCORE_DETAILS', 'CACHE_FINGERPRINT', fallback='mtime'),
+    c_cfg.getboolean('SCORE_DETAILS', 'CACHE_ENABLED', fallback=True))
+
+loader = ParquetLoader(
+    data_file_details, c_cfg.get('FOLDER_DETAILS', 'DATA_FOLDER'),
+    c_cfg.getboolean('SCORE_DETAILS', 'MEMORY_MAP', fallback=True),
+    c_cfg.getint('SCORE_DETAILS', 'LOAD_WORKERS', fallback=4))
+
+score_folder = c_cfg.get('FOLDER_DETAILS', 'SCORE_FOLDER')
+
+score_store = ScoreStore(
+    score_folder,
+    c_cfg.getint('SCORE_DETAILS', 'SCORE_STORE_PARTITIONS', fallback=16),
+    c_cfg.get('SCORE_DETAILS', 'SCORE_STORE_COMPRESSION', fallback='zstd'),
+    c_cfg.getint('SCORE_DETAILS', 'SCORE_STORE_WRITERS', fallback=4))
+
+# Pipeline stages and calculator methods are measured as stages
+for instance in (sp, sp.dm, sp.msc, sp.psc, stats):
+    metrics.instrument(instance)
+metrics.instrument(loader, methods=['load', 'load_table', 'load_many'])
+metrics.instrument(score_store, methods=['build', 'write'])
+
+loaded_dfs = {}
+
+# Row filter of the data files read by load, set by the full and
+# incremental modes
+emp_filter = None
+
+
+def load(name):
+    '''Reads a data file when a stage is not found in the cache, only the
+                    rows of the score eligible profiles in incremental mode'''
+    if name not in loaded_dfs:
+        loaded_dfs[name] = (loader.load_table if arrow else loader.load)(
+            name, emp_filter)
+
+    return loaded_dfs[name]
+
+
+def stage_params(names):
+    '''Returns the cache key parameters of a stage which reads the data
+            files, the columns read and the pipeline options change the
+            stage output'''
+    return {
+        'incremental': incremental,
+        'backend': sp.backend,
+        'lean': sp.lean,
+        'personal_score_engine': sp.personal_score_engine,
+        'columns': {name: {option: data_file_details[name].get(option)
+                           for option in ('rel_cols', 'dict_cols')}
+                    for name in names},
+    }
+
+
+def write_scores(score_dfs, score_files):
+    '''Writes the score files, rescored profiles are merged into the
+                                    previous score files in incremental mode'''
+    for score_name, file_name in score_files.items():
+        file_path = f'{score_folder}/{file_name}.csv'
+        score_df = score_dfs[score_name]
+
+        if isinstance(score_df, pa.Table):
+            score_df = score_df.to_pandas()
+
+        if incremental and os.path.exists(file_path):
+            score_df = sp.merge_scores(pd.read_csv(file_path), score_df,
+                                       score_eligible_prof_df['emp_id'])
+
+        score_df.to_csv(file_path, index=False)
+
+
+def publish_scores(market_score_dfs, personal_score_dfs):
+    '''Writes the scores and keeps the population statistics'''
+    # Score store keeps all the scores by emp_id, the csv files are optional
+    if c_cfg.getboolean('SCORE_DETAILS', 'SCORE_STORE', fallback=True):
+        score_store.write(
+            score_store.build(market_score_dfs, personal_score_dfs),
+            score_eligible_prof_df['emp_id'] if incremental else None)
+
+    if c_cfg.getboolean('SCORE_DETAILS', 'SCORE_CSV', fallback=False):
+        write_scores(market_score_dfs, sp.MARKET_SCORE_FILES)
+        write_scores(personal_score_dfs, sp.PERSONAL_SCORE_FILES)
+
+    # Population statistics are kept only after the scores are written
+    stats.save()
+
+
+if score_mode == 'partitioned':
+    # Out of core mode, the employees are scored by emp_id partitions
+    # within the memory budget. Scores are written into the score store.
+    scorer = PartitionedScorer(
+        loader, sp,
+        c_cfg.getint('SCORE_DETAILS', 'MEMORY_BUDGET_MB',
+                     fallback=4096) * 1024 ** 2,
+        c_cfg.get('SCORE_DETAILS', 'SPILL_FOLDER', fallback='spill'),
+        c_cfg.getint('SCORE_DETAILS', 'SCORE_WORKERS', fallback=1), stats,
+        c_cfg.getint('SCORE_DETAILS', 'PARTITIONS_IN_FLIGHT', fallback=0)
+        or None)
+    metrics.instrument(scorer, methods=['spill', 'population_ratios',
+                                        'score_partition'])
+
+    logger.info('Partitioned score calculation is started...')
+    scorer.run(score_store)
+    logger.info('Partitioned score calculation is completed...')
+elif pipelined:
+    # Every score is calculated as soon as its tables are pulled
+    logger.info('Pipelined pull and score calculation is started...')
+
+    try:
+        score_eligible_prof_df, market_score_dfs, personal_score_dfs = (
+            asyncio.run(PipelinedScorer(
+                cas_con, session,
+                c_cfg.get('CASSANDRA_SERVER_DETAILS', 'KEY_SPACE'),
+                loader, sp, stats,
+                c_cfg.getint('PULL_DETAILS', 'MAX_IN_FLIGHT', fallback=4),
+                c_cfg.getint('PULL_DETAILS', 'FETCH_SIZE', fallback=5000),
+                c_cfg.getint('PULL_DETAILS', 'PIPELINE_SCORE_WORKERS',
+                             fallback=2),
+                snapshot).run(table_queries, token_splits)))
+    finally:
+        cas_con.cluster_shutdown(cluster)
+
+    logger.info('Pipelined pull and score calculation is completed...')
+
+    publish_scores(market_score_dfs, personal_score_dfs)
+else:
+    personal_info_df = loader.load('personal_info')
+
+    score_eligible_prof_df = personal_info_df[
+        personal_info_df.recalculate_score_eligible == 'Y']
+
+    logger.info(f'Score eligible profiles - {score_eligible_prof_df.shape[0]}')
+
+    # Only the rows of the score eligible profiles and of the profiles
+    # removed from personal_info since the last run are read in incremental
+    # mode. Certificate rows of the removed profiles are still counted.
+    emp_filter = None
+
+    if incremental:
+        stats.load()
+        removed_emp_ids = stats.update_population(personal_info_df['emp_id'])
+        emp_filter = [('emp_id', 'in',
+                       score_eligible_prof_df['emp_id'].tolist()
+                       + removed_emp_ids.tolist())]
+
+    population_names = ('personal_info', 'work_info',
+                        'employee_technology_stack', 'certificate_info')
+    eligible_names = ('personal_info', 'certificate_info', 'education_info',
+                      'interview_schedule')
+
+    population_key = cache.stage_key(
+        'population_frames',
+        [loader.file_path(name) for name in population_names],
+        stage_params(population_names))
+    eligible_key = cache.stage_key(
+        'eligible_frames',
+        [loader.file_path(name) for name in eligible_names],
+        stage_params(eligible_names), [population_key])
+
+    # Data files of the stages which are not cached are read concurrently
+    prefetch_names = set()
+    if not cache.contains('population_frames', population_key):
+        prefetch_names.update(('work_info', 'employee_technology_stack',
+                               'certificate_info'))
+    if not cache.contains('eligible_frames', eligible_key):
+        prefetch_names.update(('certificate_info', 'education_info',
+                               'interview_schedule'))
+    loaded_dfs.update(loader.load_many(sorted(prefetch_names), emp_filter,
+                                       arrow))
+
+    logger.info('Population statistics calculation is started...')
+
+    population_dfs = cache.get_or_compute(
+        'population_frames', population_key,
+        lambda: sp.population_frames(
+            score_eligible_prof_df if incremental else personal_info_df,
+            load('work_info'), load('employee_technology_stack'),
+            load('certificate_info')))
+
+    if incremental:
+        stats.apply_delta(score_eligible_prof_df['emp_id'], population_dfs,
+                          removed_emp_ids)
+
+        # Last 2 years completed certificates are considered as trend
+        ratio_dfs = stats.ratios(cert_active_days=730)
+    else:
+        def build_statistics():
+            stats.build(population_dfs, personal_info_df['emp_id'])
+            return stats.to_frames()
+
+        stats_key = cache.stage_key(
+            'population_statistics',
+            params={'approximate_categories': approximate_categories,
+                    'sketch_params': sketch_params,
+                    # Certificate trend of the sketches depends on the date
+                    'date': date.today() if approximate_categories else None},
+            upstream=[population_key])
+        stats.from_frames(cache.get_or_compute(
+            'population_statistics', stats_key, build_statistics))
+
+        # Approximate ratios are compared with the exact ratios
+        if approximate_categories and c_cfg.getboolean(
+                'SCORE_DETAILS', 'SKETCH_ERROR_REPORT', fallback=False):
+            os.makedirs(stats.stats_folder, exist_ok=True)
+
+            for category, error_df in stats.error_report(
+                    population_dfs).items():
+                error_df.to_csv(f'{stats.stats_folder}/{category}'
+                                f'_sketch_error.csv', index=False)
+
+        # Last 2 years completed certificates are considered as trend
+        ratio_key = cache.stage_key(
+            'population_ratios',
+            params={'cert_active_days': 730, 'date': date.today()},
+            upstream=[stats_key])
+        ratio_dfs = cache.get_or_compute(
+            'population_ratios', ratio_key,
+            lambda: stats.ratios(cert_active_days=730))
+
+    logger.info('Population statistics calculation is completed...')
+
+    eligible_dfs = cache.get_or_compute(
+        'eligible_frames', eligible_key,
+        lambda: sp.eligible_frames(score_eligible_prof_df, population_dfs,
+                                   load('certificate_info'),
+                                   load('education_info'),
+                                   load('interview_schedule')))
+
+    logger.info('Market score calculation is started...')
+
+    market_score_dfs = sp.market_scores(eligible_dfs, ratio_dfs)
+
+    logger.info('Market score calculation is completed...')
+    logger.info('Personal score calculation is started...')
+
+    personal_score_dfs = sp.personal_scores(
+        eligible_dfs, score_eligible_prof_df['emp_id'])
+
+    logger.info('Personal score calculation is completed...')
+
+    publish_scores(market_score_dfs, personal_score_dfs)
+
+if interview_state is not None:
+    interview_state.save()
+
+metrics.write()
 
 logger.info('completed')
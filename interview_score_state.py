@@ -0,0 +1,424 @@
+'''This module keeps the interview score state between the runs.
+
+Details:
+    Interview score of an employee is the sum of status value * 10 * dense
+    rank of the interview date. Instead of ranking the whole interview
+    history on every run, the state folder keeps
+        interviews - scored interviews by int_id (emp_id, int_date,
+                     status_value)
+        dates      - status sum and no. of interviews of every employee date
+        employees  - last interview date, dense rank of the last date,
+                     no. of interviews, running score and last updated_time
+                     of the folded interviews (watermark) of every employee
+    New interviews dated on or after the last interview date of the
+    employee are added to the running score. Late arrivals and changed
+    interviews rescore only their employees from the dates table.
+    Only the interviews updated since the watermark of their employee are
+    compared with the state, interviews of the employees which are not in
+    the state are always folded. The watermark is kept per employee, so
+    the new interviews of an employee which is not folded in a run (Ex. not
+    score eligible) are folded when the employee is folded again. Every
+    table is split into hash partitions of emp_id and only the partitions
+    of the folded employees are written again.
+'''
+
+import json
+import logging.config
+import os
+
+import numpy as np
+import pandas as pd
+
+import segment_kernels as sk
+
+# Initialize log
+logger = logging.getLogger(__name__)
+
+
+class InterviewScoreState:
+    '''InterviewScoreState class keeps the interview score state
+        Functions:
+            exists
+            load
+            save
+            fold
+            scores
+    '''
+
+    INTERVIEW_STATUS = {'Selected': 1, 'Rejected': -1}
+
+    STATE_TABLES = ('interviews', 'dates', 'employees')
+
+    def __init__(self, state_folder='state',
+                 interview_status=INTERVIEW_STATUS, partitions=16,
+                 watermark_col='updated_time'):
+        self.logger = logging.getLogger(__name__)
+        self.state_folder = state_folder
+        self.interview_status = interview_status
+        self.partitions = partitions
+        self.watermark_col = watermark_col
+
+        # Partitions to be written by save, all of them until the state
+        # is saved with the same no. of partitions
+        self.changed_parts = set(range(partitions))
+
+        self.interviews = pd.DataFrame({
+            'int_id': pd.Series(dtype='object'),
+            'emp_id': pd.Series(dtype='object'),
+            'int_date': pd.Series(dtype='datetime64[ns]'),
+            'status_value': pd.Series(dtype='int64')}).set_index('int_id')
+        self.dates = pd.DataFrame({
+            'emp_id': pd.Series(dtype='object'),
+            'int_date': pd.Series(dtype='datetime64[ns]'),
+            'status_sum': pd.Series(dtype='int64'),
+            'int_count': pd.Series(dtype='int64')})
+        self.employees = pd.DataFrame({
+            'emp_id': pd.Series(dtype='object'),
+            'last_int_date': pd.Series(dtype='datetime64[ns]'),
+            'int_rank': pd.Series(dtype='int64'),
+            'int_rows': pd.Series(dtype='int64'),
+            'interview_score': pd.Series(dtype='float64'),
+            'updated_time': pd.Series(dtype='datetime64[ns]')}).set_index(
+                'emp_id')
+
+    def _meta_path(self):
+        return f'{self.state_folder}/interview_state.json'
+
+    def _file_path(self, name, part):
+        return f'{self.state_folder}/interview_{name}/part-{part:05d}.parquet'
+
+    def exists(self):
+        '''Returns True when the interview state is saved'''
+        return os.path.exists(self._meta_path())
+
+    def load(self):
+        '''Reads the interview state from the state folder'''
+        with open(self._meta_path()) as f:
+            meta = json.load(f)
+
+        state_dfs = {
+            name: pd.concat([
+                pd.read_parquet(self._file_path(name, part))
+                for part in range(meta['partitions'])], ignore_index=True)
+            for name in self.STATE_TABLES}
+
+        self.interviews = state_dfs['interviews'].set_index('int_id')
+        self.dates = state_dfs['dates']
+        self.employees = state_dfs['employees'].set_index('emp_id')
+
+        # State saved without the employee watermarks compares every
+        # interview once
+        if 'updated_time' not in self.employees.columns:
+            self.employees['updated_time'] = pd.NaT
+
+        # State saved with another no. of partitions is written again
+        self.changed_parts = (set() if meta['partitions'] == self.partitions
+                              else set(range(self.partitions)))
+
+        self.logger.debug(f'Interview state loaded from {self.state_folder}'
+                          f' - {self.employees.shape[0]} employees')
+
+    def save(self):
+        '''Writes the changed partitions of the interview state into the
+                                                                state folder'''
+        for name, state_df in (
+                ('interviews', self.interviews.reset_index()),
+                ('dates', self.dates),
+                ('employees', self.employees.reset_index())):
+            os.makedirs(f'{self.state_folder}/interview_{name}',
+                        exist_ok=True)
+
+            parts = sk.emp_partitions(state_df['emp_id'], self.partitions)
+
+            for part in sorted(self.changed_parts):
+                file_path = self._file_path(name, part)
+                state_df[parts == part].to_parquet(f'{file_path}.tmp',
+                                                   index=False)
+                os.replace(f'{file_path}.tmp', file_path)
+
+        # Partitions are written before the meta data
+        with open(f'{self._meta_path()}.tmp', 'w') as f:
+            json.dump({'partitions': self.partitions}, f, indent=4)
+        os.replace(f'{self._meta_path()}.tmp', self._meta_path())
+
+        self.logger.debug(f'Interview state saved into {self.state_folder}'
+                          f' - {len(self.changed_parts)} partitions')
+
+        self.changed_parts = set()
+
+    def _updated(self, interview_df):
+        '''Returns the interviews updated since the watermark of their
+                employee, or which have no updated_time or no employee in
+                                                                the state'''
+        if self.watermark_col not in interview_df.columns:
+            return interview_df
+
+        watermark = self.employees['updated_time'].reindex(
+            interview_df['emp_id'].values).values
+        updated_time = interview_df[self.watermark_col].values
+
+        return interview_df[pd.isna(watermark) | pd.isna(updated_time)
+                            | (updated_time >= watermark)]
+
+    def _update_watermarks(self, interview_df):
+        '''Moves the watermark of the employees to the last updated_time of
+                                                    their folded interviews'''
+        if self.watermark_col not in interview_df.columns:
+            return
+
+        updated_time = pd.Series(
+            interview_df[self.watermark_col].values,
+            index=pd.Index(interview_df['emp_id'].values)).dropna()
+        updated_time = updated_time[
+            updated_time.index.isin(self.employees.index)]
+        updated_time = updated_time.groupby(level=0).max()
+
+        watermark = self.employees['updated_time'].reindex(
+            updated_time.index)
+        updated_time = updated_time[
+            (watermark.isna() | (updated_time > watermark)).values]
+
+        if updated_time.empty:
+            return
+
+        watermark = self.employees['updated_time']
+        self.employees['updated_time'] = updated_time.reindex(
+            watermark.index).fillna(watermark)
+        self.changed_parts.update(sk.emp_partitions(
+            updated_time.index, self.partitions).tolist())
+
+    def fold(self, interview_df, emp_ids=None):
+        '''Folds the new and changed interviews into the state
+
+        Args:
+            interview_df (dataframe): interview data (int_id, emp_id,
+                                        int_status_desc, int_date and
+                                        updated_time)
+            emp_ids (series, optional): employees whose whole interview
+                        history is in interview_df, their interviews which
+                        are not in interview_df are removed from the state.
+                        Defaults to None (interviews are only added).
+        '''
+        all_interview_df = interview_df
+
+        # Rows updated at the watermark itself are compared again, the
+        # unchanged ones are skipped
+        interview_df = self._updated(all_interview_df)
+
+        scored = interview_df['int_status_desc'].isin(
+            list(self.interview_status)).values
+
+        status_value = pd.Series(
+            interview_df['int_status_desc'].values[scored],
+            dtype='object').map(self.interview_status)
+
+        folded_df = pd.DataFrame({
+            'emp_id': interview_df['emp_id'].values[scored],
+            'int_date': interview_df['int_date'].values[scored],
+            'status_value': status_value.values.astype('int64')},
+            index=pd.Index(interview_df['int_id'].values[scored],
+                           name='int_id'))
+
+        # Previous contribution of the folded interviews. Interviews which
+        # are not changed are skipped
+        old_df = self.interviews.reindex(folded_df.index)
+
+        unchanged = (
+            (old_df['emp_id'].values == folded_df['emp_id'].values)
+            & ((old_df['int_date'].values == folded_df['int_date'].values)
+               | (old_df['int_date'].isna().values
+                  & folded_df['int_date'].isna().values))
+            & (old_df['status_value'].values
+               == folded_df['status_value'].values))
+
+        added_df = folded_df[~unchanged]
+
+        # Stored interviews which are folded again with other values, with
+        # a status which is not scored or which are missing from the
+        # complete history of emp_ids
+        stored = self.interviews.index.get_indexer(
+            interview_df['int_id']) >= 0
+        removed_ids = pd.Index(interview_df['int_id'].values[stored])
+        removed_ids = removed_ids[~removed_ids.isin(
+            folded_df.index[unchanged])]
+
+        if emp_ids is not None:
+            complete = self.interviews['emp_id'].isin(emp_ids).values
+            removed_ids = removed_ids.append(self.interviews.index[
+                complete & ~self.interviews.index.isin(
+                    all_interview_df['int_id'])])
+
+        removed_df = self.interviews.loc[removed_ids.unique()]
+
+        if added_df.empty and removed_df.empty:
+            self._update_watermarks(interview_df)
+            self.logger.debug('No new interviews to fold')
+            return
+
+        self.changed_parts.update(sk.emp_partitions(
+            np.concatenate((added_df['emp_id'].values,
+                            removed_df['emp_id'].values)),
+            self.partitions).tolist())
+
+        self.interviews = pd.concat(
+            [self.interviews.drop(removed_df.index), added_df])
+
+        self._update_dates(added_df, removed_df)
+        self._update_employees(added_df, removed_df)
+        self._update_watermarks(interview_df)
+
+        self.logger.debug(f'Interview state - {interview_df.shape[0]} '
+                          f'updated, {added_df.shape[0]} added and '
+                          f'{removed_df.shape[0]} removed interviews')
+
+    def _update_dates(self, added_df, removed_df):
+        '''Adds the added and subtracts the removed interviews from the
+                                                employee date status sums'''
+        delta_df = pd.concat(
+            [added_df.assign(int_count=1),
+             removed_df.assign(status_value=-removed_df['status_value'],
+                               int_count=-1)],
+            ignore_index=True).dropna(subset=['int_date'])
+
+        delta_df = delta_df.rename(columns={'status_value': 'status_sum'})
+
+        affected = self.dates['emp_id'].isin(delta_df['emp_id']).values
+
+        date_df = pd.concat(
+            [self.dates[affected],
+             delta_df[['emp_id', 'int_date', 'status_sum', 'int_count']]],
+            ignore_index=True)
+
+        date_df = date_df.groupby(['emp_id', 'int_date'], as_index=False)[
+            ['status_sum', 'int_count']].sum()
+
+        self.dates = pd.concat(
+            [self.dates[~affected], date_df[date_df['int_count'] > 0]],
+            ignore_index=True)
+
+    def _update_employees(self, added_df, removed_df):
+        '''Updates the running score of the employees of the added and
+                                                        removed interviews'''
+        employee_df = self.employees.reindex(
+            pd.Index(added_df['emp_id']).append(
+                pd.Index(removed_df['emp_id'])).unique())
+
+        # Employees with removed interviews or interviews dated before
+        # their last interview date are rescored from the dates table
+        late = (added_df['int_date'].values
+                < employee_df['last_int_date'].reindex(
+                    added_df['emp_id']).values)
+        rescored = pd.Index(removed_df['emp_id']).append(
+            pd.Index(added_df['emp_id'][late])).unique()
+
+        appended_df = added_df[~added_df['emp_id'].isin(rescored).values]
+
+        rows_df = pd.concat(
+            [added_df[['emp_id']].assign(int_rows=1),
+             removed_df[['emp_id']].assign(int_rows=-1)])
+        int_rows = (employee_df['int_rows'].fillna(0)
+                    + rows_df.groupby('emp_id')['int_rows'].sum())
+
+        employee_df = pd.concat([
+            self._append_scores(appended_df, employee_df),
+            self._rescore(rescored)])
+        employee_df['int_rows'] = int_rows.reindex(
+            employee_df.index).astype('int64')
+
+        employee_df['int_rank'] = employee_df['int_rank'].astype('int64')
+
+        # Rescored employees keep their watermark
+        employee_df['updated_time'] = self.employees['updated_time'].reindex(
+            employee_df.index)
+
+        self.employees = pd.concat([
+            self.employees.drop(employee_df.index, errors='ignore'),
+            employee_df[employee_df['int_rows'] > 0]])
+        self.employees.index.name = 'emp_id'
+
+    def _append_scores(self, appended_df, employee_df):
+        '''Adds the interviews dated on or after the last interview date to
+                                                        the running scores'''
+        state_df = employee_df.reindex(appended_df['emp_id'].unique())
+
+        date_df = appended_df.dropna(subset=['int_date']).groupby(
+            ['emp_id', 'int_date'], as_index=False)['status_value'].sum()
+
+        last_int_date = state_df['last_int_date'].reindex(
+            date_df['emp_id']).values
+        int_rank = state_df['int_rank'].fillna(0).reindex(
+            date_df['emp_id']).values
+
+        # Last interview date keeps its rank, every new date gets the
+        # next rank
+        new_date = (date_df['int_date'].values != last_int_date)
+        date_df['int_order'] = (
+            int_rank
+            + date_df.assign(new_date=new_date).groupby('emp_id')[
+                'new_date'].cumsum().values)
+
+        date_df['interview_score'] = (date_df['status_value'] * 10
+                                      * date_df['int_order'])
+
+        date_agg_df = date_df.groupby('emp_id').agg(
+            last_int_date=('int_date', 'max'),
+            int_rank=('int_order', 'max'),
+            interview_score=('interview_score', 'sum'))
+
+        state_df['interview_score'] = (
+            state_df['interview_score'].fillna(0)
+            + date_agg_df['interview_score'].reindex(
+                state_df.index).fillna(0))
+        state_df['last_int_date'] = date_agg_df['last_int_date'].reindex(
+            state_df.index).fillna(state_df['last_int_date'])
+        state_df['int_rank'] = date_agg_df['int_rank'].reindex(
+            state_df.index).fillna(state_df['int_rank']).fillna(0)
+
+        return state_df
+
+    def _rescore(self, emp_ids):
+        '''Recalculates the running scores of the employees from the dates
+                                                                    table'''
+        date_df = self.dates[self.dates['emp_id'].isin(emp_ids).values]
+        date_df = date_df.sort_values(['emp_id', 'int_date'])
+
+        # Dates are unique within an employee, so the dense rank is the
+        # position of the date
+        date_df = date_df.assign(
+            int_order=date_df.groupby('emp_id').cumcount() + 1)
+        date_df = date_df.assign(interview_score=(
+            date_df['status_sum'] * 10 * date_df['int_order']))
+
+        state_df = date_df.groupby('emp_id').agg(
+            last_int_date=('int_date', 'max'),
+            int_rank=('int_order', 'max'),
+            interview_score=('interview_score', 'sum')).reindex(emp_ids)
+
+        state_df.index.name = 'emp_id'
+        state_df['int_rank'] = state_df['int_rank'].fillna(0)
+        state_df['interview_score'] = state_df['interview_score'].fillna(0)
+
+        return state_df
+
+    def scores(self, emp_ids):
+        '''Returns the interview score of the employees
+
+        Args:
+            emp_ids (series): emp_id of the employees
+
+        Returns:
+            dataframe: interview score of the employees having interviews
+        '''
+        emp_ids = pd.Index(emp_ids).unique().sort_values()
+
+        score_df = self.employees.reindex(
+            emp_ids[self.employees.index.get_indexer(emp_ids) >= 0])
+
+        return pd.DataFrame({
+            'emp_id': score_df.index.values,
+            'interview_score': np.asarray(
+                score_df['interview_score'], dtype='float64')})
+
+    def __repr__(self):
+        return (f"InterviewScoreState('{self.state_folder}', "
+                f"{self.partitions})")
@@ -0,0 +1,128 @@
+'''This module is used to share the joins of the score pipeline.
+
+Details:
+    Most of the joins in the score pipeline only keep the rows of a set of
+    profiles (population or score eligible), the columns of the other side
+    are never used. Those joins are done as emp_id semi joins, the emp_id
+    hash table of every profile set is built once and reused.
+    Dataframes sorted by the join column (emp_id sorted snapshots and
+    groupby outputs) are joined by a sorted merge instead, the row range of
+    every key is found by binary search. Arrow tables are filtered with the
+    is_in kernel of pyarrow.compute.
+    Sorted and Arrow key arrays are built on the first join of a key set.
+    Stages of the pipelined mode join on several threads at a time, so the
+    key sets and the key arrays are changed under a lock.
+'''
+
+import logging.config
+import threading
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+# Initialize log
+logger = logging.getLogger(__name__)
+
+
+class JoinPlanner:
+    '''JoinPlanner class defines the shared joins and filters
+        Functions:
+            key_set
+            semi_join
+    '''
+
+    def __init__(self):
+        self.logger = logging.getLogger(__name__)
+        self.key_sets = {}
+        self.sorted_keys = {}
+        self.arrow_keys = {}
+        self.lock = threading.Lock()
+
+    def key_set(self, name, keys):
+        '''Registers a set of join keys
+
+        Args:
+            name (str): key set name
+            keys (series): join key values
+        '''
+        key_set = pd.Index(keys).unique()
+
+        with self.lock:
+            self.key_sets[name] = key_set
+            self.sorted_keys.pop(name, None)
+            self.arrow_keys.pop(name, None)
+
+        self.logger.debug(f'{name} key set - {len(self.key_sets[name])}')
+
+    def semi_join(self, dataframe, key_set_name, on='emp_id'):
+        '''Returns rows of the dataframe whose key is in the key set
+
+        Args:
+            dataframe (dataframe): dataframe or Arrow table to be filtered
+            key_set_name (str): name of a registered key set
+            on (str, optional): join column. Defaults to 'emp_id'.
+
+        Returns:
+            dataframe: rows of the dataframe, a new dataframe which can be
+                        modified without affecting the input
+        '''
+        if isinstance(dataframe, pa.Table):
+            # Dictionary encoded columns are matched by their values
+            key_type = dataframe.schema.field(on).type
+            if pa.types.is_dictionary(key_type):
+                key_type = key_type.value_type
+
+            return dataframe.filter(pc.is_in(
+                dataframe.column(on),
+                value_set=self._arrow_keys(key_set_name).cast(key_type)))
+
+        key_set = self.key_sets[key_set_name]
+        column = dataframe[on]
+
+        if (column.dtype == key_set.dtype and column.dtype != 'category'
+                and column.is_monotonic_increasing):
+            return dataframe.take(self._merge_positions(
+                column.values, key_set_name))
+
+        mask = key_set.get_indexer(column) >= 0
+
+        return dataframe.take(np.flatnonzero(mask))
+
+    def _arrow_keys(self, key_set_name):
+        '''Returns the key set as Arrow array, built once per key set'''
+        with self.lock:
+            if key_set_name not in self.arrow_keys:
+                self.arrow_keys[key_set_name] = pa.array(
+                    self.key_sets[key_set_name].dropna().values)
+
+            return self.arrow_keys[key_set_name]
+
+    def _merge_positions(self, sorted_values, key_set_name):
+        '''Returns positions of the sorted values which are in the key set'''
+        with self.lock:
+            if key_set_name not in self.sorted_keys:
+                self.sorted_keys[key_set_name] = np.sort(
+                    self.key_sets[key_set_name].dropna().values)
+
+            keys = self.sorted_keys[key_set_name]
+
+        starts = np.searchsorted(sorted_values, keys, 'left')
+        lengths = np.searchsorted(sorted_values, keys, 'right') - starts
+
+        # Row range of every key, in the order of the rows
+        offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+
+        return np.arange(len(offsets)) + offsets
+
+    def __getstate__(self):
+        # Pipeline is sent to the worker processes of the partitioned mode,
+        # every process has its own lock
+        state = self.__dict__.copy()
+        del state['lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
@@ -1,9 +1,19 @@
 '''This Module is for Market score calculation
+
+Details:
+    Person data can be pandas dataframes or pyarrow Tables, Tables are
+    joined with the ratios by the pyarrow.compute kernels of arrow_backend.
+    Inputs are not modified. In the lean mode only emp_id, the joining
+    column and its ratio are returned, the other person columns are not
+    carried through the merge.
 '''
 
 import logging.config
 
 import pandas as pd
+import pyarrow as pa
+
+import arrow_backend as ab
 
 
 class MarketScoreCalculator:
@@ -16,8 +26,24 @@ class MarketScoreCalculator:
             certificate_population_trend
     '''
 
-    def __init__(self):
+    def __init__(self, lean=False):
         self.logger = logging.getLogger(__name__)
+        self.lean = lean
+
+    def _person_columns(self, person_df, join_col):
+        '''Returns emp_id and the joining column of the person data in the
+                lean mode, otherwise the person data'''
+        if isinstance(person_df, pa.Table):
+            if (not self.lean
+                    or set(person_df.column_names) == {'emp_id', join_col}):
+                return person_df
+            return person_df.select(['emp_id', join_col])
+
+        # Person data without other columns is not copied
+        if not self.lean or set(person_df.columns) == {'emp_id', join_col}:
+            return person_df
+
+        return person_df[['emp_id', join_col]]
 
     def total_exp_with_population(self, person_work_agg_df,
                                   exp_ratio_df, join_col='total_exp'):
@@ -31,10 +57,16 @@ class MarketScoreCalculator:
             Outputs:
                 tot_exp_score_df    : total experience score
         '''
+        person_work_agg_df = self._person_columns(person_work_agg_df,
+                                                  join_col)
+
+        if isinstance(person_work_agg_df, pa.Table):
+            return ab.ratio_join(person_work_agg_df, exp_ratio_df, join_col,
+                                 inverse=True)
 
         # 100 - Experience ratio numbers. Low ratio will get high score.
-        exp_ratio_df.loc[:, f'{join_col}_ratio'] = (
-            100 - exp_ratio_df[f'{join_col}_ratio'])
+        exp_ratio_df = exp_ratio_df.assign(**{
+            f'{join_col}_ratio': 100 - exp_ratio_df[f'{join_col}_ratio']})
 
         # Merging experience ratio to person with total experience.
         tot_exp_score_df = pd.merge(person_work_agg_df,
@@ -57,6 +89,11 @@ class MarketScoreCalculator:
                 domain_score_df : domain score
          '''
 
+        person_work_df = self._person_columns(person_work_df, join_col)
+
+        if isinstance(person_work_df, pa.Table):
+            return ab.ratio_join(person_work_df, domain_ratio_df, join_col)
+
         # Merging domain ratio data with person_work(contains domain details)
         domain_score_df = pd.merge(person_work_df,
                                    domain_ratio_df, on=join_col, how='left')
@@ -79,6 +116,11 @@ class MarketScoreCalculator:
                 skill_set_score_df : skill set score (pandas dataframe)
          '''
 
+        person_tech_df = self._person_columns(person_tech_df, join_col)
+
+        if isinstance(person_tech_df, pa.Table):
+            return ab.ratio_join(person_tech_df, skill_set_ratio_df, join_col)
+
         # Merging skill set ratio with person_tech(contains skill set details)
         skill_set_score_df = pd.merge(person_tech_df, skill_set_ratio_df,
                                       on=join_col, how='left')
@@ -101,6 +143,11 @@ class MarketScoreCalculator:
                 cert_trend_score_df : cert trend score (pandas dataframe)
          '''
 
+        person_cert_df = self._person_columns(person_cert_df, join_col)
+
+        if isinstance(person_cert_df, pa.Table):
+            return ab.ratio_join(person_cert_df, cert_trend_ratio_df, join_col)
+
         # Merging certificate trend ratio with person_cert(contains cert)
         cert_trend_score_df = pd.merge(person_cert_df, cert_trend_ratio_df,
                                        on=join_col, how='left')
@@ -0,0 +1,309 @@
+'''This module reads the data files described in data_file_meta_data.json
+
+Details:
+    Every data file entry has
+        file_name - parquet file or parquet dataset directory name
+        rel_cols  - columns to be read, all the columns when not given
+        dict_cols - string columns read as dictionary encoded columns.
+                    They are loaded as pandas categoricals, so value_counts,
+                    drop_duplicates, groupby and merge work on the integer
+                    codes instead of hashing the strings again.
+    Data files are read as pyarrow datasets from memory mapped files. Row
+    filters are pushed down to the scan, row groups whose statistics do not
+    match the filters are skipped. Several data files are read concurrently
+    by load_many, Arrow releases the GIL while reading.
+    The rows of one employee are read by lookup from the row groups of the
+    emp_id index of a sorted snapshot (see sorted_snapshot.py).
+'''
+
+import logging.config
+import operator
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from pyarrow.fs import LocalFileSystem
+
+from sorted_snapshot import SortedSnapshot
+
+# Initialize log
+logger = logging.getLogger(__name__)
+
+
+# Expressions of the filter operators of the pyarrow filters format
+FILTER_OPERATORS = {
+    '=': operator.eq, '==': operator.eq, '!=': operator.ne,
+    '<': operator.lt, '<=': operator.le, '>': operator.gt, '>=': operator.ge,
+    'in': lambda field, values: field.isin(values),
+    'not in': lambda field, values: ~field.isin(values),
+}
+
+
+def filter_expression(filters):
+    '''Returns the dataset expression of filters in pyarrow filters format
+
+    Args:
+        filters (list): [(column, operator, value)] conditions which are all
+                    true, or a list of them when any of them is true
+
+    Returns:
+        expression: dataset filter expression, None when there is no filter
+    '''
+    if not filters:
+        return None
+
+    if isinstance(filters[0][0], str):
+        filters = [filters]
+
+    expression = None
+
+    for conditions in filters:
+        conjunction = None
+
+        for column, op, value in conditions:
+            condition = FILTER_OPERATORS[op](ds.field(column), value)
+            conjunction = (condition if conjunction is None
+                           else conjunction & condition)
+
+        expression = (conjunction if expression is None
+                      else expression | conjunction)
+
+    return expression
+
+
+class ParquetLoader:
+    '''ParquetLoader class reads the data files
+        Functions:
+            file_path
+            fragment_paths
+            data_size
+            dataset
+            load
+            load_table
+            load_many
+            from_table
+            lookup
+            row_groups
+    '''
+
+    def __init__(self, data_file_details, data_folder='data',
+                 memory_map=True, max_workers=4):
+        self.logger = logging.getLogger(__name__)
+        self.data_file_details = data_file_details
+        self.data_folder = data_folder
+        self.memory_map = memory_map
+        self.max_workers = max_workers
+        self.snapshot = SortedSnapshot()
+
+    def file_path(self, name):
+        '''Returns the parquet file path of a data file
+
+        Args:
+            name (str): data file name in data_file_meta_data.json
+
+        Returns:
+            str: parquet file or dataset directory path
+        '''
+        file_name = self.data_file_details[name]['file_name']
+
+        return f'{self.data_folder}/{file_name}'
+
+    def fragment_paths(self, name):
+        '''Returns the parquet files of a data file
+
+        Args:
+            name (str): data file name in data_file_meta_data.json
+
+        Returns:
+            list: the parquet file or the files of the dataset directory
+        '''
+        file_path = self.file_path(name)
+
+        if not os.path.isdir(file_path):
+            return [file_path]
+
+        return sorted(f'{file_path}/{file_name}'
+                      for file_name in os.listdir(file_path)
+                      if file_name.endswith('.parquet'))
+
+    def data_size(self, name):
+        '''Returns the uncompressed size of a data file
+
+        Args:
+            name (str): data file name in data_file_meta_data.json
+
+        Returns:
+            int: uncompressed bytes of all the row groups
+        '''
+        data_size = 0
+
+        for fragment_path in self.fragment_paths(name):
+            metadata = pq.ParquetFile(fragment_path).metadata
+            data_size += sum(metadata.row_group(i).total_byte_size
+                             for i in range(metadata.num_row_groups))
+
+        return data_size
+
+    def dataset(self, name, file_path=None):
+        '''Returns a data file as pyarrow dataset
+
+        Args:
+            name (str): data file name in data_file_meta_data.json
+            file_path (str, optional): parquet file with the columns of the
+                                        data file, Ex. a partition of it.
+                                        Defaults to None (data file path).
+
+        Returns:
+            dataset: parquet dataset, dict_cols are dictionary encoded
+        '''
+        file_format = ds.ParquetFileFormat(read_options={
+            'dictionary_columns':
+                self.data_file_details[name].get('dict_cols') or []})
+
+        return ds.dataset(file_path or self.file_path(name),
+                          format=file_format,
+                          filesystem=LocalFileSystem(
+                              use_mmap=self.memory_map))
+
+    def load(self, name, filters=None, file_path=None):
+        '''Reads a data file as pandas dataframe
+
+        Args:
+            name (str): data file name in data_file_meta_data.json
+            filters (list, optional): row filters in pyarrow filters format.
+                                        Defaults to None (all the rows).
+            file_path (str, optional): parquet file with the columns of the
+                                        data file, Ex. a partition of it.
+                                        Defaults to None (data file path).
+
+        Returns:
+            dataframe: data file rows, dict_cols as categoricals
+        '''
+        return self.load_table(name, filters, file_path).to_pandas()
+
+    def load_table(self, name, filters=None, file_path=None):
+        '''Reads a data file as Arrow table, for the Arrow calculators
+
+        Args:
+            name (str): data file name in data_file_meta_data.json
+            filters (list, optional): row filters in pyarrow filters format.
+                                        Defaults to None (all the rows).
+            file_path (str, optional): parquet file with the columns of the
+                                        data file, Ex. a partition of it.
+                                        Defaults to None (data file path).
+
+        Returns:
+            table: data file rows, dict_cols dictionary encoded
+        '''
+        table = self.dataset(name, file_path).to_table(
+            columns=self.data_file_details[name].get('rel_cols'),
+            filter=filter_expression(filters))
+
+        self.logger.debug(f'{name} - {table.num_rows} rows loaded')
+
+        return table
+
+    def load_many(self, names, filters=None, arrow=False):
+        '''Reads several data files concurrently
+
+        Args:
+            names (list): data file names in data_file_meta_data.json
+            filters (list, optional): row filters of every data file.
+                                        Defaults to None (all the rows).
+            arrow (bool, optional): reads Arrow tables (load_table).
+                                        Defaults to False (dataframes).
+
+        Returns:
+            dict: dataframe (Arrow table) of every data file
+        '''
+        load = self.load_table if arrow else self.load
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {name: executor.submit(load, name, filters)
+                       for name in names}
+
+            return {name: future.result()
+                    for name, future in futures.items()}
+
+    def from_table(self, name, table):
+        '''Converts an Arrow table of a data file (Ex. pulled in memory) as
+                                                    load reads the data file
+
+        Args:
+            name (str): data file name in data_file_meta_data.json
+            table (table): Arrow table with the columns of the data file
+
+        Returns:
+            dataframe: rel_cols of the table, dict_cols as categoricals
+        '''
+        details = self.data_file_details[name]
+
+        if details.get('rel_cols'):
+            columns = [column for column in details['rel_cols']
+                       if column in table.column_names]
+            table = pa.Table.from_arrays(
+                [table.column(column) for column in columns], names=columns)
+
+        for column in details.get('dict_cols') or []:
+            position = table.schema.get_field_index(column)
+
+            if position >= 0 and not pa.types.is_dictionary(
+                    table.schema.types[position]):
+                table = table.set_column(
+                    position, column,
+                    table.column(column).dictionary_encode())
+
+        return table.to_pandas()
+
+    def lookup(self, name, emp_id):
+        '''Reads the rows of one employee. Only the row groups of its emp_id
+                range are read when the data file is a sorted snapshot,
+                otherwise the emp_id filter is pushed down to the scan.
+
+        Args:
+            name (str): data file name in data_file_meta_data.json
+            emp_id: employee id
+
+        Returns:
+            dataframe: rows of the employee, dict_cols as categoricals
+        '''
+        file_path = self.file_path(name)
+        index = self.snapshot.read_index(file_path)
+
+        if index is None:
+            return self.load(name, [('emp_id', '=', emp_id)])
+
+        details = self.data_file_details[name]
+        row_groups = self.snapshot.row_groups_of(index, emp_id)
+
+        table = pq.ParquetFile(
+            file_path, memory_map=self.memory_map,
+            read_dictionary=details.get('dict_cols')).read_row_groups(
+                row_groups, columns=details.get('rel_cols'))
+        employee_df = table.to_pandas()
+
+        self.logger.debug(f'{name} - {len(row_groups)} row groups read for '
+                          f'{emp_id}')
+
+        return employee_df[employee_df['emp_id'] == emp_id].reset_index(
+            drop=True)
+
+    def row_groups(self, name):
+        '''Reads a data file one row group at a time
+
+        Args:
+            name (str): data file name in data_file_meta_data.json
+
+        Yields:
+            table: rel_cols of a row group as Arrow table
+        '''
+        columns = self.data_file_details[name].get('rel_cols')
+
+        for fragment_path in self.fragment_paths(name):
+            parquet_file = pq.ParquetFile(fragment_path,
+                                          memory_map=self.memory_map)
+
+            for i in range(parquet_file.num_row_groups):
+                yield parquet_file.read_row_group(i, columns=columns)
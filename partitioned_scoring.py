@@ -0,0 +1,358 @@
+'''This module calculates the scores out of core in emp_id partitions.
+
+Details:
+    The data files are not loaded completely. The score calculation is done
+    in two passes over emp_id hash partitions
+        pass 1 - row groups of every data file are streamed into the
+                 partitions of the spill folder and the population count
+                 tables are built partition by partition. Count tables are
+                 added, so the population ratios are the same as the
+                 ratios of the whole population.
+        pass 2 - work aggregation, market and personal scores are
+                 calculated one partition at a time and written into the
+                 score store.
+    No. of partitions is chosen from the data size, so one partition and
+    its intermediate dataframes stay within the memory budget.
+    With more than one worker the passes are map-reduce steps on a process
+    pool. Workers spill the data files, count the population of their
+    partitions and score their partitions with the reduced population
+    ratios. Every worker holds one partition at a time, so the memory
+    budget is shared by the workers. At most max_in_flight partitions are
+    submitted to the pool at a time and their results are reduced (added
+    into the count tables, written into the score store) as they complete,
+    so the results waiting in the parent process stay bounded.
+    With more than one worker the interview score state is kept in the
+    parent process. Workers calculate the interview scores of their
+    partitions and the state is folded with the interviews of every
+    partition after the partitions are scored.
+'''
+
+import logging.config
+import math
+import os
+import shutil
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from itertools import repeat
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+import segment_kernels as sk
+from population_statistics import PopulationStatistics
+
+# Initialize log
+logger = logging.getLogger(__name__)
+
+
+class PartitionedScorer:
+    '''PartitionedScorer class calculates the scores by emp_id partitions
+        Functions:
+            partition_count
+            spill
+            spill_file
+            partition_counts
+            population_ratios
+            score_partition
+            score_table
+            fold_interviews
+            run
+    '''
+
+    # Data files of the score calculation
+    DATA_FILES = ['personal_info', 'work_info', 'employee_technology_stack',
+                  'certificate_info', 'education_info', 'interview_schedule']
+
+    # In memory size of a partition with its intermediate dataframes
+    # compared with its uncompressed parquet size
+    MEMORY_FACTOR = 4
+
+    def __init__(self, loader, pipeline, memory_budget=4 * 1024 ** 3,
+                 spill_folder='spill', workers=1, stats=None,
+                 max_in_flight=None):
+        self.logger = logging.getLogger(__name__)
+        self.loader = loader
+        self.pipeline = pipeline
+        self.stats = stats or PopulationStatistics()
+        self.memory_budget = memory_budget
+        self.spill_folder = spill_folder
+        self.workers = workers
+        self.max_in_flight = max_in_flight or 2 * workers
+        self.partitions = None
+
+        # Interview score state of the workers can not be kept, it is
+        # folded in this process after the partitions are scored
+        self.interview_state = None
+        if workers > 1:
+            self.interview_state = pipeline.interview_state
+            pipeline.interview_state = None
+
+    def _spill_path(self, name, part):
+        return f'{self.spill_folder}/{name}/part-{part:05d}.parquet'
+
+    def _map(self, executor, function, *iterables):
+        '''Maps the function on the process pool, in this process when there
+                is no process pool. At most max_in_flight calls are
+                submitted at a time, results are yielded as they complete
+                (not in the order of the arguments).'''
+        if executor is None:
+            yield from map(function, *iterables)
+            return
+
+        arguments = zip(*iterables)
+        futures = set()
+
+        while True:
+            for args in arguments:
+                futures.add(executor.submit(function, *args))
+
+                if len(futures) >= self.max_in_flight:
+                    break
+
+            if not futures:
+                return
+
+            done, futures = wait(futures, return_when=FIRST_COMPLETED)
+
+            for future in done:
+                yield future.result()
+
+    def partition_count(self):
+        '''Returns no. of partitions which keeps the partitions of all the
+                                            workers within the memory budget'''
+        data_size = sum(self.loader.data_size(name)
+                        for name in self.DATA_FILES)
+
+        partitions = max(self.workers, math.ceil(
+            data_size * self.MEMORY_FACTOR * self.workers
+            / self.memory_budget))
+
+        self.logger.info(f'Data size {data_size} bytes, '
+                         f'{partitions} partitions')
+
+        return partitions
+
+    def spill(self, partitions, executor=None):
+        '''Streams the row groups of the data files into emp_id hash
+                                    partitions of the spill folder
+
+        Args:
+            partitions (int): no. of partitions
+            executor (ProcessPoolExecutor, optional): process pool, the data
+                        files are spilled concurrently. Defaults to None.
+        '''
+        self.partitions = partitions
+
+        rows = sum(self._map(executor, self.spill_file, self.DATA_FILES))
+
+        self.logger.debug(f'{rows} rows spilled')
+
+    def spill_file(self, name):
+        '''Streams the row groups of a data file into emp_id hash partitions
+                                                        of the spill folder
+
+        Args:
+            name (str): data file name in data_file_meta_data.json
+
+        Returns:
+            int: no. of rows spilled
+        '''
+        partitions = self.partitions
+
+        if os.path.exists(f'{self.spill_folder}/{name}'):
+            shutil.rmtree(f'{self.spill_folder}/{name}')
+        os.makedirs(f'{self.spill_folder}/{name}')
+
+        writers = None
+        rows = 0
+
+        for table in self.loader.row_groups(name):
+            if writers is None:
+                schema = table.schema
+                writers = [pq.ParquetWriter(self._spill_path(name, part),
+                                            schema)
+                           for part in range(partitions)]
+
+            parts = sk.emp_partitions(table.column('emp_id').to_pandas(),
+                                      partitions)
+            starts = np.concatenate(
+                ([0], np.cumsum(np.bincount(parts, minlength=partitions))))
+
+            table = table.take(pa.array(np.argsort(parts, kind='stable')))
+            if table.schema != schema:
+                table = table.cast(schema)
+
+            for part, writer in enumerate(writers):
+                writer.write_table(table.slice(
+                    starts[part], starts[part + 1] - starts[part]))
+
+            rows += table.num_rows
+
+        if writers is None:
+            raise ValueError(f'{name} has no row groups')
+
+        for writer in writers:
+            writer.close()
+
+        self.logger.debug(f'{name} - {rows} rows spilled')
+
+        return rows
+
+    def _load(self, name, part):
+        return self.loader.load(name,
+                                file_path=self._spill_path(name, part))
+
+    def _population_frames(self, part):
+        '''Returns the population frames of a partition'''
+        return self.pipeline.population_frames(
+            self._load('personal_info', part), self._load('work_info', part),
+            self._load('employee_technology_stack', part),
+            self._load('certificate_info', part))
+
+    def partition_counts(self, part):
+        '''Returns the population count tables of a partition
+
+        Args:
+            part (int): partition
+
+        Returns:
+            dict: count dataframe for every category
+        '''
+        return self.stats.population_counts(self._population_frames(part))
+
+    def population_ratios(self, cert_active_days=730, executor=None):
+        '''Builds the population count tables partition by partition and
+        returns the population ratios
+
+        Args:
+            cert_active_days (int, optional): certificates completed within
+                                these days are considered as trend.
+                                Defaults to 730 (2 years).
+            executor (ProcessPoolExecutor, optional): process pool, the
+                        partitions are counted concurrently. Defaults to None.
+
+        Returns:
+            dict: ratio dataframe for every category
+        '''
+        for count_dfs in self._map(executor, self.partition_counts,
+                                   range(self.partitions)):
+            self.stats.add_counts(count_dfs)
+
+        return self.stats.ratios(cert_active_days=cert_active_days)
+
+    def score_partition(self, part, ratio_dfs):
+        '''Calculates the market and personal scores of the score eligible
+        profiles of a partition
+
+        Args:
+            part (int): partition
+            ratio_dfs (dict): population ratio for every category
+
+        Returns:
+            tuple: market and personal score dataframes
+        '''
+        personal_info_df = self._load('personal_info', part)
+        certificate_df = self._load('certificate_info', part)
+
+        score_eligible_prof_df = personal_info_df[
+            personal_info_df.recalculate_score_eligible == 'Y']
+
+        population_dfs = self.pipeline.population_frames(
+            personal_info_df, self._load('work_info', part),
+            self._load('employee_technology_stack', part), certificate_df)
+
+        eligible_dfs = self.pipeline.eligible_frames(
+            score_eligible_prof_df, population_dfs, certificate_df,
+            self._load('education_info', part),
+            self._load('interview_schedule', part))
+
+        # Market score calculators modify the ratio dataframes
+        market_score_dfs = self.pipeline.market_scores(
+            eligible_dfs, {category: ratio_df.copy()
+                           for category, ratio_df in ratio_dfs.items()})
+        personal_score_dfs = self.pipeline.personal_scores(
+            eligible_dfs, score_eligible_prof_df['emp_id'])
+
+        self.logger.debug(f'Partition {part} - '
+                          f'{score_eligible_prof_df.shape[0]} profiles')
+
+        return market_score_dfs, personal_score_dfs
+
+    def score_table(self, part, ratio_dfs, score_store):
+        '''Returns the score table of a partition
+
+        Args:
+            part (int): partition
+            ratio_dfs (dict): population ratio for every category
+            score_store (ScoreStore): score store
+
+        Returns:
+            table: score components by emp_id (Arrow table)
+        '''
+        return score_store.build(*self.score_partition(part, ratio_dfs))
+
+    def fold_interviews(self, part):
+        '''Folds the interviews of the score eligible profiles of a
+        partition into the interview score state, as their complete history
+
+        Args:
+            part (int): partition
+        '''
+        personal_info_df = self._load('personal_info', part)
+        interview_df = self._load('interview_schedule', part)
+
+        emp_ids = personal_info_df.loc[
+            personal_info_df.recalculate_score_eligible == 'Y', 'emp_id']
+
+        self.interview_state.fold(
+            interview_df[interview_df['emp_id'].isin(emp_ids).values],
+            emp_ids)
+
+    def run(self, score_store, cert_active_days=730):
+        '''Calculates the scores of all the partitions into the score store
+
+        Args:
+            score_store (ScoreStore): score store
+            cert_active_days (int, optional): certificate trend days.
+                                                Defaults to 730 (2 years).
+        '''
+        executor = (ProcessPoolExecutor(max_workers=self.workers)
+                    if self.workers > 1 else None)
+
+        try:
+            self.spill(self.partition_count(), executor)
+
+            self.logger.info(
+                'Population statistics calculation is started...')
+            ratio_dfs = self.population_ratios(cert_active_days, executor)
+            self.logger.info(
+                'Population statistics calculation is completed...')
+
+            # Population ratios are sent to every worker with its partitions
+            with score_store.writer() as write_scores:
+                for score_table in self._map(
+                        executor, self.score_table, range(self.partitions),
+                        repeat(ratio_dfs), repeat(score_store)):
+                    write_scores(score_table)
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+        if self.interview_state is not None:
+            for part in range(self.partitions):
+                self.fold_interviews(part)
+
+            self.logger.info('Interview score state is folded...')
+
+        shutil.rmtree(self.spill_folder)
+
+    def __getstate__(self):
+        # Interview score state is kept only in this process
+        state = self.__dict__.copy()
+        state['interview_state'] = None
+        return state
+
+    def __repr__(self):
+        return f'''PartitionedScorer({self.memory_budget},
+                                '{self.spill_folder}', {self.workers},
+                                {self.max_in_flight})'''
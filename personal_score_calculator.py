@@ -1,10 +1,23 @@
 '''This Module is for Personal Score Calculation
+
+Details:
+    Person data can be pandas dataframes or pyarrow Tables, Tables are
+    scored by the pyarrow.compute kernels of arrow_backend. The fused
+    scores take pandas dataframes only.
+    Inputs are not modified, scores are added to a shallow copy of the
+    person data. In the lean mode only emp_id and the score columns
+    (LEAN_COLUMNS) are returned.
 '''
 import logging.config
 from datetime import datetime, timedelta
 
 import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+import arrow_backend as ab
+import segment_kernels as sk
 
 
 class PersonalScoreCalculator:
@@ -16,6 +29,7 @@ class PersonalScoreCalculator:
             skill_set_score
             reliablity_score
             interview_score
+            fused_scores
     '''
 
     EDUCATION_SCORE = {
@@ -25,8 +39,58 @@ class PersonalScoreCalculator:
 
     INTERVIEW_STATUS = ['Selected', 'Rejected']
 
-    def __init__(self):
+    # np.timedelta64(1, 'Y') in nano seconds (365.2425 days)
+    YEAR_NS = 31556952 * 10 ** 9
+
+    # Person columns kept with the scores in the lean mode
+    LEAN_COLUMNS = {
+        'education_score': ['education_type_desc'],
+        'domain_score': ['no_of_domain'],
+        'reliablity_score': ['total_exp', 'total_switch', 'switch_rel'],
+    }
+
+    def __init__(self, lean=False):
         self.logger = logging.getLogger(__name__)
+        self.lean = lean
+
+    def _score_frame(self, person_df, score, scores):
+        '''Returns the person data with the score columns. Only emp_id, the
+                LEAN_COLUMNS of the score and the score columns are kept in
+                the lean mode. Person data is not modified.
+
+        Args:
+            person_df (dataframe or table): person data
+            score (str): calculator method of LEAN_COLUMNS
+            scores (dict): values of every score column, series of the
+                            person data index for dataframes
+
+        Returns:
+            dataframe or table: score dataframe
+        '''
+        if isinstance(person_df, pa.Table):
+            if self.lean:
+                person_df = person_df.select(['emp_id']
+                                             + self.LEAN_COLUMNS[score])
+
+            for column, values in scores.items():
+                person_df = ab.assign(person_df, column, values)
+
+            return person_df
+
+        # Columns are put together without copying them
+        if self.lean:
+            return pd.concat(
+                [person_df[column] for column in
+                 ['emp_id'] + self.LEAN_COLUMNS[score]]
+                + [values.rename(column, copy=False)
+                   for column, values in scores.items()],
+                axis=1, copy=False)
+
+        score_df = person_df.copy(deep=False)
+        for column, values in scores.items():
+            score_df[column] = values
+
+        return score_df
 
     def education_score(self, employee_edu_df, education_score=EDUCATION_SCORE):
         '''Calculates education score
@@ -42,11 +106,25 @@ class PersonalScoreCalculator:
         '''
 
         self.logger.debug(f'Education grade static score - {education_score}')
-        edu_static_score_df = pd.DataFrame.from_dict(education_score)
 
-        edu_score_df = pd.merge(
-            employee_edu_df, edu_static_score_df, on='education_type_desc',
-            how='left')
+        if isinstance(employee_edu_df, pa.Table):
+            return self._score_frame(
+                employee_edu_df, 'education_score',
+                {'education_score': ab.category_values(
+                    employee_edu_df.column('education_type_desc'),
+                    dict(zip(education_score['education_type_desc'],
+                             education_score['education_score'])))})
+
+        edu_score = self._category_values(
+            employee_edu_df['education_type_desc'],
+            dict(zip(education_score['education_type_desc'],
+                     education_score['education_score'])))
+
+        if edu_score.notna().all():
+            edu_score = edu_score.astype('int')
+
+        edu_score_df = self._score_frame(employee_edu_df, 'education_score',
+                                         {'education_score': edu_score})
 
         return edu_score_df
 
@@ -62,15 +140,19 @@ class PersonalScoreCalculator:
             dataframe: Certificate score for the valid on
         '''
 
-        certificate_df.loc[:, 'valid_periods'] = (datetime.today()
-                                                  - certificate_df[
-            'certificate_completion_date'])
+        if isinstance(certificate_df, pa.Table):
+            return ab.valid_certificate_score(
+                certificate_df,
+                int(np.datetime64(datetime.today(), 'ns').view('int64')),
+                valid_years, self.YEAR_NS)
+
+        valid_periods = (datetime.today()
+                         - certificate_df['certificate_completion_date'])
 
-        certificate_df.loc[:, 'valid_years'] = (certificate_df['valid_periods']
-                                                // np.timedelta64(1, 'Y'))
+        cert_valid_years = valid_periods // np.timedelta64(1, 'Y')
 
-        valid_cert_df = certificate_df[certificate_df['valid_years']
-                                       <= valid_years]
+        valid_cert_df = certificate_df.loc[cert_valid_years <= valid_years,
+                                           ['emp_id', 'certificate_id']]
 
         valid_cert_score_df = (valid_cert_df.groupby('emp_id').agg(
             no_of_certs=('certificate_id', 'nunique')).reset_index())
@@ -90,10 +172,13 @@ class PersonalScoreCalculator:
             dataframe: domain score for the person with domain agg. data
         '''
 
-        domain_score_df = work_agg_df.copy()
+        if isinstance(work_agg_df, pa.Table):
+            return self._score_frame(work_agg_df, 'domain_score', {
+                'domain_score': pc.multiply(
+                    work_agg_df.column('no_of_domain'), 10)})
 
-        domain_score_df.loc[:, 'domain_score'] = (
-            work_agg_df['no_of_domain'] * 10)
+        domain_score_df = self._score_frame(work_agg_df, 'domain_score', {
+            'domain_score': work_agg_df['no_of_domain'] * 10})
 
         return domain_score_df
 
@@ -107,6 +192,10 @@ class PersonalScoreCalculator:
             dataframe: skill set score for the person tech data
         '''
 
+        if isinstance(tech_df, pa.Table):
+            return ab.nunique_score(tech_df, 'technology_description',
+                                    'tech_count', 'skill_set_score')
+
         tech_count_df = (tech_df.groupby('emp_id').agg(
             tech_count=('technology_description', 'nunique')).reset_index())
 
@@ -125,15 +214,27 @@ class PersonalScoreCalculator:
             dataframe: reliablity score for the no of career switches
         '''
 
-        work_agg_df['switch_rel_count'] = work_agg_df['switch_rel'] + 1
+        if isinstance(work_agg_df, pa.Table):
+            switch_rel_count = pc.add(work_agg_df.column('switch_rel'), 1)
+            total_exp = pc.multiply(work_agg_df.column('total_exp'), 10)
 
-        work_agg_df.loc[:, 'rel_score1'] = (work_agg_df['total_exp'] * 10
-                                            // work_agg_df['total_switch'])
+            return self._score_frame(work_agg_df, 'reliablity_score', {
+                'switch_rel_count': switch_rel_count,
+                'rel_score1': ab.floor_divide(
+                    total_exp, work_agg_df.column('total_switch')),
+                'rel_score2': ab.floor_divide(total_exp, switch_rel_count)})
 
-        work_agg_df.loc[:, 'rel_score2'] = (work_agg_df['total_exp'] * 10
-                                            // work_agg_df['switch_rel_count'])
+        switch_rel_count = work_agg_df['switch_rel'] + 1
 
-        return work_agg_df
+        reliablity_score_df = self._score_frame(
+            work_agg_df, 'reliablity_score', {
+                'switch_rel_count': switch_rel_count,
+                'rel_score1': (work_agg_df['total_exp'] * 10
+                               // work_agg_df['total_switch']),
+                'rel_score2': (work_agg_df['total_exp'] * 10
+                               // switch_rel_count)})
+
+        return reliablity_score_df
 
     def interview_score(self, interview_df, interview_status=INTERVIEW_STATUS):
         '''Calculates Interview score based on interview results
@@ -147,16 +248,22 @@ class PersonalScoreCalculator:
             dataframe: interview score based on the results cummulatively.
         '''
 
-        interview_df = interview_df[interview_df['int_status_desc'].isin(
-            interview_status)]
+        if isinstance(interview_df, pa.Table):
+            return ab.interview_score(interview_df, interview_status,
+                                      {'Selected': 1, 'Rejected': -1})
+
+        interview_df = interview_df.loc[
+            interview_df['int_status_desc'].isin(interview_status),
+            ['emp_id', 'int_date', 'int_status_desc']]
 
         interview_df = interview_df.sort_values(['emp_id', 'int_date'])
 
         interview_df.loc[:, 'int_order'] = interview_df.groupby('emp_id')[
             'int_date'].rank('dense')
 
-        interview_df.loc[:, 'status_value'] = (interview_df[
-            'int_status_desc'].replace('Selected', 1).replace('Rejected', -1))
+        interview_df.loc[:, 'status_value'] = self._category_values(
+            interview_df['int_status_desc'],
+            {'Selected': 1, 'Rejected': -1}).astype('int')
 
         interview_df.loc[:, 'interview_score'] = (interview_df['status_value']
                                                   * 10
@@ -166,3 +273,144 @@ class PersonalScoreCalculator:
             interview_score=('interview_score', 'sum')).reset_index())
 
         return interview_score_df
+
+    def fused_scores(self, work_agg_df, tech_df, certificate_df,
+                     interview_df, valid_years=5,
+                     interview_status=INTERVIEW_STATUS):
+        '''Calculates valid certificate, domain, skill set, reliablity and
+        interview scores in a single pass.
+            Every input is sorted once by employee code and the per employee
+            aggregates are calculated with segment reductions on the sorted
+            arrays instead of a groupby for every score.
+
+        Args:
+            work_agg_df (dataframe): person with work aggregated data
+            tech_df (dataframe): person tech data
+            certificate_df (dataframe): person certificate data
+            interview_df (dataframe): interview data
+            valid_years (int, optional): valid years of certificate.
+                                            Defaults to 5.
+            interview_status (list, optional): valid interview status.
+                            Defaults to list ['Selected', 'Rejected']
+
+        Returns:
+            dataframe: one row for every employee with all the score columns,
+                        scores of an employee without rows are missing values
+        '''
+        # Employees are in emp_id order like the groupby outputs
+        emp_index = pd.Index(np.concatenate([
+            work_agg_df['emp_id'].values, tech_df['emp_id'].values,
+            certificate_df['emp_id'].values, interview_df['emp_id'].values
+        ])).unique().sort_values()
+        size = len(emp_index)
+
+        score_df = pd.DataFrame({'emp_id': emp_index})
+
+        # Domain and reliablity score. Work aggregated data has one row
+        # for every employee
+        work_codes = sk.employee_codes(emp_index, work_agg_df['emp_id'])
+        switch_rel_count = work_agg_df['switch_rel'] + 1
+
+        for column, values in (
+                ('total_exp', work_agg_df['total_exp']),
+                ('total_switch', work_agg_df['total_switch']),
+                ('switch_rel', work_agg_df['switch_rel']),
+                ('no_of_domain', work_agg_df['no_of_domain']),
+                ('domain_score', work_agg_df['no_of_domain'] * 10),
+                ('switch_rel_count', switch_rel_count),
+                ('rel_score1', (work_agg_df['total_exp'] * 10
+                                // work_agg_df['total_switch'])),
+                ('rel_score2', (work_agg_df['total_exp'] * 10
+                                // switch_rel_count))):
+            score_df[column] = sk.employee_values(values.values, work_codes,
+                                                  size)
+
+        # Valid certificate score
+        completion_ns = (certificate_df['certificate_completion_date'].values
+                         .astype('datetime64[ns]').view('int64'))
+        today_ns = np.datetime64(datetime.today(), 'ns').view('int64')
+
+        valid = (certificate_df['certificate_completion_date'].notna().values
+                 & ((today_ns - completion_ns) // self.YEAR_NS
+                    <= valid_years))
+
+        cert_codes = sk.employee_codes(
+            emp_index, certificate_df['emp_id'].values[valid])
+        cert_values = sk.category_codes(
+            certificate_df['certificate_id'])[valid]
+        order = np.lexsort((cert_values, cert_codes))
+
+        no_of_certs = sk.segment_nunique(cert_codes[order],
+                                         cert_values[order], size)
+        cert_present = sk.segment_count(cert_codes, size) > 0
+
+        score_df['no_of_certs'] = sk.employee_values(
+            no_of_certs, np.arange(size), size, cert_present)
+        score_df['cert_score'] = sk.employee_values(
+            no_of_certs * 10, np.arange(size), size, cert_present)
+
+        # Skill set score
+        tech_codes = sk.employee_codes(emp_index, tech_df['emp_id'])
+        tech_values = sk.category_codes(tech_df['technology_description'])
+        order = np.lexsort((tech_values, tech_codes))
+
+        tech_count = sk.segment_nunique(tech_codes[order],
+                                        tech_values[order], size)
+        tech_present = sk.segment_count(tech_codes, size) > 0
+
+        score_df['tech_count'] = sk.employee_values(
+            tech_count, np.arange(size), size, tech_present)
+        score_df['skill_set_score'] = sk.employee_values(
+            tech_count * 10, np.arange(size), size, tech_present)
+
+        # Interview score. Every interview date gets dense rank within the
+        # employee, interviews without date are not scored
+        interview_df = interview_df[interview_df['int_status_desc'].isin(
+            interview_status)]
+
+        int_codes = sk.employee_codes(emp_index, interview_df['emp_id'])
+        int_dates = (interview_df['int_date'].values
+                     .astype('datetime64[ns]').view('int64'))
+        status_values = self._category_values(
+            interview_df['int_status_desc'],
+            {'Selected': 1, 'Rejected': -1}).values
+        order = np.lexsort((int_dates, int_codes))
+
+        int_codes = int_codes[order]
+        dated = interview_df['int_date'].notna().values[order]
+
+        int_order = np.zeros(len(int_codes))
+        int_order[dated] = sk.segment_dense_rank(int_codes[dated],
+                                                 int_dates[order][dated])
+
+        interview_score = sk.segment_sum(
+            int_codes, status_values[order] * 10 * int_order, size)
+        int_present = sk.segment_count(int_codes, size) > 0
+
+        score_df['interview_score'] = sk.employee_values(
+            interview_score, np.arange(size), size, int_present)
+
+        return score_df
+
+    def _category_values(self, category_series, category_values):
+        '''Maps every category to its value, other categories are NaN.
+                Categoricals are mapped on their codes without decoding
+                the strings.
+
+        Args:
+            category_series (series): category column
+            category_values (dict): value of every category
+
+        Returns:
+            series: value of every row
+        '''
+        if not isinstance(category_series.dtype, pd.CategoricalDtype):
+            return category_series.map(category_values).astype('float')
+
+        # Last value is for the missing category (code -1)
+        code_values = np.array(
+            [category_values.get(category, np.nan)
+             for category in category_series.cat.categories] + [np.nan])
+
+        return pd.Series(code_values[category_series.cat.codes.values],
+                         index=category_series.index)
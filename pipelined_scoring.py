@@ -0,0 +1,273 @@
+'''This module overlaps the pull of the tables with the score calculation.
+
+class       : PipelinedScorer
+functions   : run (pulls the tables and calculates the scores as soon as
+                    their tables are pulled)
+
+Details:
+    Every table is pulled on a pull thread and written into its parquet
+    file as before, the pages are kept in memory as well. Score stages are
+    asyncio tasks which wait only for the tables they read, so a score
+    runs while the other tables are still pulled
+        personal_info            - population and score eligible profiles
+        work_info                - total experience and domain ratios,
+                                   market and personal work scores
+        employee_technology_stack - skill set ratio and scores
+        certificate_info         - certificate trend ratio and scores
+        education_info           - education score
+        interview_schedule       - interview score
+    Pulled tables are handed to the stages in memory, they are not read
+    back from the parquet files. Stages run on the score threads, so the
+    event loop keeps starting the stages of the pulled tables.
+    Tables scanned by token range are read back from their dataset
+    directory. Only the full pull and full score modes are pipelined, the
+    stage cache is not used.
+'''
+
+import asyncio
+import logging.config
+import os
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+import pyarrow as pa
+
+# Initialize log
+logger = logging.getLogger(__name__)
+
+
+class PipelinedScorer:
+    '''PipelinedScorer class pulls the tables and scores the profiles
+                                                                concurrently
+        Functions:
+            run
+    '''
+
+    def __init__(self, cas_con, session, keyspace, loader, sp, stats,
+                 max_in_flight=4, fetch_size=5000, score_workers=2,
+                 snapshot=None, cert_active_days=730):
+        self.logger = logging.getLogger(__name__)
+        self.cas_con = cas_con
+        self.session = session
+        self.keyspace = keyspace
+        self.loader = loader
+        self.sp = sp
+        self.stats = stats
+        self.max_in_flight = max_in_flight
+        # Queries of the tables and of their token ranges run at a time
+        self.in_flight = threading.BoundedSemaphore(max_in_flight)
+        self.fetch_size = fetch_size
+        self.score_workers = score_workers
+        self.snapshot = snapshot
+        self.cert_active_days = cert_active_days
+        self.logger.debug(self)
+
+    def _pull_table(self, name, table, query, token_splits=None):
+        '''Pulls one table into its parquet file, returns the rows and the
+                dataframe of the data file (None for the other tables)'''
+        file_path = (f'{self.loader.data_folder}/{self.keyspace}_'
+                     f'{table}.parquet')
+        tables = [] if name is not None and not token_splits else None
+
+        if token_splits:
+            rows = self.cas_con.token_range_scan(
+                self.session, self.keyspace, table, query, file_path,
+                token_splits, self.max_in_flight, self.fetch_size,
+                in_flight=self.in_flight)
+        else:
+            if os.path.isdir(file_path):
+                shutil.rmtree(file_path)
+
+            with self.in_flight:
+                rows = self.cas_con.parquet_result_set(
+                    self.session, self.keyspace, query, file_path,
+                    self.fetch_size, tables=tables)
+
+        self.logger.info(f'{table} - {rows} rows pulled')
+
+        frame = None
+        if name is not None:
+            frame = (self.loader.from_table(name, pa.concat_tables(tables))
+                     if tables else self.loader.load(name))
+
+        if self.snapshot is not None:
+            self.snapshot.rewrite(file_path)
+
+        return rows, frame
+
+    async def run(self, table_queries, token_splits=None):
+        '''Pulls the tables and calculates the scores of the score eligible
+                profiles as soon as their tables are pulled
+
+            Input arguments:
+                table_queries (dict) - query for every table
+                token_splits (dict)  - no. of token ranges for the tables
+                                        scanned by token_range_scan
+                                        default value is None
+            Output argument:
+                score_eligible_prof_df - score eligible profiles
+                market_score_dfs (dict) - market score dataframes
+                personal_score_dfs (dict) - personal score dataframes
+        '''
+        token_splits = token_splits or {}
+        loop = asyncio.get_running_loop()
+
+        if self.session.keyspace != self.keyspace:
+            self.session.set_keyspace(self.keyspace)
+
+        data_files = {details.get('table_name'): name for name, details in
+                      self.loader.data_file_details.items()}
+
+        with ThreadPoolExecutor(self.max_in_flight) as pull_pool, \
+                ThreadPoolExecutor(self.score_workers) as score_pool:
+
+            def stage(function, *args):
+                return loop.run_in_executor(score_pool, function, *args)
+
+            pulls = {
+                table: loop.run_in_executor(
+                    pull_pool, self._pull_table, data_files.get(table),
+                    table, query, token_splits.get(table))
+                for table, query in table_queries.items()}
+
+            frames = {data_files[table]: pull for table, pull
+                      in pulls.items() if table in data_files}
+
+            async def frame(name):
+                return (await frames[name])[1]
+
+            async def profiles():
+                personal_info_df = await frame('personal_info')
+                score_eligible_prof_df = personal_info_df[
+                    personal_info_df.recalculate_score_eligible == 'Y']
+
+                self.sp.joins.key_set('population',
+                                      personal_info_df['emp_id'])
+                self.sp.joins.key_set('eligible',
+                                      score_eligible_prof_df['emp_id'])
+
+                self.logger.info(f'Score eligible profiles - '
+                                 f'{score_eligible_prof_df.shape[0]}')
+
+                return score_eligible_prof_df
+
+            profiles_task = asyncio.ensure_future(profiles())
+
+            # Population frames of every table, after the key sets
+            async def table_frame(name, function):
+                table_df = await frame(name)
+                await profiles_task
+                return await stage(function, table_df)
+
+            work_task = asyncio.ensure_future(table_frame(
+                'work_info', self.sp.population_work_frames))
+            population_tasks = {
+                'total_exp': work_task,
+                'domain': work_task,
+                'technology_description': asyncio.ensure_future(table_frame(
+                    'employee_technology_stack',
+                    self.sp.population_skill_set_frame)),
+                'certificate_name': asyncio.ensure_future(table_frame(
+                    'certificate_info',
+                    self.sp.population_certificate_frame)),
+            }
+
+            async def population_frame(category):
+                population_dfs = await population_tasks[category]
+                return (population_dfs[category]
+                        if isinstance(population_dfs, dict)
+                        else population_dfs)
+
+            async def ratio(category):
+                population_df = await population_frame(category)
+
+                def build_ratio():
+                    self.stats.build_category(category, population_df)
+                    return self.stats.ratio(category, self.cert_active_days)
+
+                return await stage(build_ratio)
+
+            ratio_tasks = {category: asyncio.ensure_future(ratio(category))
+                           for category in population_tasks}
+
+            # Eligible rows of every frame of eligible_frames
+            async def eligible(source, name):
+                if source == 'population':
+                    frame_df = await population_frame(name)
+                else:
+                    frame_df = await frame(name)
+                await profiles_task
+                return await stage(self.sp.joins.semi_join, frame_df,
+                                   'eligible')
+
+            eligible_tasks = {
+                key: asyncio.ensure_future(eligible(source, name))
+                for key, (source, name) in {
+                    'work_agg': ('population', 'total_exp'),
+                    'domain': ('population', 'domain'),
+                    'tech': ('population', 'technology_description'),
+                    'cert': ('table', 'certificate_info'),
+                    'edu': ('table', 'education_info'),
+                    'int': ('table', 'interview_schedule')}.items()}
+
+            # Calculators do not modify their input frames, the scores
+            # running at the same time share the eligible frames
+            async def market_score(name):
+                _, frame_name, category = self.sp.MARKET_SCORE_INPUTS[name]
+                eligible_dfs = {frame_name: await eligible_tasks[frame_name]}
+                ratio_dfs = {category: await ratio_tasks[category]}
+                return await stage(self.sp.market_score, name, eligible_dfs,
+                                   ratio_dfs)
+
+            async def personal_score(name):
+                _, frame_name = self.sp.PERSONAL_SCORE_INPUTS[name]
+                eligible_dfs = {frame_name: await eligible_tasks[frame_name]}
+                score_eligible_prof_df = await profiles_task
+                return await stage(self.sp.personal_score, name,
+                                   eligible_dfs,
+                                   score_eligible_prof_df['emp_id'])
+
+            market_tasks = {
+                name: asyncio.ensure_future(market_score(name))
+                for name in self.sp.MARKET_SCORE_INPUTS}
+
+            # Fused engine reads all the eligible frames at once
+            if self.sp.personal_score_engine == 'fused':
+                async def fused_scores():
+                    eligible_dfs = {key: await task for key, task
+                                    in eligible_tasks.items()}
+                    score_eligible_prof_df = await profiles_task
+                    return await stage(self.sp.personal_scores,
+                                       eligible_dfs,
+                                       score_eligible_prof_df['emp_id'])
+
+                personal_tasks = {'fused': asyncio.ensure_future(
+                    fused_scores())}
+            else:
+                personal_tasks = {
+                    name: asyncio.ensure_future(personal_score(name))
+                    for name in self.sp.PERSONAL_SCORE_INPUTS}
+
+            pull_results = await asyncio.gather(*pulls.values())
+            market_score_dfs = dict(zip(market_tasks, await asyncio.gather(
+                *market_tasks.values())))
+            personal_score_dfs = dict(zip(
+                personal_tasks,
+                await asyncio.gather(*personal_tasks.values())))
+            score_eligible_prof_df = await profiles_task
+
+        if 'fused' in personal_score_dfs:
+            personal_score_dfs = personal_score_dfs['fused']
+
+        self.logger.info('Data pull summary -\n' + pd.DataFrame(
+            [(table, rows) for table, (rows, _) in
+             zip(pulls, pull_results)],
+            columns=['table', 'rows']).to_string(index=False))
+
+        return score_eligible_prof_df, market_score_dfs, personal_score_dfs
+
+    def __repr__(self):
+        return f'''PipelinedScorer('{self.keyspace}', {self.max_in_flight},
+                                {self.fetch_size}, {self.score_workers})'''
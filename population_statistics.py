@@ -0,0 +1,529 @@
+'''This module keeps the population statistics between the runs.
+
+Details:
+    Market scores compare a profile with the whole population. Instead of
+    recalculating the population ratios from all the profiles on every run,
+    the population count tables are kept in the stats folder and updated
+    with the changed profiles only. Contributions (category rows of every
+    profile) are split into hash partitions of emp_id, only the partitions
+    of the changed and removed profiles are read and written again.
+    The emp_id of the population (personal_info) is kept as well, so the
+    profiles removed since the last run are found without the
+    contributions. Certificate rows of the profiles which are not in the
+    population are counted, they are kept until their profile changes.
+    Approximate categories are summarized with a CategorySketch instead of
+    the count table. Sketches can be added but rows can not be removed from
+    them, so they are rebuilt on every run.
+'''
+
+import json
+import logging.config
+import os
+
+import pandas as pd
+import pyarrow as pa
+
+import segment_kernels as sk
+from category_sketch import CategorySketch
+from data_manipulation import DataManipulation
+
+# Initialize log
+logger = logging.getLogger(__name__)
+
+
+class PopulationStatistics:
+    '''PopulationStatistics class keeps population count tables
+        Functions:
+            exists
+            load
+            save
+            build
+            build_category
+            load_contributions
+            update_population
+            apply_delta
+            population_counts
+            add_counts
+            ratios
+            ratio
+            error_report
+            to_frames
+            from_frames
+    '''
+
+    # Category columns counted for every population ratio
+    CATEGORIES = {
+        'total_exp': ['total_exp'],
+        'domain': ['domain'],
+        'technology_description': ['technology_description'],
+        'certificate_name': ['certificate_name',
+                             'certificate_completion_date'],
+    }
+
+    def __init__(self, stats_folder='stats', approximate_categories=(),
+                 sketch_params=None, cert_active_days=730, partitions=16):
+        self.logger = logging.getLogger(__name__)
+        self.dm = DataManipulation()
+        self.stats_folder = stats_folder
+        self.approximate_categories = list(approximate_categories)
+        self.sketch_params = sketch_params or {}
+        self.cert_active_days = cert_active_days
+        self.partitions = partitions
+        self.contributions = {}
+        self.counts = {}
+        self.sketches = {}
+        self.population_ids = None
+        self.population_changed = False
+
+        # Contribution partitions to be written by save, all of them until
+        # the statistics are loaded with the same no. of partitions. Loaded
+        # partitions are read from the stats folder on demand.
+        self.changed_parts = set(range(partitions))
+        self.loaded_parts = set(range(partitions))
+
+    def _file_path(self, category, kind):
+        return f'{self.stats_folder}/{category}_{kind}.parquet'
+
+    def _part_path(self, category, part):
+        return (f'{self.stats_folder}/{category}_contributions/'
+                f'part-{part:05d}.parquet')
+
+    def _meta_path(self):
+        return f'{self.stats_folder}/population_statistics.json'
+
+    def _population_path(self):
+        return f'{self.stats_folder}/population_emp_ids.parquet'
+
+    @staticmethod
+    def _columns(population_frame, columns):
+        '''Returns the columns of a population frame, Arrow tables are
+                converted, the statistics are kept as dataframes'''
+        if isinstance(population_frame, pa.Table):
+            return population_frame.select(columns).to_pandas()
+
+        return population_frame[columns]
+
+    def _exact_categories(self):
+        return {category: category_cols
+                for category, category_cols in self.CATEGORIES.items()
+                if category not in self.approximate_categories}
+
+    def _sketch(self, category, population_frame):
+        '''Returns the sketch of a category of a part of the population.
+                Certificate trend period is applied on the rows, the sketch
+                can not be filtered by the completion date.'''
+        if category == 'certificate_name':
+            population_frame = self.dm.certificate_trend(
+                population_frame, active_days=self.cert_active_days)
+
+        sketch = CategorySketch(**self.sketch_params)
+        sketch.update(self._columns(population_frame, [category])[category])
+
+        return sketch
+
+    def exists(self):
+        '''Returns True when the count tables of all categories are saved.
+                Always False with approximate categories, they can not be
+                updated incrementally.'''
+        if self.approximate_categories:
+            self.logger.warning(
+                f'Approximate categories {self.approximate_categories} can '
+                f'not be updated incrementally, the population statistics '
+                f'are built from the whole population')
+            return False
+
+        return os.path.exists(self._meta_path()) and all(
+            os.path.exists(self._file_path(category, 'counts'))
+            for category in self.CATEGORIES)
+
+    def load(self):
+        '''Reads the count tables and the population emp_id from the stats
+                folder. Contributions are read by load_contributions.'''
+        with open(self._meta_path()) as f:
+            partitions = json.load(f)['partitions']
+
+        for category in self._exact_categories():
+            self.counts[category] = pd.read_parquet(
+                self._file_path(category, 'counts'))
+
+        file_path = self._population_path()
+        self.population_ids = (pd.read_parquet(file_path)['emp_id']
+                               if os.path.exists(file_path) else None)
+        self.population_changed = False
+
+        self.contributions = {}
+        self.loaded_parts = set()
+        self.changed_parts = set()
+
+        # Statistics saved with another no. of partitions are written again
+        if partitions != self.partitions:
+            self._read_parts(range(partitions))
+            self.loaded_parts = set(range(self.partitions))
+            self.changed_parts = set(range(self.partitions))
+
+        self.logger.debug(f'Population statistics loaded from '
+                          f'{self.stats_folder}')
+
+    def _read_parts(self, parts):
+        for category in self._exact_categories():
+            contribution_dfs = [pd.read_parquet(self._part_path(category,
+                                                                part))
+                                for part in parts]
+
+            if category in self.contributions:
+                contribution_dfs.insert(0, self.contributions[category])
+
+            self.contributions[category] = pd.concat(contribution_dfs,
+                                                     ignore_index=True)
+
+    def load_contributions(self, emp_ids=None):
+        '''Reads the contribution partitions of the profiles which are not
+                                                            read yet
+
+        Args:
+            emp_ids (series, optional): emp_id of the profiles. Defaults to
+                                        None (all the partitions).
+        '''
+        parts = (set(range(self.partitions)) if emp_ids is None
+                 else set(sk.emp_partitions(pd.Series(emp_ids).unique(),
+                                            self.partitions).tolist()))
+        parts -= self.loaded_parts
+
+        if parts:
+            self._read_parts(sorted(parts))
+            self.loaded_parts |= parts
+
+            self.logger.debug(f'{len(parts)} contribution partitions read')
+
+    def update_population(self, population_emp_ids):
+        '''Replaces the population emp_id and returns the profiles removed
+        from the population since the statistics are saved
+
+        Args:
+            population_emp_ids (series): emp_id of the whole population
+                                                        (personal_info)
+
+        Returns:
+            series: emp_id of the removed profiles, empty when the
+                    population of the saved statistics is not known
+        '''
+        population_ids = pd.Series(pd.unique(population_emp_ids),
+                                   name='emp_id')
+
+        if self.population_ids is None:
+            removed_ids = population_ids[:0]
+            self.population_changed = True
+        else:
+            removed_ids = self.population_ids[~self.population_ids.isin(
+                population_ids)].reset_index(drop=True)
+            self.population_changed |= not (
+                removed_ids.empty
+                and population_ids.isin(self.population_ids).all())
+
+        self.population_ids = population_ids
+
+        self.logger.debug(f'{len(removed_ids)} profiles removed from the '
+                          f'population')
+
+        return removed_ids
+
+    def save(self):
+        '''Writes the count tables and the changed contribution partitions
+                                                    into the stats folder'''
+        if not os.path.exists(self.stats_folder):
+            os.makedirs(self.stats_folder)
+
+        frames = self.to_frames()
+        population_df = frames.pop('population_emp_ids', None)
+
+        for category in self._exact_categories():
+            contribution_df = frames.pop(f'{category}_contributions', None)
+
+            # Contributions are not read when no profile is changed
+            if contribution_df is None:
+                continue
+
+            parts = sk.emp_partitions(contribution_df['emp_id'],
+                                      self.partitions)
+
+            os.makedirs(f'{self.stats_folder}/{category}_contributions',
+                        exist_ok=True)
+
+            for part in sorted(self.changed_parts):
+                file_path = self._part_path(category, part)
+                contribution_df[parts == part].to_parquet(
+                    f'{file_path}.tmp', index=False)
+                os.replace(f'{file_path}.tmp', file_path)
+
+        # Population emp_id is written only when a profile is added or
+        # removed
+        if population_df is not None and self.population_changed:
+            frames['population_emp_ids'] = population_df
+
+        for name in frames:
+            file_path = f'{self.stats_folder}/{name}.parquet'
+            frames[name].to_parquet(f'{file_path}.tmp', index=False)
+            os.replace(f'{file_path}.tmp', file_path)
+
+        with open(f'{self._meta_path()}.tmp', 'w') as f:
+            json.dump({'partitions': self.partitions}, f, indent=4)
+        os.replace(f'{self._meta_path()}.tmp', self._meta_path())
+
+        self.logger.debug(f'Population statistics saved into '
+                          f'{self.stats_folder} - {len(self.changed_parts)} '
+                          f'contribution partitions')
+
+        self.changed_parts = set()
+        self.population_changed = False
+
+    def build(self, population_frames, population_emp_ids=None):
+        '''Builds the count tables from the whole population
+
+        Args:
+            population_frames (dict): emp_id and category columns of every
+                                        population profile for every category
+            population_emp_ids (series, optional): emp_id of the whole
+                                        population (personal_info), kept to
+                                        find the removed profiles. Defaults
+                                        to None.
+        '''
+        for category in self.CATEGORIES:
+            self.build_category(category, population_frames[category])
+
+        if population_emp_ids is not None:
+            self.update_population(population_emp_ids)
+
+    def build_category(self, category, population_frame):
+        '''Builds the count table (sketch) of one category from the whole
+        population, so a category can be built as soon as its frame is ready
+
+        Args:
+            category (str): category of CATEGORIES
+            population_frame (dataframe): emp_id and category columns of
+                                        every population profile
+        '''
+        if category in self.approximate_categories:
+            self.sketches[category] = self._sketch(category,
+                                                   population_frame)
+            return
+
+        category_cols = self.CATEGORIES[category]
+        self.contributions[category] = self._columns(
+            population_frame, ['emp_id'] + category_cols).reset_index(
+                drop=True)
+        self.counts[category] = self.dm.category_counts(
+            self.contributions[category], category_cols)
+
+    def apply_delta(self, emp_ids, population_frames, removed_emp_ids=None):
+        '''Replaces the contributions of the changed and removed profiles
+        and updates the count tables with the difference. Only the
+        contribution partitions of these profiles are read.
+
+        Args:
+            emp_ids (series): emp_id of the changed profiles
+            population_frames (dict): emp_id and category columns of the
+                                        changed and removed profiles for
+                                        every category. Removed profiles
+                                        have only their certificate rows.
+            removed_emp_ids (series, optional): emp_id of the profiles
+                                        removed from the population, see
+                                        update_population. Defaults to None.
+        '''
+        new_contribution_dfs = {
+            category: self._columns(population_frames[category],
+                                    ['emp_id'] + category_cols)
+            for category, category_cols in self._exact_categories().items()}
+
+        if removed_emp_ids is not None:
+            emp_ids = pd.concat([pd.Series(emp_ids),
+                                 pd.Series(removed_emp_ids)])
+
+        self.load_contributions(pd.concat(
+            [pd.Series(emp_ids)]
+            + [contribution_df['emp_id']
+               for contribution_df in new_contribution_dfs.values()]))
+
+        for category, category_cols in self._exact_categories().items():
+            contribution_df = self.contributions[category]
+            changed = contribution_df['emp_id'].isin(emp_ids)
+
+            old_count_df = self.dm.category_counts(
+                contribution_df[changed], category_cols)
+
+            new_contribution_df = new_contribution_dfs[category]
+            new_count_df = self.dm.category_counts(
+                new_contribution_df, category_cols)
+
+            count_df = pd.concat(
+                [self.counts[category],
+                 old_count_df.assign(count=-old_count_df['count']),
+                 new_count_df], ignore_index=True)
+
+            count_df = (count_df.groupby(category_cols, observed=True)
+                        ['count'].sum().reset_index())
+            self.counts[category] = count_df[
+                count_df['count'] > 0].reset_index(drop=True)
+
+            self.contributions[category] = pd.concat(
+                [contribution_df[~changed], new_contribution_df],
+                ignore_index=True)
+
+            self.changed_parts.update(sk.emp_partitions(
+                pd.concat([contribution_df['emp_id'][changed],
+                           new_contribution_df['emp_id']]).unique(),
+                self.partitions).tolist())
+
+            self.logger.debug(f'{category} - {changed.sum()} old and '
+                              f'{new_contribution_df.shape[0]} new rows')
+
+    def population_counts(self, population_frames):
+        '''Returns the count tables of a part of the population
+
+        Args:
+            population_frames (dict): emp_id and category columns of a part
+                                        of the population for every category
+
+        Returns:
+            dict: count dataframe (sketch for the approximate categories)
+                                                        for every category
+        '''
+        count_dfs = {
+            category: self._sketch(category, population_frames[category])
+            for category in self.approximate_categories}
+
+        count_dfs.update({
+            category: self.dm.category_counts(
+                self._columns(population_frames[category],
+                              ['emp_id'] + category_cols), category_cols)
+            for category, category_cols in self._exact_categories().items()})
+
+        return count_dfs
+
+    def add_counts(self, count_dfs):
+        '''Adds the count tables of a part of the population into the count
+        tables. Contributions are not kept, the profiles of the parts must
+        not overlap.
+
+        Args:
+            count_dfs (dict): output of population_counts
+        '''
+        for category in self.approximate_categories:
+            if category in self.sketches:
+                self.sketches[category].merge(count_dfs[category])
+            else:
+                self.sketches[category] = count_dfs[category]
+
+        for category, category_cols in self._exact_categories().items():
+            count_df = count_dfs[category]
+
+            if category in self.counts:
+                count_df = pd.concat([self.counts[category], count_df],
+                                     ignore_index=True)
+                count_df = (count_df.groupby(category_cols, observed=True)
+                            ['count'].sum().reset_index())
+
+            self.counts[category] = count_df
+
+    def ratios(self, cert_active_days=730):
+        '''Calculates the population ratio of every category
+
+        Args:
+            cert_active_days (int, optional): certificates completed within
+                                these days are considered as trend.
+                                Defaults to 730 (2 years). Trend period of
+                                the approximate certificate_name is applied
+                                while it is counted.
+
+        Returns:
+            dict: ratio dataframe for every category
+        '''
+        return {category: self.ratio(category, cert_active_days)
+                for category in self.approximate_categories
+                + list(self._exact_categories())}
+
+    def ratio(self, category, cert_active_days=730):
+        '''Calculates the population ratio of one category
+
+        Args:
+            category (str): category of CATEGORIES
+            cert_active_days (int, optional): certificate trend period, see
+                                                ratios. Defaults to 730.
+
+        Returns:
+            dataframe: category and {category}_ratio columns
+        '''
+        if category in self.approximate_categories:
+            return self.sketches[category].ratio_frame(category)
+
+        return self._exact_ratio(category, self.counts[category],
+                                 cert_active_days)
+
+    def _exact_ratio(self, category, count_df, cert_active_days):
+        if category == 'certificate_name':
+            count_df = self.dm.certificate_trend(
+                count_df, active_days=cert_active_days)
+
+        return self.dm.counts_ratio(count_df, category)
+
+    def error_report(self, population_frames):
+        '''Compares the approximate ratios with the exact ratios of the
+        population
+
+        Args:
+            population_frames (dict): emp_id and category columns of every
+                                        population profile for every category
+
+        Returns:
+            dict: error dataframe for every approximate category
+        '''
+        return {
+            category: self.sketches[category].error_report(
+                self._exact_ratio(
+                    category,
+                    self.dm.category_counts(
+                        self._columns(population_frames[category],
+                                      self.CATEGORIES[category]),
+                        self.CATEGORIES[category]),
+                    self.cert_active_days),
+                category)
+            for category in self.approximate_categories}
+
+    def to_frames(self):
+        '''Returns the contributions and count tables as dict of dataframes'''
+        frames = {}
+
+        for category in self._exact_categories():
+            if category in self.contributions:
+                frames[f'{category}_contributions'] = self.contributions[
+                    category]
+            frames[f'{category}_counts'] = self.counts[category]
+
+        if self.population_ids is not None:
+            frames['population_emp_ids'] = self.population_ids.to_frame(
+                'emp_id')
+
+        for category in self.approximate_categories:
+            for name, frame in self.sketches[category].to_frames().items():
+                frames[f'{category}_sketch_{name}'] = frame
+
+        return frames
+
+    def from_frames(self, frames):
+        '''Sets the contributions and count tables from to_frames output.
+                Contributions and population emp_id are optional, only
+                apply_delta and update_population need them.'''
+        if 'population_emp_ids' in frames:
+            self.population_ids = frames['population_emp_ids']['emp_id']
+            self.population_changed = True
+
+        for category in self._exact_categories():
+            if f'{category}_contributions' in frames:
+                self.contributions[category] = frames[
+                    f'{category}_contributions']
+            self.counts[category] = frames[f'{category}_counts']
+
+        for category in self.approximate_categories:
+            self.sketches[category] = CategorySketch.from_frames(
+                {name: frames[f'{category}_sketch_{name}']
+                 for name in ('table', 'candidates')},
+                self.sketch_params.get('heavy_hitters', 200))
@@ -0,0 +1,191 @@
+'''This module builds the pull queries from data_file_meta_data.json
+
+Details:
+    Only the tables of the data files are pulled and only the columns which
+    are read by the score calculation
+        table_name   - cassandra table of the data file
+        rel_cols     - projected columns, all the columns when not given.
+                       Primary key and updated_time columns are always
+                       pulled, the incremental pull upserts by them.
+        pull_filters - optional row filters [column, operator, value] of
+                       the rows which no score uses. Operators are =, <, <=,
+                       >, >= and in. Value {"days": n} is the time n days
+                       before the pull (updated_time windows).
+    Filters are pushed into the CQL where clause when the table schema
+    allows it, otherwise the rows are pulled and the filter is skipped
+        partition key columns - not pushed, tables are scanned by token
+                                ranges
+        in                    - clustering columns only
+        other operators       - clustering and regular columns with ALLOW
+                                FILTERING (the full scan reads every row
+                                anyway), = on indexed columns without it
+'''
+
+import logging.config
+from datetime import datetime, timedelta, timezone
+
+# Initialize log
+logger = logging.getLogger(__name__)
+
+
+def cql_literal(value):
+    '''Returns the CQL literal of a filter value'''
+    if isinstance(value, dict):
+        value = (datetime.now(timezone.utc)
+                 - timedelta(days=value['days'])).strftime(
+                     '%Y-%m-%d %H:%M:%S+0000')
+
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+
+    if isinstance(value, (list, tuple)):
+        return f'({", ".join(cql_literal(item) for item in value)})'
+
+    if isinstance(value, str):
+        return "'" + value.replace("'", "''") + "'"
+
+    return repr(value)
+
+
+class PullPlanner:
+    '''PullPlanner class builds the projected pull queries
+        Functions:
+            projection
+            pushdown
+            table_queries
+    '''
+
+    OPERATORS = ('=', '<', '<=', '>', '>=', 'in')
+
+    def __init__(self, data_file_details, allow_filtering=True,
+                 watermark_col='updated_time'):
+        self.logger = logging.getLogger(__name__)
+        self.data_file_details = data_file_details
+        self.allow_filtering = allow_filtering
+        self.watermark_col = watermark_col
+
+    def projection(self, table_meta, rel_cols=None):
+        '''Returns the columns to be pulled from a table
+
+        Args:
+            table_meta (obj): table metadata of the cassandra driver
+            rel_cols (list, optional): columns read by the score calculation.
+                                        Defaults to None (all the columns).
+
+        Returns:
+            list: column names, None when all the columns are pulled
+        '''
+        if not rel_cols:
+            return None
+
+        missing_cols = [column for column in rel_cols
+                        if column not in table_meta.columns]
+        if missing_cols:
+            self.logger.warning(f'{table_meta.name} has no columns '
+                                f'{missing_cols}')
+
+        columns = [column for column in rel_cols
+                   if column in table_meta.columns]
+
+        # Primary key and watermark columns are needed by the upserts of
+        # the incremental pull
+        for column in ([column.name for column in table_meta.primary_key]
+                       + [self.watermark_col]):
+            if column in table_meta.columns and column not in columns:
+                columns.append(column)
+
+        return columns
+
+    def pushdown(self, table_meta, pull_filters=None):
+        '''Returns the where clause conditions of the filters which the table
+                                                                schema allows
+
+        Args:
+            table_meta (obj): table metadata of the cassandra driver
+            pull_filters (list, optional): [column, operator, value] filters.
+                                            Defaults to None (no filter).
+
+        Returns:
+            tuple: conditions (list) and whether ALLOW FILTERING is needed
+        '''
+        partition_cols = {column.name for column in table_meta.partition_key}
+        clustering_cols = {column.name
+                           for column in table_meta.clustering_key}
+        indexed_cols = {index.index_options.get('target')
+                        for index in table_meta.indexes.values()}
+
+        conditions = []
+        allow_filtering = False
+
+        for column, operator, value in pull_filters or []:
+            operator = operator.lower()
+
+            if (column not in table_meta.columns
+                    or operator not in self.OPERATORS
+                    or column in partition_cols
+                    or (operator == 'in' and column not in clustering_cols)
+                    or (not self.allow_filtering
+                        and not (operator == '=' and column in indexed_cols))):
+                self.logger.info(f'{table_meta.name} - filter {column} '
+                                 f'{operator} {value} is not pushed down')
+                continue
+
+            conditions.append(f'{column} {operator.upper()} '
+                              f'{cql_literal(value)}')
+
+            if not (operator == '=' and column in indexed_cols):
+                allow_filtering = True
+
+        return conditions, allow_filtering
+
+    def table_queries(self, keyspace_meta, tables=None):
+        '''Returns the projected query of the tables of the data files
+
+        Args:
+            keyspace_meta (obj): keyspace metadata of the cassandra driver
+            tables (list, optional): tables to be pulled, the tables which
+                                    are not data files are skipped.
+                                    Defaults to None (all the data files).
+
+        Returns:
+            dict: query for every table
+        '''
+        data_files = {details['table_name']: details
+                      for details in self.data_file_details.values()
+                      if 'table_name' in details}
+
+        if tables is None:
+            tables = list(data_files)
+
+        skipped_tables = [table for table in tables
+                          if table not in data_files]
+        if skipped_tables:
+            self.logger.info(f'Tables not used by the scores are not pulled '
+                             f'- {skipped_tables}')
+
+        table_queries = {}
+
+        for table in tables:
+            if table not in data_files:
+                continue
+
+            details = data_files[table]
+            table_meta = keyspace_meta.tables[table]
+
+            columns = self.projection(table_meta, details.get('rel_cols'))
+            conditions, allow_filtering = self.pushdown(
+                table_meta, details.get('pull_filters'))
+
+            query = (f'SELECT {", ".join(columns) if columns else "*"} '
+                     f'FROM {table}')
+            if conditions:
+                query += f' WHERE {" AND ".join(conditions)}'
+            if allow_filtering:
+                query += ' ALLOW FILTERING'
+
+            table_queries[table] = query
+
+        return table_queries
+
+    def __repr__(self):
+        return f"PullPlanner({self.allow_filtering}, '{self.watermark_col}')"
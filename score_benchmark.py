@@ -0,0 +1,348 @@
+'''This module benchmarks the score calculation stages on synthetic data.
+
+Details:
+    Synthetic data of every population size is generated by synthetic_data.py
+    into {benchmark_folder}/data/{size} when it is not found. Every stage is
+    run on its own copy of the inputs and measured
+        wall_seconds - elapsed time
+        cpu_seconds  - cpu time of the process
+        peak_mb      - peak memory allocated by the stage (tracemalloc,
+                       numpy and pandas allocations are traced, and the
+                       peak of the Arrow memory pool)
+        rows         - no. of output rows
+    Stages are the data file loads and the stages of the full score mode
+    of effulgenz_score.py (ScorePipeline): population_frames, the
+    population statistics and the ratio of every population category,
+    eligible_frames, every market and personal score and the fused
+    personal scores. Results are compared with the saved baseline, a
+    stage which is slower or uses more memory than the baseline by more
+    than the tolerance is a regression.
+    The arrow backend runs the stages on Arrow tables (arrow_backend.py),
+    its results are kept as size {size}_arrow. Fused personal scores take
+    pandas dataframes only, they are not run by the arrow backend.
+    The lean mode runs the calculators in their lean mode ({size}_lean).
+    Its stages read the inputs without copying them, a stage which
+    modifies its inputs is a regression. Every stage is also compared with
+    the baseline of the same size and backend without the lean mode, so a
+    lean stage which is slower or uses more memory is a regression.
+
+    Ex. python score_benchmark.py --sizes 10k,1m --save-baseline
+        python score_benchmark.py --sizes 10k,1m
+        python score_benchmark.py --sizes 10k,1m --backend arrow
+        python score_benchmark.py --sizes 10k,1m --lean
+'''
+
+import argparse
+import json
+import logging.config
+import os
+import platform
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+import pandas as pd
+import pyarrow as pa
+
+from parquet_loader import ParquetLoader
+from population_statistics import PopulationStatistics
+from score_pipeline import ScorePipeline
+from synthetic_data import SIZES, SyntheticData
+
+# Initialize log
+logger = logging.getLogger(__name__)
+
+
+class ScoreBenchmark:
+    '''ScoreBenchmark class measures the score calculation stages
+        Functions:
+            stage
+            run
+            compare
+    '''
+
+    # Stages shorter than this are not compared, their time is mostly noise
+    MIN_COMPARE_SECONDS = 0.1
+
+    # Arrow memory pools of the stages
+    MEMORY_POOLS = []
+
+    def __init__(self, data_file_details, data_folder, backend='pandas',
+                 lean=False):
+        self.logger = logging.getLogger(__name__)
+        self.loader = ParquetLoader(data_file_details, data_folder)
+        self.backend = backend
+        self.lean = lean
+        self.sp = ScorePipeline(lean=lean, backend=backend)
+        self.results = {}
+
+    @classmethod
+    def _copy(cls, arg):
+        '''Copies the dataframes of a stage input, dict of frames (Ex.
+                                eligible frames) are copied frame by frame'''
+        if isinstance(arg, pd.DataFrame):
+            return arg.copy()
+        if isinstance(arg, dict):
+            return {key: cls._copy(value) for key, value in arg.items()}
+
+        return arg
+
+    @classmethod
+    def _changed(cls, arg, arg_copy):
+        if isinstance(arg, pd.DataFrame):
+            return not arg.equals(arg_copy)
+        if isinstance(arg, dict):
+            return any(cls._changed(value, arg_copy[key])
+                       for key, value in arg.items())
+
+        return False
+
+    def stage(self, name, function, *args):
+        '''Runs a stage and keeps its measurements
+
+        Args:
+            name (str): stage name
+            function (function): stage function
+            *args: inputs of the stage, dataframes (also in dicts) are
+                        copied so the stages which modify their inputs do
+                        not change the others.
+                        Arrow tables are immutable, they are not copied.
+                        In the lean mode the stages read the inputs, the
+                        copies are compared with them after the stage.
+
+        Returns:
+            output of the stage
+        '''
+        copies = [self._copy(arg) for arg in args]
+        if not self.lean:
+            args = copies
+
+        # Arrow allocations are not traced by tracemalloc, they are counted
+        # by a proxy pool of the stage. Buffers of the stage are released
+        # through their pool, so the pools are never released.
+        default_pool = pa.default_memory_pool()
+        stage_pool = pa.proxy_memory_pool(default_pool)
+        self.MEMORY_POOLS.append(stage_pool)
+        pa.set_memory_pool(stage_pool)
+
+        tracemalloc.start()
+        start_cpu = time.process_time()
+        start = time.perf_counter()
+
+        output = function(*args)
+
+        wall_seconds = time.perf_counter() - start
+        cpu_seconds = time.process_time() - start_cpu
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        pa.set_memory_pool(default_pool)
+        peak += max(stage_pool.max_memory() or 0, 0)
+
+        self.results[name] = {
+            'wall_seconds': round(wall_seconds, 4),
+            'cpu_seconds': round(cpu_seconds, 4),
+            'peak_mb': round(peak / 1024 ** 2, 2),
+            'rows': len(output) if hasattr(output, '__len__') else None,
+        }
+
+        if self.lean:
+            self.results[name]['inputs_changed'] = any(
+                self._changed(arg, arg_copy)
+                for arg, arg_copy in zip(args, copies))
+        self.logger.info(f'{name} - {self.results[name]}')
+
+        return output
+
+    def run(self):
+        '''Runs all the stages
+
+        Returns:
+            dict: measurements of every stage
+        '''
+        self.results = {}
+        sp = self.sp
+
+        # Personal info is a dataframe in both backends as in
+        # effulgenz_score.py
+        load = (self.loader.load_table if self.backend == 'arrow'
+                else self.loader.load)
+        data_dfs = {
+            name: self.stage(f'load_{name}', self.loader.load
+                             if name == 'personal_info' else load, name)
+            for name in self.loader.data_file_details}
+
+        personal_info_df = data_dfs['personal_info']
+        score_eligible_prof_df = personal_info_df[
+            personal_info_df.recalculate_score_eligible == 'Y']
+
+        population_dfs = self.stage(
+            'population_frames', sp.population_frames, personal_info_df,
+            data_dfs['work_info'], data_dfs['employee_technology_stack'],
+            data_dfs['certificate_info'])
+
+        stats = PopulationStatistics()
+        self.stage('population_statistics', stats.build, population_dfs)
+
+        # Last 2 years completed certificates are considered as trend
+        ratio_dfs = {
+            category: self.stage(f'category_ratio_{category}', stats.ratio,
+                                 category, 730)
+            for category in stats.CATEGORIES}
+
+        eligible_dfs = self.stage(
+            'eligible_frames', sp.eligible_frames, score_eligible_prof_df,
+            population_dfs, data_dfs['certificate_info'],
+            data_dfs['education_info'], data_dfs['interview_schedule'])
+
+        for name in sp.MARKET_SCORE_INPUTS:
+            self.stage(f'market_{name[:-len("_df")]}', sp.market_score, name,
+                       eligible_dfs, ratio_dfs)
+
+        for name in sp.PERSONAL_SCORE_INPUTS:
+            self.stage(f'personal_{name[:-len("_df")]}', sp.personal_score,
+                       name, eligible_dfs)
+
+        if self.backend != 'arrow':
+            self.stage('personal_fused', sp.fused_personal_scores,
+                       eligible_dfs)
+
+        return self.results
+
+    def compare(self, results, baseline_results, tolerance=0.25):
+        '''Compares the measurements with the baseline
+
+        Args:
+            results (dict): output of run
+            baseline_results (dict): output of run of the baseline
+            tolerance (float, optional): allowed increase of the time and
+                                memory compared with the baseline.
+                                Defaults to 0.25 (25%).
+
+        Returns:
+            list: regression messages
+        '''
+        regressions = []
+
+        for name, result in results.items():
+            baseline = baseline_results.get(name)
+            if baseline is None:
+                continue
+
+            if (baseline['wall_seconds'] >= self.MIN_COMPARE_SECONDS
+                    and result['wall_seconds']
+                    > baseline['wall_seconds'] * (1 + tolerance)):
+                regressions.append(
+                    f'{name} - {result["wall_seconds"]}s, baseline '
+                    f'{baseline["wall_seconds"]}s')
+
+            if (baseline['peak_mb'] > 0
+                    and result['peak_mb']
+                    > baseline['peak_mb'] * (1 + tolerance)):
+                regressions.append(
+                    f'{name} - {result["peak_mb"]} MB, baseline '
+                    f'{baseline["peak_mb"]} MB')
+
+        return regressions
+
+
+def main():
+    '''Runs the benchmark of every population size'''
+    parser = argparse.ArgumentParser(
+        description='Benchmarks the score calculation stages on synthetic '
+                    'data.')
+    parser.add_argument('--sizes', default='10k',
+                        help=f'comma separated sizes, {list(SIZES)} or no. '
+                             f'of employees')
+    parser.add_argument('--benchmark-folder', default='benchmark')
+    parser.add_argument('--baseline', default=None,
+                        help='baseline file, default is '
+                             '{benchmark_folder}/baseline.json')
+    parser.add_argument('--save-baseline', action='store_true',
+                        help='saves the results as the baseline')
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    parser.add_argument('--backend', default='pandas',
+                        choices=['pandas', 'arrow'],
+                        help='calculator inputs, pandas dataframes or Arrow '
+                             'tables')
+    parser.add_argument('--lean', action='store_true',
+                        help='runs the calculators in the lean mode and '
+                             'compares them with the baseline without it')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s - %(name)s - %(message)s')
+
+    with open('data_file_meta_data.json') as f:
+        data_file_details = json.load(f)
+
+    baseline_path = args.baseline or f'{args.benchmark_folder}/baseline.json'
+    baseline = {}
+    if os.path.exists(baseline_path):
+        with open(baseline_path) as f:
+            baseline = json.load(f)
+
+    report = {
+        'run': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'pyarrow': pa.__version__,
+        'sizes': {},
+    }
+    regressions = []
+
+    for size in args.sizes.split(','):
+        size = size.strip().lower()
+        employees = SIZES.get(size) or int(size)
+        data_folder = f'{args.benchmark_folder}/data/{size}'
+
+        if not os.path.exists(data_folder):
+            logger.info(f'Synthetic data of {employees} employees is '
+                        f'generated into {data_folder}')
+            SyntheticData(data_file_details, data_folder,
+                          args.seed).generate(employees)
+
+        benchmark = ScoreBenchmark(data_file_details, data_folder,
+                                   args.backend, args.lean)
+        full_size = (size if args.backend == 'pandas'
+                     else f'{size}_{args.backend}')
+        result_size = f'{full_size}_lean' if args.lean else full_size
+        report['sizes'][result_size] = benchmark.run()
+
+        regressions += [
+            f'{result_size} {name} - inputs are modified'
+            for name, result in report['sizes'][result_size].items()
+            if result.get('inputs_changed')]
+
+        compared_sizes = [result_size]
+        if args.lean:
+            compared_sizes.append(full_size)
+
+        for compared_size in compared_sizes:
+            regressions += [
+                f'{result_size} {regression}' for regression in
+                benchmark.compare(
+                    report['sizes'][result_size],
+                    baseline.get('sizes', {}).get(compared_size, {}),
+                    args.tolerance)]
+
+    os.makedirs(args.benchmark_folder, exist_ok=True)
+    with open(f'{args.benchmark_folder}/results.json', 'w') as f:
+        json.dump(report, f, indent=2)
+
+    if args.save_baseline:
+        with open(baseline_path, 'w') as f:
+            json.dump(report, f, indent=2)
+        logger.info(f'Baseline saved into {baseline_path}')
+        return 0
+
+    for regression in regressions:
+        logger.warning(f'Regression: {regression}')
+
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,424 @@
+'''This module defines the stages of the score calculation.
+
+Details:
+    The stages are shared by the full and incremental score modes of
+    effulgenz_score.py
+        population_frames - population profile categories for the ratios
+        eligible_frames   - score eligible rows of the tables
+        market_scores     - market score of the eligible profiles
+        personal_scores   - personal score of the eligible profiles
+        merge_scores      - merges rescored profiles into previous scores
+    Population frames, market scores and personal scores are also defined
+    one table / score at a time, so the pipelined mode runs every score as
+    soon as its tables are pulled.
+    In the lean mode the score dataframes have only emp_id and the score
+    columns of the score store.
+    The arrow backend takes the tables as Arrow tables (see
+    arrow_backend.py), the stages and the scores are Arrow tables then.
+'''
+
+import logging.config
+
+import pandas as pd
+import pyarrow as pa
+
+import arrow_backend as ab
+from data_manipulation import DataManipulation
+from join_planner import JoinPlanner
+from market_score_calculator import MarketScoreCalculator
+from personal_score_calculator import PersonalScoreCalculator
+
+# Initialize log
+logger = logging.getLogger(__name__)
+
+
+class ScorePipeline:
+    '''ScorePipeline class defines the score calculation stages
+        Functions:
+            population_frames
+            population_work_frames
+            population_skill_set_frame
+            population_certificate_frame
+            eligible_frames
+            market_scores
+            market_score
+            personal_scores
+            personal_score
+            fused_personal_scores
+            interview_scores
+            merge_scores
+    '''
+
+    MARKET_SCORE_FILES = {
+        'tot_exp_score_df': 'MS_Total_Experience_With_Population_Score',
+        'domain_score_df': 'MS_Domain_With_Population_Score',
+        'skill_set_score_df': 'MS_Skillset_With_Population_Score',
+        'cert_trend_score_df': 'MS_Certificate_Trend_Score',
+    }
+
+    PERSONAL_SCORE_FILES = {
+        'education_score_df': 'PS_Education_Score',
+        'valid_cert_score_df': 'PS_Certificate_Score',
+        'domain_score_df': 'PS_Domain_Score',
+        'reliablity_score_df': 'PS_Reliability_Score',
+        'skill_set_score_df': 'PS_Skill_Set_Score',
+        'interview_score_df': 'PS_Interview_Score',
+    }
+
+    # Calculator method, eligible frame and population category of every
+    # market score
+    MARKET_SCORE_INPUTS = {
+        'tot_exp_score_df': ('total_exp_with_population', 'work_agg',
+                             'total_exp'),
+        'domain_score_df': ('domain_with_population', 'domain', 'domain'),
+        'skill_set_score_df': ('skill_set_with_population', 'tech',
+                               'technology_description'),
+        'cert_trend_score_df': ('certificate_with_trend', 'cert',
+                                'certificate_name'),
+    }
+
+    # Calculator method and eligible frame of every personal score
+    PERSONAL_SCORE_INPUTS = {
+        'education_score_df': ('education_score', 'edu'),
+        'valid_cert_score_df': ('valid_certificate_score', 'cert'),
+        'domain_score_df': ('domain_score', 'work_agg'),
+        'reliablity_score_df': ('reliablity_score', 'work_agg'),
+        'skill_set_score_df': ('skill_set_score', 'tech'),
+        'interview_score_df': (None, 'int'),
+    }
+
+    # Score columns of the fused personal scores for every score dataframe
+    FUSED_SCORE_COLUMNS = {
+        'valid_cert_score_df': ['no_of_certs', 'cert_score'],
+        'domain_score_df': ['total_exp', 'total_switch', 'switch_rel',
+                            'no_of_domain', 'domain_score'],
+        'reliablity_score_df': ['total_exp', 'total_switch', 'switch_rel',
+                                'no_of_domain', 'switch_rel_count',
+                                'rel_score1', 'rel_score2'],
+        'skill_set_score_df': ['tech_count', 'skill_set_score'],
+        'interview_score_df': ['interview_score'],
+    }
+
+    # Work aggregation columns of the fused personal scores in the lean mode,
+    # same as the lean pandas engine
+    LEAN_FUSED_SCORE_COLUMNS = dict(
+        FUSED_SCORE_COLUMNS,
+        domain_score_df=['no_of_domain', 'domain_score'],
+        reliablity_score_df=['total_exp', 'total_switch', 'switch_rel',
+                             'switch_rel_count', 'rel_score1', 'rel_score2'])
+
+    def __init__(self, personal_score_engine='pandas', interview_state=None,
+                 lean=False, backend='pandas'):
+        self.logger = logging.getLogger(__name__)
+
+        if backend == 'arrow' and personal_score_engine == 'fused':
+            raise ValueError('Fused personal score engine takes pandas '
+                             'dataframes, it can not be used with the arrow '
+                             'backend')
+
+        self.personal_score_engine = personal_score_engine
+        self.interview_state = interview_state
+        self.lean = lean
+        self.backend = backend
+        self.dm = DataManipulation()
+        self.msc = MarketScoreCalculator(lean)
+        self.psc = PersonalScoreCalculator(lean)
+        self.joins = JoinPlanner()
+
+    def population_frames(self, personal_info_df, work_df,
+                          technology_stack_df, certificate_df):
+        '''Returns the population categories used for the population ratios
+
+        Args:
+            personal_info_df (dataframe): population personal data
+            work_df (dataframe): work data
+            technology_stack_df (dataframe): technology stack data
+            certificate_df (dataframe): certificate data
+
+        Returns:
+            dict: emp_id and category columns for every category,
+                    total_exp is the whole work aggregation of the population
+        '''
+        self.joins.key_set('population', personal_info_df['emp_id'])
+
+        population_dfs = self.population_work_frames(work_df)
+        population_dfs['technology_description'] = (
+            self.population_skill_set_frame(technology_stack_df))
+        population_dfs['certificate_name'] = (
+            self.population_certificate_frame(certificate_df))
+
+        return population_dfs
+
+    def population_work_frames(self, work_df):
+        '''Returns the work aggregation and domains of the population, the
+        population key set is registered by population_frames.
+            No population time limit filter for exp and domain score.
+
+        Args:
+            work_df (dataframe): work data
+
+        Returns:
+            dict: total_exp (work aggregation) and domain dataframes
+        '''
+        population_work_df = self.joins.semi_join(work_df, 'population')
+
+        population_work_agg_df = self.dm.work_aggregation(population_work_df)
+
+        if isinstance(population_work_df, pa.Table):
+            population_domain_df = ab.drop_duplicates(population_work_df,
+                                                      ['emp_id', 'domain'])
+        else:
+            population_domain_df = population_work_df[[
+                'emp_id', 'domain']].drop_duplicates()
+
+        return {
+            'total_exp': population_work_agg_df,
+            'domain': population_domain_df,
+        }
+
+    def population_skill_set_frame(self, technology_stack_df):
+        '''Returns the skill sets of the population.
+            No population time limit filter for Skillset score.
+
+        Args:
+            technology_stack_df (dataframe): technology stack data
+
+        Returns:
+            dataframe: emp_id and technology_description
+        '''
+        if isinstance(technology_stack_df, pa.Table):
+            return ab.drop_duplicates(
+                self.joins.semi_join(technology_stack_df, 'population'),
+                ['emp_id', 'technology_description'])
+
+        return self.joins.semi_join(
+            technology_stack_df[['emp_id', 'technology_description']],
+            'population').drop_duplicates()
+
+    def population_certificate_frame(self, certificate_df):
+        '''Returns the certificates of the population certificate trend.
+            Trend period is applied on the certificate completion date
+            while calculating the ratio.
+
+        Args:
+            certificate_df (dataframe): certificate data
+
+        Returns:
+            dataframe: emp_id, certificate_name and completion date
+        '''
+        certificate_cols = ['emp_id', 'certificate_name',
+                            'certificate_completion_date']
+
+        if isinstance(certificate_df, pa.Table):
+            return certificate_df.select(certificate_cols)
+
+        return certificate_df[certificate_cols]
+
+    def eligible_frames(self, score_eligible_prof_df, population_dfs,
+                        certificate_df, education_df, interview_schedule_df):
+        '''Returns the rows of the score eligible profiles from the
+        population frames and the other tables.
+            Score eligible profiles are part of the population, so their work
+            aggregation, domains and skill sets are taken from the population
+            frames instead of joining and aggregating again.
+
+        Args:
+            score_eligible_prof_df (dataframe): score eligible personal data
+            population_dfs (dict): output of population_frames
+            certificate_df (dataframe): certificate data
+            education_df (dataframe): education data
+            interview_schedule_df (dataframe): interview data
+
+        Returns:
+            dict: score eligible rows of every table
+        '''
+        self.joins.key_set('eligible', score_eligible_prof_df['emp_id'])
+
+        return {
+            'work_agg': self.joins.semi_join(population_dfs['total_exp'],
+                                             'eligible'),
+            'domain': self.joins.semi_join(population_dfs['domain'],
+                                           'eligible'),
+            'tech': self.joins.semi_join(
+                population_dfs['technology_description'], 'eligible'),
+            'cert': self.joins.semi_join(certificate_df, 'eligible'),
+            'edu': self.joins.semi_join(education_df, 'eligible'),
+            'int': self.joins.semi_join(interview_schedule_df, 'eligible'),
+        }
+
+    def market_scores(self, eligible_dfs, ratio_dfs):
+        '''Calculates the market scores of the eligible profiles
+
+        Args:
+            eligible_dfs (dict): output of eligible_frames
+            ratio_dfs (dict): population ratio for every category
+
+        Returns:
+            dict: market score dataframes
+        '''
+        return {name: self.market_score(name, eligible_dfs, ratio_dfs)
+                for name in self.MARKET_SCORE_INPUTS}
+
+    def market_score(self, name, eligible_dfs, ratio_dfs):
+        '''Calculates one market score of the eligible profiles
+
+        Args:
+            name (str): score dataframe name of MARKET_SCORE_INPUTS
+            eligible_dfs (dict): eligible frames, only the frame of the
+                                    score is needed
+            ratio_dfs (dict): population ratios, only the category of the
+                                    score is needed
+
+        Returns:
+            dataframe: market score dataframe
+        '''
+        method, frame, category = self.MARKET_SCORE_INPUTS[name]
+
+        self.logger.debug(f'{name} is processing...')
+        score_df = getattr(self.msc, method)(
+            eligible_dfs[frame], ratio_dfs[category], category)
+        self.logger.debug(f'{name} is completed.')
+
+        return score_df
+
+    def personal_scores(self, eligible_dfs, emp_ids=None):
+        '''Calculates the personal scores of the eligible profiles
+
+        Args:
+            eligible_dfs (dict): output of eligible_frames
+            emp_ids (series, optional): emp_id of the score eligible
+                        profiles, used by the interview score state.
+                        Defaults to None.
+
+        Returns:
+            dict: personal score dataframes
+        '''
+        if self.personal_score_engine == 'fused':
+            return self.fused_personal_scores(eligible_dfs, emp_ids)
+
+        return {name: self.personal_score(name, eligible_dfs, emp_ids)
+                for name in self.PERSONAL_SCORE_INPUTS}
+
+    def personal_score(self, name, eligible_dfs, emp_ids=None):
+        '''Calculates one personal score of the eligible profiles with the
+        pandas engine
+
+        Args:
+            name (str): score dataframe name of PERSONAL_SCORE_INPUTS
+            eligible_dfs (dict): eligible frames, only the frame of the
+                                    score is needed
+            emp_ids (series, optional): emp_id of the score eligible
+                        profiles, used by the interview score state.
+                        Defaults to None.
+
+        Returns:
+            dataframe: personal score dataframe
+        '''
+        method, frame = self.PERSONAL_SCORE_INPUTS[name]
+
+        self.logger.debug(f'{name} is processing...')
+        if method is None:
+            score_df = self.interview_scores(eligible_dfs, emp_ids)
+        else:
+            score_df = getattr(self.psc, method)(eligible_dfs[frame])
+        self.logger.debug(f'{name} is completed...')
+
+        return score_df
+
+    def fused_personal_scores(self, eligible_dfs, emp_ids=None):
+        '''Calculates the personal scores of the eligible profiles with the
+        fused scoring engine and splits its output into the personal score
+        dataframes.
+
+        Args:
+            eligible_dfs (dict): output of eligible_frames
+            emp_ids (series, optional): emp_id of the score eligible
+                        profiles, used by the interview score state.
+                        Defaults to None.
+
+        Returns:
+            dict: personal score dataframes
+        '''
+        self.logger.debug('Education score is processing...')
+        education_score_df = self.psc.education_score(eligible_dfs['edu'])
+        self.logger.debug('Education score is completed...')
+
+        self.logger.debug('Fused personal scores are processing...')
+        fused_score_df = self.psc.fused_scores(
+            eligible_dfs['work_agg'], eligible_dfs['tech'],
+            eligible_dfs['cert'], eligible_dfs['int'])
+        self.logger.debug('Fused personal scores are completed...')
+
+        score_dfs = {'education_score_df': education_score_df}
+
+        fused_score_cols = (self.LEAN_FUSED_SCORE_COLUMNS if self.lean
+                            else self.FUSED_SCORE_COLUMNS)
+        if self.interview_state is not None:
+            fused_score_cols = {
+                name: score_cols for name, score_cols in
+                fused_score_cols.items()
+                if name != 'interview_score_df'}
+            score_dfs['interview_score_df'] = self.interview_scores(
+                eligible_dfs, emp_ids)
+
+        for name, score_cols in fused_score_cols.items():
+            score_df = fused_score_df[['emp_id'] + score_cols].dropna(
+                subset=score_cols, how='all').reset_index(drop=True)
+
+            # Nullable integer columns have no missing values after dropna
+            score_dfs[name] = score_df.astype({
+                col: 'int64' for col in score_cols
+                if str(score_df[col].dtype) == 'Int64'})
+
+        return score_dfs
+
+    def interview_scores(self, eligible_dfs, emp_ids=None):
+        '''Calculates the interview score of the eligible profiles, from the
+        interview score state when it is given.
+            Interview rows of the eligible profiles are their whole interview
+            history, so they are folded into the state as complete history.
+            The eligible frames may come from the stage cache, so emp_ids is
+            passed by the caller instead of the eligible key set.
+
+        Args:
+            eligible_dfs (dict): output of eligible_frames
+            emp_ids (series, optional): emp_id of the score eligible
+                        profiles. Defaults to None (interviews are only
+                        added and the employees of the interview rows
+                        are scored).
+
+        Returns:
+            dataframe: interview score dataframe
+        '''
+        if self.interview_state is None:
+            return self.psc.interview_score(eligible_dfs['int'])
+
+        # Interview state is kept as dataframes
+        interview_df = eligible_dfs['int']
+        if isinstance(interview_df, pa.Table):
+            interview_df = interview_df.to_pandas()
+
+        self.interview_state.fold(interview_df, emp_ids)
+
+        if emp_ids is None:
+            emp_ids = interview_df['emp_id']
+
+        return self.interview_state.scores(emp_ids)
+
+    def merge_scores(self, previous_score_df, score_df, emp_ids):
+        '''Merges the rescored profiles into the previous score
+
+        Args:
+            previous_score_df (dataframe): score of the previous runs
+            score_df (dataframe): score of the rescored profiles
+            emp_ids (series): emp_id of the rescored profiles
+
+        Returns:
+            dataframe: previous score of the other profiles and new score
+                                                    of the rescored profiles
+        '''
+        merged_score_df = pd.concat(
+            [previous_score_df[~previous_score_df['emp_id'].isin(emp_ids)],
+             score_df], ignore_index=True)
+
+        return merged_score_df
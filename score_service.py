@@ -0,0 +1,311 @@
+'''This module scores one employee on request.
+
+class       : ScoreService
+functions   : reload (reads the published population ratio tables)
+              score_employee (returns all the scores of one employee)
+              serve (serves the scores over HTTP)
+
+Details:
+    The population count tables published by the batch run (stats folder)
+    are read once and kept as ratio series by category value. A request
+    reads only the rows of the employee (ParquetLoader.lookup, row groups
+    of the sorted snapshots) and runs the score pipeline stages on them
+    with the ratios of the employee's categories. Scores are returned as
+    the score store row of the employee, so the stages run in the lean
+    mode by default.
+    Ratio tables are reloaded when the files of the stats folder are
+    changed by a batch run (checked every reload interval) and on a new
+    day for the certificate trend period. The employee is scored whether
+    or not it is flagged recalculate_score_eligible.
+
+    Ex. python score_service.py
+        curl http://127.0.0.1:8080/score/{emp_id}
+'''
+
+import configparser
+import json
+import logging.config
+import os
+import sys
+import threading
+import time
+from datetime import date
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote
+
+import pandas as pd
+
+from parquet_loader import ParquetLoader
+from population_statistics import PopulationStatistics
+from score_pipeline import ScorePipeline
+from score_store import ScoreStore
+
+# Initialize log
+logger = logging.getLogger(__name__)
+
+
+class ScoreService:
+    '''ScoreService class scores single employees with the in memory
+                                                    population ratio tables
+        Functions:
+            reload
+            score_employee
+            serve
+    '''
+
+    # Categories of the population ratios, column of the eligible frames
+    RATIO_FRAMES = {
+        'total_exp': 'work_agg',
+        'domain': 'domain',
+        'technology_description': 'tech',
+        'certificate_name': 'cert',
+    }
+
+    def __init__(self, loader, stats, personal_score_engine='pandas',
+                 reload_interval=60, cert_active_days=730, lean=True):
+        self.logger = logging.getLogger(__name__)
+        self.loader = loader
+        self.stats = stats
+        self.personal_score_engine = personal_score_engine
+        self.lean = lean
+        self.reload_interval = reload_interval
+        self.cert_active_days = cert_active_days
+        self.score_store = ScoreStore()
+        self.lock = threading.Lock()
+        self.ratios = {}
+        self.signature = None
+        self.checked = 0
+        self.logger.debug(self)
+
+        self.reload()
+
+    def _stats_signature(self):
+        '''Returns the files, modified times and date of the ratio tables'''
+        stats_folder = self.stats.stats_folder
+
+        if not os.path.isdir(stats_folder):
+            raise FileNotFoundError(
+                f'No population statistics in {stats_folder}, run '
+                f'effulgenz_score.py first')
+
+        return (date.today(), tuple(sorted(
+            (file_name, os.stat(f'{stats_folder}/{file_name}').st_mtime_ns)
+            for file_name in os.listdir(stats_folder)
+            if file_name.endswith('.parquet'))))
+
+    def reload(self):
+        '''Reads the population ratio tables when the stats folder is
+                changed since they were read
+
+            Output argument:
+                reloaded (bool) - True when the ratio tables are read
+        '''
+        signature = self._stats_signature()
+
+        if signature == self.signature:
+            return False
+
+        stats_folder = self.stats.stats_folder
+        self.stats.from_frames({
+            file_name[:-len('.parquet')]: pd.read_parquet(
+                f'{stats_folder}/{file_name}')
+            for file_name, _ in signature[1]})
+
+        # Ratio of every category value, the tables are replaced at once
+        ratios = {}
+        for category, ratio_df in self.stats.ratios(
+                cert_active_days=self.cert_active_days).items():
+            ratios[category] = ratio_df.set_index(
+                category)[f'{category}_ratio']
+
+        self.ratios, self.signature = ratios, signature
+
+        self.logger.info(f'Population ratios loaded from {stats_folder}')
+
+        return True
+
+    def _check_reload(self):
+        '''Reloads the ratio tables at most once per reload interval. The
+                previous tables are kept when the new ones can not be read'''
+        if time.monotonic() - self.checked < self.reload_interval:
+            return
+
+        with self.lock:
+            if time.monotonic() - self.checked < self.reload_interval:
+                return
+
+            try:
+                self.reload()
+            except Exception:
+                self.logger.exception('Population ratios are not reloaded')
+
+            self.checked = time.monotonic()
+
+    def _ratio_frames(self, eligible_dfs):
+        '''Returns the ratio dataframes of the categories of the employee'''
+        ratios = self.ratios
+        ratio_dfs = {}
+
+        for category, frame_name in self.RATIO_FRAMES.items():
+            ratio = ratios[category]
+            values = eligible_dfs[frame_name][category].unique()
+
+            ratio_dfs[category] = (
+                ratio.reindex(values).dropna().astype(ratio.dtype)
+                .rename_axis(category).reset_index())
+
+        return ratio_dfs
+
+    def score_employee(self, emp_id):
+        '''Calculates all the scores of one employee
+
+            Input arguments:
+                emp_id - employee id
+            Output argument:
+                scores (dict) - score store row of the employee, None when
+                                the employee is not found
+        '''
+        self._check_reload()
+
+        personal_info_df = self.loader.lookup('personal_info', emp_id)
+
+        if personal_info_df.empty:
+            return None
+
+        # Pipeline keeps the join key sets, so every request has its own
+        sp = ScorePipeline(self.personal_score_engine, lean=self.lean)
+
+        certificate_df = self.loader.lookup('certificate_info', emp_id)
+
+        population_dfs = sp.population_frames(
+            personal_info_df,
+            self.loader.lookup('work_info', emp_id),
+            self.loader.lookup('employee_technology_stack', emp_id),
+            certificate_df)
+
+        eligible_dfs = sp.eligible_frames(
+            personal_info_df, population_dfs, certificate_df,
+            self.loader.lookup('education_info', emp_id),
+            self.loader.lookup('interview_schedule', emp_id))
+
+        score_table = self.score_store.build(
+            sp.market_scores(eligible_dfs, self._ratio_frames(eligible_dfs)),
+            sp.personal_scores(eligible_dfs))
+
+        # Employee without any score rows has no score store row
+        scores = {column: values[0] if values else None
+                  for column, values in score_table.to_pydict().items()}
+        scores['emp_id'] = emp_id
+
+        return scores
+
+    def serve(self, host='127.0.0.1', port=8080):
+        '''Serves GET /score/{emp_id} and GET /health until interrupted
+
+            Input arguments:
+                host (str) - listening address
+                                default value is 127.0.0.1
+                port (int) - listening port
+                                default value is 8080
+        '''
+        server = ThreadingHTTPServer((host, port), ScoreRequestHandler)
+        server.service = self
+
+        self.logger.info(f'Score service is listening on {host}:{port}')
+
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+
+    def __repr__(self):
+        return f'''ScoreService('{self.stats.stats_folder}',
+                    '{self.personal_score_engine}', {self.reload_interval})'''
+
+
+class ScoreRequestHandler(BaseHTTPRequestHandler):
+    '''HTTP requests of the score service'''
+
+    def _send_json(self, status, content):
+        body = json.dumps(content, default=str).encode()
+
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        service = self.server.service
+
+        if self.path == '/health':
+            self._send_json(200, {'status': 'ok',
+                                  'ratios_date': service.signature[0]})
+            return
+
+        if not self.path.startswith('/score/'):
+            self._send_json(404, {'error': 'unknown path'})
+            return
+
+        emp_id = unquote(self.path[len('/score/'):])
+        start = time.perf_counter()
+
+        try:
+            scores = service.score_employee(emp_id)
+        except Exception:
+            logger.exception(f'{emp_id} is not scored')
+            self._send_json(500, {'error': 'score calculation failed'})
+            return
+
+        logger.debug(f'{emp_id} scored in '
+                     f'{(time.perf_counter() - start) * 1000:.1f} ms')
+
+        if scores is None:
+            self._send_json(404, {'error': f'{emp_id} not found'})
+        else:
+            self._send_json(200, scores)
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+
+def main():
+    '''Starts the score service with the cassandra_config.ini settings'''
+    c_cfg = configparser.ConfigParser()
+    c_cfg.read('cassandra_config.ini')
+
+    logging.config.fileConfig('logging.conf',
+                              disable_existing_loggers=False)
+
+    with open('data_file_meta_data.json') as f:
+        data_file_details = json.load(f)
+
+    # Same categories and sketch parameters as the batch run
+    stats = PopulationStatistics(
+        c_cfg.get('SCORE_DETAILS', 'STATS_FOLDER', fallback='stats'),
+        [category.strip() for category in c_cfg.get(
+            'SCORE_DETAILS', 'APPROXIMATE_CATEGORIES',
+            fallback='').split(',') if category.strip()],
+        {'heavy_hitters': c_cfg.getint('SCORE_DETAILS',
+                                       'SKETCH_HEAVY_HITTERS',
+                                       fallback=200)})
+
+    service = ScoreService(
+        ParquetLoader(data_file_details,
+                      c_cfg.get('FOLDER_DETAILS', 'DATA_FOLDER')),
+        stats,
+        c_cfg.get('SCORE_DETAILS', 'PERSONAL_SCORE_ENGINE',
+                  fallback='pandas'),
+        c_cfg.getint('SERVICE_DETAILS', 'RELOAD_INTERVAL_S', fallback=60))
+
+    service.serve(
+        c_cfg.get('SERVICE_DETAILS', 'HOST', fallback='127.0.0.1'),
+        c_cfg.getint('SERVICE_DETAILS', 'PORT', fallback=8080))
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,361 @@
+'''This module writes all the scores into one columnar score store.
+
+class       : ScoreStore
+functions   : build (returns one row per employee with all the scores)
+              write (writes the score table into the partitioned store)
+              writer (writes several score tables into the store)
+              read (reads the score store)
+
+Details:
+    Score store is a parquet dataset {score_folder}/score_store with one
+    row per emp_id and one column per score component. Scores with one row
+    per category (domain, skill set, certificate trend and education) are
+    kept as list columns. Rows are split into hash partitions of emp_id,
+    every partition is a compressed parquet file written by a thread pool.
+    Every row has the run (timestamp) which calculated its scores, rows of
+    the employees which are not rescored keep their previous run.
+    No. of partitions is kept in the _score_store.json file of the store.
+    A store written with another no. of partitions is read as a whole and
+    written again with the new partitions.
+'''
+
+import json
+import logging.config
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+import segment_kernels as sk
+
+# Initialize log
+logger = logging.getLogger(__name__)
+
+
+class ScoreStore:
+    '''Partitioned parquet store of the score components by emp_id.'''
+
+    # Score components with one row per employee for every score dataframe.
+    # Work aggregation columns are taken from the personal scores, so the
+    # lean calculator outputs have every column of the store.
+    SCORE_COLUMNS = {
+        ('market', 'tot_exp_score_df'): ['total_exp', 'total_exp_ratio'],
+        ('personal', 'valid_cert_score_df'): ['no_of_certs', 'cert_score'],
+        ('personal', 'domain_score_df'): ['no_of_domain', 'domain_score'],
+        ('personal', 'reliablity_score_df'): ['total_switch', 'switch_rel',
+                                              'switch_rel_count',
+                                              'rel_score1', 'rel_score2'],
+        ('personal', 'skill_set_score_df'): ['tech_count', 'skill_set_score'],
+        ('personal', 'interview_score_df'): ['interview_score'],
+    }
+
+    # Score components with one row per category, kept as list columns
+    LIST_COLUMNS = {
+        ('market', 'domain_score_df'): ['domain', 'domain_ratio'],
+        ('market', 'skill_set_score_df'): ['technology_description',
+                                           'technology_description_ratio'],
+        ('market', 'cert_trend_score_df'): ['certificate_name',
+                                            'certificate_name_ratio'],
+        ('personal', 'education_score_df'): ['education_type_desc',
+                                             'education_score'],
+    }
+
+    # Types of the score store columns, so every partition and every run
+    # has the same schema
+    SCHEMA = pa.schema(
+        [('emp_id', pa.string()), ('run', pa.timestamp('us'))]
+        + [(column, pa.int64()) for column in [
+            'total_exp', 'total_switch', 'switch_rel', 'no_of_domain',
+            'total_exp_ratio', 'no_of_certs', 'cert_score', 'domain_score',
+            'switch_rel_count', 'rel_score1', 'rel_score2', 'tech_count',
+            'skill_set_score']]
+        + [('interview_score', pa.float64()),
+           ('domain', pa.list_(pa.string())),
+           ('domain_ratio', pa.list_(pa.int64())),
+           ('technology_description', pa.list_(pa.string())),
+           ('technology_description_ratio', pa.list_(pa.int64())),
+           ('certificate_name', pa.list_(pa.string())),
+           ('certificate_name_ratio', pa.list_(pa.int64())),
+           ('education_type_desc', pa.list_(pa.string())),
+           ('education_score', pa.list_(pa.float64()))])
+
+    def __init__(self, score_folder='score', partitions=16,
+                 compression='zstd', max_writers=4):
+        self.logger = logging.getLogger(__name__)
+        self.store_path = f'{score_folder}/score_store'
+        self.partitions = partitions
+        self.compression = compression
+        self.max_writers = max_writers
+        self.logger.debug(self)
+
+    def partition(self, emp_ids, partitions=None):
+        '''Returns the hash partition of every emp_id, emp_id values are
+                hashed as strings
+
+            Input arguments:
+                emp_ids (array)  - emp_id values
+                partitions (int) - no. of partitions
+                                    default value is None (partitions of
+                                    the store)
+            Output argument:
+                partitions (array)
+        '''
+        return sk.emp_partitions(emp_ids, partitions or self.partitions)
+
+    @staticmethod
+    def _column(score_df, column):
+        '''Returns a column of a score dataframe or Arrow score table'''
+        if isinstance(score_df, pa.Table):
+            return score_df.column(column).to_pandas()
+
+        return score_df[column]
+
+    def build(self, market_score_dfs, personal_score_dfs, run=None):
+        '''Returns one row per employee with all the score components
+
+            Input arguments:
+                market_score_dfs (dict)   - output of market_scores,
+                                                dataframes or Arrow tables
+                personal_score_dfs (dict) - output of personal_scores,
+                                                dataframes or Arrow tables
+                run (datetime)            - run of the scores
+                                                default value is now
+            Output argument:
+                score_table - score components by emp_id (Arrow table)
+        '''
+        score_dfs = {('market', name): score_df
+                     for name, score_df in market_score_dfs.items()}
+        score_dfs.update({('personal', name): score_df
+                          for name, score_df in personal_score_dfs.items()})
+
+        emp_index = pd.Index(np.concatenate(
+            [self._column(score_df, 'emp_id').values
+             for score_df in score_dfs.values()]
+        )).unique().sort_values()
+        size = len(emp_index)
+
+        columns = {'emp_id': pa.array(np.asarray(emp_index, dtype='object')),
+                   'run': pa.array(np.full(size, np.datetime64(
+                       run or datetime.now(), 'us')))}
+
+        for score_name, score_cols in self.SCORE_COLUMNS.items():
+            score_df = score_dfs[score_name]
+            codes = sk.employee_codes(emp_index,
+                                      self._column(score_df, 'emp_id'))
+
+            for column in score_cols:
+                columns[column] = pa.array(
+                    sk.employee_values(
+                        self._column(score_df, column).values, codes, size),
+                    from_pandas=True)
+
+        for score_name, score_cols in self.LIST_COLUMNS.items():
+            score_df = score_dfs[score_name]
+            codes = sk.employee_codes(emp_index,
+                                      self._column(score_df, 'emp_id'))
+            order = np.argsort(codes, kind='stable')
+
+            offsets = pa.array(np.concatenate(
+                ([0], np.cumsum(np.bincount(codes, minlength=size)))),
+                type=pa.int32())
+
+            for column in score_cols:
+                values = np.asarray(self._column(score_df, column))[order]
+                columns[column] = pa.ListArray.from_arrays(
+                    offsets, pa.array(values, from_pandas=True))
+
+        return pa.Table.from_arrays(
+            [columns[field.name] for field in self.SCHEMA],
+            names=self.SCHEMA.names).cast(self.SCHEMA)
+
+    def _split(self, score_table):
+        '''Returns the score table sorted by partition and the start row of
+                                                            every partition'''
+        parts = self.partition(score_table.column('emp_id').to_pandas())
+        starts = np.concatenate(
+            ([0], np.cumsum(np.bincount(parts, minlength=self.partitions))))
+
+        return (score_table.take(pa.array(np.argsort(parts, kind='stable'))),
+                starts)
+
+    def _temp_path(self):
+        temp_path = f'{self.store_path}.tmp'
+        if os.path.exists(temp_path):
+            shutil.rmtree(temp_path)
+        os.makedirs(temp_path)
+
+        return temp_path
+
+    def _meta_path(self, store_path=None):
+        return f'{store_path or self.store_path}/_score_store.json'
+
+    def _stored_partitions(self):
+        '''Returns the no. of partitions of the store, None when there is no
+                                        store or it has no metadata file'''
+        if not os.path.exists(self._meta_path()):
+            return None
+
+        with open(self._meta_path()) as f:
+            return json.load(f)['partitions']
+
+    def _read_files(self, columns=None):
+        '''Reads all the partition files of the store'''
+        return pa.concat_tables([
+            pq.read_table(f'{self.store_path}/{file_name}', columns=columns)
+            for file_name in sorted(os.listdir(self.store_path))
+            if file_name.endswith('.parquet')])
+
+    def _replace_store(self, temp_path):
+        with open(self._meta_path(temp_path), 'w') as f:
+            json.dump({'partitions': self.partitions}, f, indent=4)
+
+        if os.path.exists(self.store_path):
+            shutil.rmtree(self.store_path)
+        os.rename(temp_path, self.store_path)
+
+    def write(self, score_table, emp_ids=None):
+        '''Writes the score table into the partitions of the score store.
+                Partitions are written into a temporary folder which
+                replaces the store after all the partitions are written.
+                Previous store written with another no. of partitions is
+                merged as a whole and written with the new partitions.
+
+            Input arguments:
+                score_table (table) - output of build
+                emp_ids (series)    - rescored emp_id, other employees of the
+                                        previous store are kept.
+                                        default value is None (the store
+                                        is replaced)
+            Output argument:
+                rows (int)          - no. of rows in the store
+        '''
+        rescored = None if emp_ids is None else pd.Index(emp_ids).unique()
+
+        if (rescored is not None and os.path.exists(self.store_path)
+                and self._stored_partitions() != self.partitions):
+            previous_table = self._read_files()
+            kept = rescored.get_indexer(previous_table.column(
+                'emp_id').to_pandas()) < 0
+
+            self.logger.info(f'{self.store_path} is written again with '
+                             f'{self.partitions} partitions')
+
+            score_table = pa.concat_tables([
+                previous_table.take(pa.array(np.flatnonzero(kept))),
+                score_table])
+            rescored = None
+
+        score_table, starts = self._split(score_table)
+
+        temp_path = self._temp_path()
+
+        def write_partition(part):
+            part_table = score_table.slice(starts[part],
+                                           starts[part + 1] - starts[part])
+            file_name = f'part-{part:05d}.parquet'
+            previous_path = f'{self.store_path}/{file_name}'
+
+            if rescored is not None and os.path.exists(previous_path):
+                previous_table = pq.read_table(previous_path)
+                kept = rescored.get_indexer(previous_table.column(
+                    'emp_id').to_pandas()) < 0
+
+                part_table = pa.concat_tables([
+                    previous_table.take(pa.array(np.flatnonzero(kept))),
+                    part_table])
+
+            pq.write_table(part_table, f'{temp_path}/{file_name}',
+                           compression=self.compression)
+
+            return part_table.num_rows
+
+        with ThreadPoolExecutor(max_workers=self.max_writers) as executor:
+            rows = sum(executor.map(write_partition, range(self.partitions)))
+
+        self._replace_store(temp_path)
+
+        self.logger.info(f'{rows} rows written into {self.store_path}')
+
+        return rows
+
+    @contextmanager
+    def writer(self):
+        '''Writes score tables into the store one after another, every
+                score table is written as a row group of its partitions.
+                The store is replaced when the writer is closed.
+
+            Output argument:
+                write (function) - writes a score table (output of build)
+        '''
+        temp_path = self._temp_path()
+        writers = [pq.ParquetWriter(f'{temp_path}/part-{part:05d}.parquet',
+                                    self.SCHEMA, compression=self.compression)
+                   for part in range(self.partitions)]
+        rows = 0
+
+        def write(score_table):
+            nonlocal rows
+            score_table, starts = self._split(score_table)
+
+            for part, writer in enumerate(writers):
+                if starts[part + 1] > starts[part]:
+                    writer.write_table(score_table.slice(
+                        starts[part], starts[part + 1] - starts[part]))
+
+            rows += score_table.num_rows
+
+        try:
+            yield write
+        finally:
+            for writer in writers:
+                writer.close()
+
+        self._replace_store(temp_path)
+
+        self.logger.info(f'{rows} rows written into {self.store_path}')
+
+    def read(self, columns=None, emp_ids=None):
+        '''Reads the score store
+
+            Input arguments:
+                columns (list)   - score columns, emp_id is always read
+                                    default value is None (all columns)
+                emp_ids (series) - emp_id to be read, only their partitions
+                                    are read.
+                                    default value is None (all employees)
+            Output argument:
+                score_df - scores by emp_id (pandas dataframe)
+        '''
+        if columns is not None:
+            columns = ['emp_id'] + [column for column in columns
+                                    if column != 'emp_id']
+
+        # Partitions of the emp_ids are read with the no. of partitions of
+        # the store, every partition when it is not known
+        partitions = self._stored_partitions()
+
+        if emp_ids is None or partitions is None:
+            score_table = self._read_files(columns)
+        else:
+            score_table = pa.concat_tables([
+                pq.read_table(f'{self.store_path}/part-{part:05d}.parquet',
+                              columns=columns)
+                for part in np.unique(self.partition(emp_ids, partitions))])
+
+        score_df = score_table.to_pandas()
+
+        if emp_ids is not None:
+            emp_ids = pd.Index(emp_ids).unique()
+            score_df = score_df[score_df['emp_id'].isin(emp_ids)]
+
+        return score_df.reset_index(drop=True)
+
+    def __repr__(self):
+        return f'''ScoreStore('{self.store_path}', {self.partitions},
+                            '{self.compression}', {self.max_writers})'''
@@ -0,0 +1,195 @@
+'''This module defines vectorized per employee reductions.
+
+Details:
+    Rows of a table are sorted once by employee code (and a value code
+    when needed). Every employee is then a contiguous segment of the sorted
+    arrays and the aggregates are calculated with NumPy segment reductions
+    instead of pandas groupby.
+        employee_codes    - employee code of every row
+        category_codes    - integer code of every category value
+        segment_starts    - start position of every segment
+        segment_sum       - sum of every segment
+        segment_count     - no. of rows of every segment
+        segment_nunique   - no. of unique values of every segment
+        segment_dense_rank - dense rank of the values within every segment
+        employee_values   - values placed at every employee code
+        emp_partitions    - hash partition of every emp_id
+'''
+
+import numpy as np
+import pandas as pd
+
+
+def employee_codes(emp_index, emp_ids):
+    '''Returns employee code (position in emp_index) of every row
+
+    Args:
+        emp_index (index): unique emp_id of all the employees
+        emp_ids (series): emp_id of every row
+
+    Returns:
+        array: employee code of every row
+    '''
+    return emp_index.get_indexer(emp_ids)
+
+
+def category_codes(category_series):
+    '''Returns integer code of every value, missing values are -1.
+            Categoricals use their dictionary codes.
+
+    Args:
+        category_series (series): category column
+
+    Returns:
+        array: category code of every row
+    '''
+    if isinstance(category_series.dtype, pd.CategoricalDtype):
+        return category_series.cat.codes.values
+
+    return pd.factorize(category_series)[0]
+
+
+def segment_starts(sorted_codes):
+    '''Returns start position of every segment of the sorted codes
+
+    Args:
+        sorted_codes (array): sorted employee codes
+
+    Returns:
+        array: start position of every segment
+    '''
+    if len(sorted_codes) == 0:
+        return np.zeros(0, dtype='int64')
+
+    return np.flatnonzero(
+        np.concatenate(([True], sorted_codes[1:] != sorted_codes[:-1])))
+
+
+def segment_sum(sorted_codes, sorted_values, size):
+    '''Returns sum of the values of every employee
+
+    Args:
+        sorted_codes (array): sorted employee codes
+        sorted_values (array): values in the sorted order
+        size (int): no. of employees
+
+    Returns:
+        array: sum for every employee, 0 for the employees without rows
+    '''
+    sums = np.zeros(size, dtype=np.result_type(sorted_values, 'int64'))
+
+    starts = segment_starts(sorted_codes)
+    if len(starts):
+        sums[sorted_codes[starts]] = np.add.reduceat(sorted_values, starts)
+
+    return sums
+
+
+def segment_count(sorted_codes, size):
+    '''Returns no. of rows of every employee
+
+    Args:
+        sorted_codes (array): sorted employee codes
+        size (int): no. of employees
+
+    Returns:
+        array: no. of rows for every employee
+    '''
+    return np.bincount(sorted_codes, minlength=size)
+
+
+def segment_nunique(sorted_codes, sorted_values, size):
+    '''Returns no. of unique values of every employee
+
+    Args:
+        sorted_codes (array): employee codes sorted with the values
+        sorted_values (array): value codes sorted within every employee,
+                                missing values (-1) are not counted
+        size (int): no. of employees
+
+    Returns:
+        array: no. of unique values for every employee
+    '''
+    first = np.ones(len(sorted_codes), dtype=bool)
+    first[1:] = ((sorted_codes[1:] != sorted_codes[:-1])
+                 | (sorted_values[1:] != sorted_values[:-1]))
+
+    first &= sorted_values >= 0
+
+    return np.bincount(sorted_codes[first], minlength=size)
+
+
+def segment_dense_rank(sorted_codes, sorted_values):
+    '''Returns dense rank of the values within every employee
+
+    Args:
+        sorted_codes (array): employee codes sorted with the values
+        sorted_values (array): values sorted within every employee
+
+    Returns:
+        array: dense rank (starts with 1) in the sorted order
+    '''
+    if len(sorted_codes) == 0:
+        return np.zeros(0, dtype='int64')
+
+    new_value = np.ones(len(sorted_codes), dtype=bool)
+    new_value[1:] = ((sorted_codes[1:] != sorted_codes[:-1])
+                     | (sorted_values[1:] != sorted_values[:-1]))
+
+    value_count = np.cumsum(new_value)
+
+    starts = segment_starts(sorted_codes)
+    segment_ids = np.repeat(np.arange(len(starts)),
+                            np.diff(np.append(starts, len(sorted_codes))))
+
+    return value_count - value_count[starts][segment_ids] + 1
+
+
+def employee_values(values, codes, size, present=None):
+    '''Returns the values placed at their employee codes, employees which
+            are not present are missing values. Integer values are returned
+            as nullable integers, so they are not converted to float.
+
+    Args:
+        values (array): value for every code
+        codes (array): employee code of every value
+        size (int): no. of employees
+        present (array, optional): employees having the value.
+                                    Defaults to the given codes.
+
+    Returns:
+        array: value of every employee
+    '''
+    values = np.asarray(values)
+
+    if present is None:
+        present = np.zeros(size, dtype=bool)
+        present[codes] = True
+
+    if np.issubdtype(values.dtype, np.integer):
+        data = np.zeros(size, dtype='int64')
+        data[codes] = values
+        return pd.arrays.IntegerArray(data, ~present)
+
+    data = np.full(size, np.nan)
+    data[codes] = values
+    data[~present] = np.nan
+    return data
+
+
+def emp_partitions(emp_ids, partitions):
+    '''Returns the hash partition of every emp_id. emp_id values are hashed
+            as strings, so the partition does not depend on the emp_id
+            type of the data file.
+
+    Args:
+        emp_ids (array): emp_id values
+        partitions (int): no. of partitions
+
+    Returns:
+        array: partition of every emp_id
+    '''
+    emp_ids = np.asarray(emp_ids, dtype='object')
+
+    return (pd.util.hash_array(emp_ids.astype(str).astype('object'))
+            % partitions).astype('int64')
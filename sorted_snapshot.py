@@ -0,0 +1,199 @@
+'''This module clusters the pulled parquet snapshots by emp_id.
+
+class       : SortedSnapshot
+functions   : rewrite (sorts one snapshot and writes its row group index)
+              rewrite_tables (sorts several snapshots concurrently)
+              read_index (returns the row group index of a snapshot)
+              row_groups_of (returns the row groups holding a key)
+
+Details:
+    The pull writes the rows in token order, so the rows of an employee
+    are spread over the whole file. A snapshot is rewritten as one parquet
+    file sorted by emp_id with zstd compression. Rows per row group are
+    chosen from the average row size, so every row group is about
+    row_group_bytes uncompressed.
+    Every sorted snapshot has a sidecar {file_path}.index.json with the
+    first and last emp_id of every row group, and the size and modified
+    time of the snapshot. The rows of one employee are read from the row
+    groups of its key range only. An index whose snapshot is changed
+    (Ex. by the incremental upsert) is not used.
+    Only the changed snapshots are sorted again, a snapshot whose index
+    is current is skipped. Tables without the emp_id column are not
+    rewritten.
+'''
+
+import bisect
+import json
+import logging.config
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+# Initialize log
+logger = logging.getLogger(__name__)
+
+
+class SortedSnapshot:
+    '''SortedSnapshot class writes emp_id sorted and indexed snapshots
+        Functions:
+            rewrite
+            rewrite_tables
+            read_index
+            row_groups_of
+    '''
+
+    INDEX_SUFFIX = '.index.json'
+
+    def __init__(self, sort_col='emp_id', row_group_bytes=16 * 1024 ** 2,
+                 compression='zstd'):
+        self.logger = logging.getLogger(__name__)
+        self.sort_col = sort_col
+        self.row_group_bytes = row_group_bytes
+        self.compression = compression
+        self.logger.debug(self)
+
+    def rewrite(self, file_path):
+        '''Sorts a snapshot by the sort column and writes its row group index
+
+            Input arguments:
+                file_path (str) - parquet file or parquet dataset directory
+            Output argument:
+                row_groups (int) - no. of row groups written, None when the
+                                    snapshot has no sort column
+        '''
+        # Schema is checked before the whole table is read
+        if self.sort_col not in ds.dataset(file_path,
+                                           format='parquet').schema.names:
+            self.logger.debug(f'{file_path} has no {self.sort_col} column')
+            return None
+
+        table = pq.read_table(file_path)
+
+        order = np.argsort(table.column(self.sort_col).to_pandas().values,
+                           kind='stable')
+        table = table.take(pa.array(order))
+
+        row_group_rows = max(1, self.row_group_bytes * table.num_rows
+                             // max(table.nbytes, 1))
+
+        # Sorted file replaces the snapshot only after it is written
+        temp_path = f'{file_path}.sorted'
+        pq.write_table(table, temp_path, row_group_size=row_group_rows,
+                       compression=self.compression)
+
+        if os.path.isdir(file_path):
+            shutil.rmtree(file_path)
+        os.replace(temp_path, file_path)
+
+        keys = table.column(self.sort_col).to_pandas()
+        starts = range(0, table.num_rows, row_group_rows)
+        stat = os.stat(file_path)
+
+        self._write_index(file_path, {
+            'sort_col': self.sort_col,
+            'file_size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+            'first_keys': keys.iloc[list(starts)].tolist(),
+            'last_keys': keys.iloc[[min(start + row_group_rows,
+                                        table.num_rows) - 1
+                                    for start in starts]].tolist()})
+
+        self.logger.debug(f'{file_path} - {table.num_rows} rows sorted into '
+                          f'{len(starts)} row groups')
+
+        return len(starts)
+
+    def _write_index(self, file_path, index):
+        index_path = f'{file_path}{self.INDEX_SUFFIX}'
+
+        with open(f'{index_path}.tmp', 'w') as f:
+            json.dump(index, f)
+        os.replace(f'{index_path}.tmp', index_path)
+
+    def rewrite_tables(self, file_paths, max_workers=4):
+        '''Sorts several snapshots concurrently, the missing files and the
+                    snapshots which are not changed since they are sorted
+                                                            are skipped
+
+            Input arguments:
+                file_paths (list) - parquet files or dataset directories
+                max_workers (int) - no. of snapshots sorted at a time
+                                        default value is 4
+            Output argument:
+                row_groups (dict) - no. of row groups of every snapshot
+        '''
+        row_groups = {}
+        changed_paths = []
+
+        for file_path in file_paths:
+            if not os.path.exists(file_path):
+                continue
+
+            index = self.read_index(file_path)
+
+            if index is None:
+                changed_paths.append(file_path)
+            else:
+                row_groups[file_path] = len(index['first_keys'])
+
+        self.logger.debug(f'{len(changed_paths)} of '
+                          f'{len(changed_paths) + len(row_groups)} '
+                          f'snapshots are sorted')
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            row_groups.update(zip(changed_paths,
+                                  executor.map(self.rewrite, changed_paths)))
+
+        return row_groups
+
+    def read_index(self, file_path):
+        '''Returns the row group index of a snapshot
+
+            Input arguments:
+                file_path (str) - parquet file
+            Output argument:
+                index (dict)    - first and last key of every row group,
+                                    None when there is no index or the
+                                    snapshot is changed after the index
+        '''
+        index_path = f'{file_path}{self.INDEX_SUFFIX}'
+
+        if not os.path.isfile(index_path) or not os.path.isfile(file_path):
+            return None
+
+        with open(index_path) as f:
+            index = json.load(f)
+
+        stat = os.stat(file_path)
+
+        if (index['sort_col'] != self.sort_col
+                or index['file_size'] != stat.st_size
+                or index['mtime_ns'] != stat.st_mtime_ns):
+            self.logger.debug(f'{index_path} is stale')
+            return None
+
+        return index
+
+    @staticmethod
+    def row_groups_of(index, key):
+        '''Returns the row groups whose key range holds a key
+
+            Input arguments:
+                index (dict) - row group index from read_index
+                key          - sort column value
+            Output argument:
+                row_groups (list) - row group numbers
+        '''
+        start = bisect.bisect_left(index['last_keys'], key)
+        stop = bisect.bisect_right(index['first_keys'], key)
+
+        return list(range(start, stop))
+
+    def __repr__(self):
+        return f'''SortedSnapshot('{self.sort_col}', {self.row_group_bytes},
+                                        '{self.compression}')'''
@@ -0,0 +1,216 @@
+'''This module caches the intermediate dataframes of the score pipeline.
+
+class       : StageCache
+functions   : file_fingerprint (returns fingerprint of parquet file/dataset)
+              stage_key (returns cache key of a stage)
+              contains (checks whether a stage output is cached)
+              get_or_compute (returns cached stage output or computes it)
+              evict (removes least recently used entries)
+
+Details:
+    Every stage output is kept as feather (Arrow IPC) files in
+    {cache_folder}/{stage}-{key}, Arrow tables as .arrow files which are
+    read back as Arrow tables. The key is built from the fingerprint of
+    the input files, the stage parameters and the keys of the upstream
+    stages, so a stage is skipped whenever its inputs are not changed.
+    Least recently used entries are removed when the cache folder grows
+    beyond max_bytes.
+'''
+
+import hashlib
+import json
+import logging.config
+import os
+import shutil
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+
+# Initialize log
+logger = logging.getLogger(__name__)
+
+
+class StageCache:
+    '''Size bounded cache of the score pipeline stage outputs.'''
+
+    FRAME_NAME = '__frame__'
+
+    def __init__(self, cache_folder='cache', max_bytes=2 * 1024 ** 3,
+                 fingerprint='mtime', enabled=True):
+        self.logger = logging.getLogger(__name__)
+        self.cache_folder = cache_folder
+        self.max_bytes = max_bytes
+        self.fingerprint = fingerprint
+        self.enabled = enabled
+        self.logger.debug(self)
+
+        if enabled and not os.path.exists(cache_folder):
+            os.makedirs(cache_folder)
+
+    def file_fingerprint(self, file_path):
+        '''Returns fingerprint of a parquet file or parquet dataset directory.
+                Fingerprint is built from size and modified time of the files
+                or from the file content when fingerprint is 'content'.
+
+            Input arguments:
+                file_path (str) - parquet file or dataset directory path
+            Output argument:
+                fingerprint (str)
+        '''
+        if os.path.isdir(file_path):
+            file_paths = sorted(
+                os.path.join(folder, file_name)
+                for folder, _, file_names in os.walk(file_path)
+                for file_name in file_names)
+        else:
+            file_paths = [file_path]
+
+        file_hash = hashlib.sha1()
+
+        for path in file_paths:
+            file_hash.update(path.encode())
+
+            if self.fingerprint == 'content':
+                with open(path, 'rb') as f:
+                    for block in iter(lambda: f.read(1024 ** 2), b''):
+                        file_hash.update(block)
+            else:
+                stat = os.stat(path)
+                file_hash.update(
+                    f'{stat.st_size}-{stat.st_mtime_ns}'.encode())
+
+        return file_hash.hexdigest()
+
+    def stage_key(self, stage, files=(), params=None, upstream=()):
+        '''Returns cache key of a stage
+
+            Input arguments:
+                stage (str)     - stage name
+                files (list)    - input file paths of the stage
+                params (dict)   - stage parameters
+                upstream (list) - keys of the upstream stages
+            Output argument:
+                key (str)
+        '''
+        key_details = {
+            'stage': stage,
+            'files': [self.file_fingerprint(file_path)
+                      for file_path in files],
+            'params': params or {},
+            'upstream': list(upstream),
+        }
+
+        key = hashlib.sha1(json.dumps(key_details, sort_keys=True,
+                                      default=str).encode()).hexdigest()
+
+        self.logger.debug(f'{stage} cache key - {key}')
+
+        return key
+
+    def contains(self, stage, key):
+        '''Checks whether the output of a stage is cached, so the inputs of
+                                        the cached stages are not read
+
+            Input arguments:
+                stage (str) - stage name
+                key (str)   - stage key from stage_key
+            Output argument:
+                cached (bool)
+        '''
+        return self.enabled and os.path.isdir(
+            f'{self.cache_folder}/{stage}-{key}')
+
+    def get_or_compute(self, stage, key, compute):
+        '''Returns the cached output of a stage, the stage is computed and
+                cached when there is no entry for the key.
+                Index of the dataframes is not kept.
+
+            Input arguments:
+                stage (str)        - stage name
+                key (str)          - stage key from stage_key
+                compute (function) - computes the stage output, a dataframe
+                                        or dict of dataframes (Arrow tables)
+            Output argument:
+                output             - dataframe or dict of dataframes
+        '''
+        if not self.enabled:
+            return compute()
+
+        entry_path = f'{self.cache_folder}/{stage}-{key}'
+
+        if os.path.isdir(entry_path):
+            self.logger.info(f'{stage} is loaded from cache.')
+            os.utime(entry_path)
+
+            output = {}
+            for file_name in os.listdir(entry_path):
+                name, extension = os.path.splitext(file_name)
+                read = (feather.read_table if extension == '.arrow'
+                        else feather.read_feather)
+                output[name] = read(f'{entry_path}/{file_name}')
+
+            return output.get(self.FRAME_NAME, output)
+
+        output = compute()
+
+        if isinstance(output, (pd.DataFrame, pa.Table)):
+            frames = {self.FRAME_NAME: self._without_index(output)}
+            output = frames[self.FRAME_NAME]
+        else:
+            frames = output = {name: self._without_index(frame)
+                               for name, frame in output.items()}
+
+        # Entry is written into a temporary folder, so a crash does not
+        # leave a partial entry
+        temp_path = f'{entry_path}.tmp'
+        if os.path.exists(temp_path):
+            shutil.rmtree(temp_path)
+        os.makedirs(temp_path)
+
+        for name, frame in frames.items():
+            extension = 'arrow' if isinstance(frame, pa.Table) else 'feather'
+            feather.write_feather(frame, f'{temp_path}/{name}.{extension}')
+
+        os.rename(temp_path, entry_path)
+        self.evict()
+
+        return output
+
+    @staticmethod
+    def _without_index(frame):
+        '''Returns the dataframe with the default index, tables as they are'''
+        if isinstance(frame, pa.Table):
+            return frame
+
+        return frame.reset_index(drop=True)
+
+    def evict(self):
+        '''Removes the least recently used entries until the cache folder
+                                                    is within max_bytes'''
+        entries = []
+
+        for entry in os.listdir(self.cache_folder):
+            entry_path = f'{self.cache_folder}/{entry}'
+
+            if entry.endswith('.tmp') or not os.path.isdir(entry_path):
+                continue
+
+            entry_bytes = sum(os.path.getsize(f'{entry_path}/{file_name}')
+                              for file_name in os.listdir(entry_path))
+            entries.append((os.path.getmtime(entry_path), entry_bytes,
+                            entry_path))
+
+        cache_bytes = sum(entry_bytes for _, entry_bytes, _ in entries)
+
+        for _, entry_bytes, entry_path in sorted(entries):
+            if cache_bytes <= self.max_bytes:
+                break
+
+            self.logger.debug(f'{entry_path} is evicted from cache')
+            shutil.rmtree(entry_path)
+            cache_bytes -= entry_bytes
+
+    def __repr__(self):
+        return f'''StageCache('{self.cache_folder}', {self.max_bytes},
+                                '{self.fingerprint}', {self.enabled})'''
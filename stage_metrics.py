@@ -0,0 +1,374 @@
+'''This module records the run time metrics of the score pipeline stages.
+
+class       : StageMetrics
+functions   : stage (measures a block of code as a stage)
+              instrument (measures the methods of an object as stages)
+              report (returns the run report)
+              write (writes the JSON run report and the Prometheus file)
+
+Details:
+    Every stage records
+        calls           - no. of times the stage is run
+        wall_seconds    - elapsed time
+        cpu_seconds     - cpu time of the process
+        rows_in         - rows of the dataframe / table arguments
+        rows_out        - rows of the output (dataframes of a dict output
+                          are added)
+        peak_mb         - peak traced memory (tracemalloc) above the memory
+                          at the start of the stage, the largest of the
+                          calls is kept
+    The metrics are written into {metrics_folder}/run_report.json and
+    {metrics_folder}/effulgenz_score.prom for the Prometheus node exporter
+    textfile collector.
+    Profiled stages are sampled by a thread every profile interval. Stacks
+    of the sampled frames are written into {metrics_folder}/profile-{stage}
+    .txt in collapsed format (one "frame;frame;frame count" line per stack),
+    which is read by flamegraph.pl and speedscope.
+    Stages run by the workers of a process pool are recorded in the
+    workers, they are not part of the run report. Stages of several
+    threads are nested per thread, their peak memory is the peak of the
+    whole process while they run.
+'''
+
+import inspect
+import json
+import logging.config
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+
+# Initialize log
+logger = logging.getLogger(__name__)
+
+
+def row_count(value):
+    '''Returns no. of rows of a dataframe, series, Arrow table or of the
+            dataframes in a dict, list or tuple. None for the other values'''
+    if isinstance(value, dict):
+        value = list(value.values())
+
+    if isinstance(value, (list, tuple)):
+        counts = [row_count(item) for item in value]
+        counts = [count for count in counts if count is not None]
+        return sum(counts) if counts else None
+
+    if hasattr(value, 'num_rows'):
+        return value.num_rows
+
+    if hasattr(value, 'shape') and hasattr(value, 'index'):
+        return len(value)
+
+    return None
+
+
+class _InstrumentedMethod:
+    '''Method of an instrumented object, measured as a stage. Keeps the
+            class function instead of the bound method, so the instrumented
+            object can be pickled for the process pool workers.'''
+
+    def __init__(self, metrics, name, instance, function):
+        self.metrics = metrics
+        self.name = name
+        self.instance = instance
+        self.function = function
+
+    def __call__(self, *args, **kwargs):
+        with self.metrics.stage(self.name, list(args)
+                                + list(kwargs.values())) as stage:
+            output = self.function(self.instance, *args, **kwargs)
+            stage.output(output)
+
+        return output
+
+
+class _StageRun:
+    '''Measurements of a running stage'''
+
+    def __init__(self, inputs):
+        self.rows_in = row_count(inputs) if inputs is not None else None
+        self.rows_out = None
+        self.peak = 0
+
+    def output(self, output):
+        '''Keeps no. of rows of the stage output'''
+        self.rows_out = row_count(output)
+
+
+class StageMetrics:
+    '''StageMetrics class records the stage metrics of a run
+        Functions:
+            stage
+            instrument
+            report
+            write
+    '''
+
+    METRIC_PREFIX = 'effulgenz_score'
+
+    # Stage metrics written into the Prometheus file
+    PROMETHEUS_METRICS = {
+        'calls': ('calls_total', 'counter', 'No. of stage runs'),
+        'wall_seconds': ('wall_seconds', 'gauge', 'Elapsed time'),
+        'cpu_seconds': ('cpu_seconds', 'gauge', 'Process cpu time'),
+        'rows_in': ('rows_in', 'gauge', 'Input rows'),
+        'rows_out': ('rows_out', 'gauge', 'Output rows'),
+        'peak_mb': ('peak_memory_megabytes', 'gauge',
+                    'Peak traced memory above the stage start'),
+    }
+
+    def __init__(self, metrics_folder='metrics', enabled=True,
+                 trace_memory=True, profile_stages=(),
+                 profile_interval=0.01):
+        self.logger = logging.getLogger(__name__)
+        self.metrics_folder = metrics_folder
+        self.enabled = enabled
+        self.trace_memory = enabled and trace_memory
+        self.profile_stages = set(profile_stages)
+        self.profile_interval = profile_interval
+        self.started = datetime.now()
+        self.start = time.perf_counter()
+        self.stages = {}
+        self.profiles = {}
+        self.running = {}
+
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+        self.logger.debug(self)
+
+    def _traced_peak(self):
+        return tracemalloc.get_traced_memory()[1] if self.trace_memory else 0
+
+    def _reset_peak(self):
+        # Peak can be reset from python 3.9, before that the peak of the
+        # stage is the peak since the tracing started
+        if self.trace_memory and hasattr(tracemalloc, 'reset_peak'):
+            tracemalloc.reset_peak()
+
+    @contextmanager
+    def stage(self, name, inputs=None):
+        '''Measures a block of code as a stage
+
+            Input arguments:
+                name (str)    - stage name
+                inputs (list) - input dataframes of the stage
+                                    default value is None (no input rows)
+            Output argument:
+                stage_run - call stage_run.output(output) to record the
+                            output rows
+        '''
+        stage_run = _StageRun(inputs)
+
+        if not self.enabled:
+            yield stage_run
+            return
+
+        # Peak of the running stage is kept before the peak is reset for
+        # the nested stage
+        running = self.running.setdefault(threading.get_ident(), [])
+        if running:
+            running[-1].peak = max(running[-1].peak, self._traced_peak())
+        self._reset_peak()
+        running.append(stage_run)
+
+        start_memory = (tracemalloc.get_traced_memory()[0]
+                        if self.trace_memory else 0)
+        sampler = (self._start_sampler(name)
+                   if name in self.profile_stages else None)
+        start_cpu = time.process_time()
+        start = time.perf_counter()
+
+        try:
+            yield stage_run
+        finally:
+            wall_seconds = time.perf_counter() - start
+            cpu_seconds = time.process_time() - start_cpu
+
+            if sampler is not None:
+                self._stop_sampler(name, *sampler)
+
+            running.pop()
+            peak = max(stage_run.peak, self._traced_peak())
+            if running:
+                running[-1].peak = max(running[-1].peak, peak)
+            self._reset_peak()
+
+            self._record(name, wall_seconds, cpu_seconds, stage_run,
+                         (peak - start_memory) / 1024 ** 2
+                         if self.trace_memory else None)
+
+    def _record(self, name, wall_seconds, cpu_seconds, stage_run, peak_mb):
+        '''Adds the measurements of a stage run into the stage metrics'''
+        metric = self.stages.setdefault(name, {
+            'calls': 0, 'wall_seconds': 0.0, 'cpu_seconds': 0.0,
+            'rows_in': None, 'rows_out': None, 'peak_mb': None})
+
+        metric['calls'] += 1
+        metric['wall_seconds'] += wall_seconds
+        metric['cpu_seconds'] += cpu_seconds
+
+        for key, value in (('rows_in', stage_run.rows_in),
+                           ('rows_out', stage_run.rows_out)):
+            if value is not None:
+                metric[key] = (metric[key] or 0) + value
+
+        if peak_mb is not None:
+            metric['peak_mb'] = max(metric['peak_mb'] or 0, peak_mb)
+
+        self.logger.debug(
+            f'{name} - {wall_seconds:.3f}s wall, {cpu_seconds:.3f}s cpu, '
+            f'{stage_run.rows_in} rows in, {stage_run.rows_out} rows out'
+            + (f', {peak_mb:.1f} MB peak' if peak_mb is not None else ''))
+
+    def _start_sampler(self, name):
+        '''Starts the sampling thread of a profiled stage'''
+        thread_id = threading.get_ident()
+        stop = threading.Event()
+        stacks = self.profiles.setdefault(name, Counter())
+
+        def sample():
+            while not stop.wait(self.profile_interval):
+                frame = sys._current_frames().get(thread_id)
+                stack = []
+
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f'{os.path.basename(code.co_filename)}:'
+                                 f'{code.co_name}')
+                    frame = frame.f_back
+
+                stacks[';'.join(reversed(stack))] += 1
+
+        thread = threading.Thread(target=sample, daemon=True)
+        thread.start()
+
+        return stop, thread
+
+    def _stop_sampler(self, name, stop, thread):
+        stop.set()
+        thread.join()
+
+        self.logger.debug(f'{name} - {sum(self.profiles[name].values())} '
+                          f'profile samples')
+
+    def instrument(self, instance, prefix=None, methods=None):
+        '''Measures the methods of an object as stages named
+                                                    {prefix}.{method}
+
+            Input arguments:
+                instance (object) - object whose methods are measured
+                prefix (str)      - stage name prefix
+                                        default value is the module name of
+                                        the object class
+                methods (list)    - method names
+                                        default value is None (all the
+                                        public methods of the class)
+            Output argument:
+                instance (object)
+        '''
+        if not self.enabled:
+            return instance
+
+        cls = type(instance)
+        prefix = prefix or cls.__module__
+
+        if methods is None:
+            methods = [name for name, value in vars(cls).items()
+                       if inspect.isfunction(value)
+                       and not name.startswith('_')]
+
+        for method in methods:
+            setattr(instance, method, _InstrumentedMethod(
+                self, f'{prefix}.{method}', instance,
+                getattr(cls, method)))
+
+        return instance
+
+    def report(self):
+        '''Returns the run report
+
+            Output argument:
+                report (dict) - run start, elapsed time and metrics of every
+                                stage
+        '''
+        return {
+            'run': self.started.isoformat(timespec='seconds'),
+            'wall_seconds': round(time.perf_counter() - self.start, 3),
+            'traced_peak_mb': (round(self._traced_peak() / 1024 ** 2, 1)
+                               if self.trace_memory else None),
+            'stages': {
+                name: {key: (round(value, 3) if isinstance(value, float)
+                             else value)
+                       for key, value in metric.items()}
+                for name, metric in self.stages.items()},
+        }
+
+    def _prometheus_lines(self, report):
+        prefix = self.METRIC_PREFIX
+        lines = [
+            f'# HELP {prefix}_run_timestamp_seconds Start of the run',
+            f'# TYPE {prefix}_run_timestamp_seconds gauge',
+            f'{prefix}_run_timestamp_seconds '
+            f'{self.started.timestamp():.0f}',
+            f'# HELP {prefix}_run_wall_seconds Elapsed time of the run',
+            f'# TYPE {prefix}_run_wall_seconds gauge',
+            f'{prefix}_run_wall_seconds {report["wall_seconds"]}',
+        ]
+
+        for key, (metric, metric_type, description) in (
+                self.PROMETHEUS_METRICS.items()):
+            lines += [f'# HELP {prefix}_stage_{metric} {description}',
+                      f'# TYPE {prefix}_stage_{metric} {metric_type}']
+            lines += [f'{prefix}_stage_{metric}{{stage="{name}"}} '
+                      f'{stage[key]}'
+                      for name, stage in report['stages'].items()
+                      if stage[key] is not None]
+
+        return lines
+
+    def _write_file(self, file_name, content):
+        '''Writes a file of the metrics folder through a temporary file, so
+                        the textfile collector never reads a partial file'''
+        file_path = f'{self.metrics_folder}/{file_name}'
+
+        with open(f'{file_path}.tmp', 'w') as f:
+            f.write(content)
+        os.replace(f'{file_path}.tmp', file_path)
+
+    def write(self):
+        '''Writes the JSON run report, the Prometheus textfile and the
+                                            profiles of the profiled stages'''
+        if not self.enabled:
+            return
+
+        if not os.path.exists(self.metrics_folder):
+            os.makedirs(self.metrics_folder)
+
+        report = self.report()
+
+        self._write_file('run_report.json', json.dumps(report, indent=2))
+        self._write_file(f'{self.METRIC_PREFIX}.prom',
+                         '\n'.join(self._prometheus_lines(report)) + '\n')
+
+        for name, stacks in self.profiles.items():
+            self._write_file(f'profile-{name}.txt', ''.join(
+                f'{stack} {count}\n'
+                for stack, count in stacks.most_common()))
+
+        self.logger.info(f'Run metrics written into {self.metrics_folder}')
+
+    def __getstate__(self):
+        # Profiles of the sampling threads are kept only in this process
+        state = self.__dict__.copy()
+        state['profiles'] = {}
+        state['profile_stages'] = set()
+        return state
+
+    def __repr__(self):
+        return f'''StageMetrics('{self.metrics_folder}', {self.enabled},
+                    {self.trace_memory}, {sorted(self.profile_stages)})'''
@@ -0,0 +1,272 @@
+'''This module generates synthetic data files for the score calculation.
+
+Details:
+    The parquet files follow data_file_meta_data.json (file names and
+    columns), so effulgenz_score.py and score_benchmark.py run on them
+    without a cassandra keyspace. Employees are generated in chunks and
+    every chunk is written as a row group, so large populations (10M
+    employees) are generated with bounded memory.
+        domains, technologies and certificates - long tailed (zipf)
+        work history - 1 to 8 jobs, log normal job duration
+        certificates - completion dates skewed to the recent years
+        interviews   - poisson no. of interviews in the last 2 years
+
+    Ex. python synthetic_data.py --employees 1000000 --data-folder data
+'''
+
+import argparse
+import json
+import logging.config
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# Initialize log
+logger = logging.getLogger(__name__)
+
+# Population sizes of the benchmark
+SIZES = {'10k': 10_000, '1m': 1_000_000, '10m': 10_000_000}
+
+EDUCATION_TYPES = ['Undergraduate/Bachelor of Engineering',
+                   'Postgraduate/Master of Engineering', 'High School',
+                   'Phd', 'Diploma']
+EDUCATION_WEIGHTS = [0.45, 0.25, 0.15, 0.05, 0.10]
+
+INTERVIEW_STATUS = ['Selected', 'Rejected', 'Scheduled', 'Cancelled']
+INTERVIEW_WEIGHTS = [0.3, 0.45, 0.15, 0.1]
+
+
+def zipf_weights(size, exponent=1.1):
+    '''Returns long tailed weights of the categories
+
+    Args:
+        size (int): no. of categories
+        exponent (float, optional): zipf exponent. Defaults to 1.1.
+
+    Returns:
+        array: weight of every category, sum is 1
+    '''
+    weights = 1 / np.arange(1, size + 1) ** exponent
+
+    return weights / weights.sum()
+
+
+class SyntheticData:
+    '''SyntheticData class generates the data files
+        Functions:
+            personal_info
+            work_info
+            employee_technology_stack
+            certificate_info
+            education_info
+            interview_schedule
+            generate
+    '''
+
+    def __init__(self, data_file_details, data_folder='data', seed=1,
+                 domains=40, technologies=5000, certificates=2000):
+        self.logger = logging.getLogger(__name__)
+        self.data_file_details = data_file_details
+        self.data_folder = data_folder
+        self.rng = np.random.default_rng(seed)
+        self.today = pd.Timestamp.today().normalize()
+
+        self.domains = np.array([f'domain_{i}' for i in range(domains)])
+        self.domain_weights = zipf_weights(domains, 0.8)
+        self.technologies = np.array(
+            [f'technology_{i}' for i in range(technologies)])
+        self.technology_weights = zipf_weights(technologies)
+        self.certificates = np.array(
+            [f'certificate_{i}' for i in range(certificates)])
+        self.certificate_weights = zipf_weights(certificates)
+
+    def _days_ago(self, days):
+        return self.today - pd.to_timedelta(days, unit='D')
+
+    def _repeat(self, emp_ids, mean, max_count):
+        '''Returns emp_id repeated by a poisson no. of rows'''
+        counts = np.minimum(self.rng.poisson(mean, len(emp_ids)), max_count)
+
+        return np.repeat(emp_ids, counts)
+
+    def personal_info(self, emp_ids, start_id):
+        size = len(emp_ids)
+        job_start_date = self._days_ago(self.rng.integers(30, 7000, size))
+
+        return pd.DataFrame({
+            'emp_id': emp_ids,
+            'current_emp_name': 'employee',
+            'current_emp_title': 'title',
+            'job_end_date': pd.NaT,
+            'job_start_date': job_start_date,
+            'job_title': 'title',
+            'updated_time': self._days_ago(self.rng.integers(0, 365, size)),
+            'recalculate_score_eligible': self.rng.choice(
+                ['Y', 'N'], size, p=[0.3, 0.7]),
+        })
+
+    def work_info(self, emp_ids, start_id):
+        work_emp_ids = np.repeat(emp_ids, self.rng.integers(1, 9,
+                                                            len(emp_ids)))
+        size = len(work_emp_ids)
+
+        duration = np.minimum(
+            self.rng.lognormal(6.5, 0.8, size).astype('int64'), 6000)
+        end_days = self.rng.integers(0, 6000, size)
+        is_currently = self.rng.random(size) < 0.1
+        end_days[is_currently] = 0
+
+        return pd.DataFrame({
+            'work_exp_id': np.arange(start_id * 8, start_id * 8 + size),
+            'emp_id': work_emp_ids,
+            'company_name': 'company',
+            'domain': self.rng.choice(self.domains, size,
+                                      p=self.domain_weights),
+            'employeement_type': self.rng.choice(
+                ['Permanent', 'Contracting'], size, p=[0.75, 0.25]),
+            'end_date': self._days_ago(end_days),
+            'is_currently': is_currently,
+            'location': 'location',
+            'skills_used': 'skills',
+            'start_date': self._days_ago(end_days + duration),
+            'title': 'title',
+            'updated_time': self._days_ago(self.rng.integers(0, 365, size)),
+        })
+
+    def employee_technology_stack(self, emp_ids, start_id):
+        tech_emp_ids = self._repeat(emp_ids, 6, 40)
+        size = len(tech_emp_ids)
+
+        return pd.DataFrame({
+            'technology_id': np.arange(start_id * 40, start_id * 40 + size),
+            'technology_description': self.rng.choice(
+                self.technologies, size, p=self.technology_weights),
+            'emp_id': tech_emp_ids,
+            'experience': self.rng.integers(1, 15, size),
+            'status': 'active',
+            'technology_scale': self.rng.integers(1, 6, size),
+            'updated_time': self._days_ago(self.rng.integers(0, 365, size)),
+        })
+
+    def certificate_info(self, emp_ids, start_id):
+        cert_emp_ids = self._repeat(emp_ids, 1.5, 20)
+        size = len(cert_emp_ids)
+
+        return pd.DataFrame({
+            'certificate_id': np.arange(start_id * 20, start_id * 20 + size),
+            'emp_id': cert_emp_ids,
+            'certificate_company_name': 'company',
+            'certificate_completion_date': self._days_ago(np.minimum(
+                self.rng.exponential(900, size).astype('int64'), 5000)),
+            'certificate_level_desc': 'level',
+            'certificate_level_id': self.rng.integers(1, 4, size),
+            'certificate_name': self.rng.choice(
+                self.certificates, size, p=self.certificate_weights),
+            'updated_time': self._days_ago(self.rng.integers(0, 365, size)),
+        })
+
+    def education_info(self, emp_ids, start_id):
+        edu_emp_ids = np.repeat(emp_ids, self.rng.integers(1, 3,
+                                                           len(emp_ids)))
+        size = len(edu_emp_ids)
+
+        return pd.DataFrame({
+            'education_id': np.arange(start_id * 2, start_id * 2 + size),
+            'emp_id': edu_emp_ids,
+            'education_type_desc': self.rng.choice(
+                EDUCATION_TYPES, size, p=EDUCATION_WEIGHTS),
+            'institution_name': 'institution',
+            'updated_time': self._days_ago(self.rng.integers(0, 365, size)),
+        })
+
+    def interview_schedule(self, emp_ids, start_id):
+        int_emp_ids = self._repeat(emp_ids, 2, 30)
+        size = len(int_emp_ids)
+
+        return pd.DataFrame({
+            'int_id': np.arange(start_id * 30, start_id * 30 + size),
+            'comp_id': self.rng.integers(1, 1000, size),
+            'emp_id': int_emp_ids,
+            'int_status_desc': self.rng.choice(
+                INTERVIEW_STATUS, size, p=INTERVIEW_WEIGHTS),
+            'int_date': self._days_ago(self.rng.integers(0, 730, size)),
+            'updated_time': self._days_ago(self.rng.integers(0, 365, size)),
+        })
+
+    def generate(self, employees, chunk_size=250_000):
+        '''Writes all the data files, every chunk of employees is a row group
+
+        Args:
+            employees (int): no. of employees
+            chunk_size (int, optional): employees of a row group.
+                                        Defaults to 250000.
+
+        Returns:
+            dict: no. of rows of every data file
+        '''
+        if not os.path.exists(self.data_folder):
+            os.makedirs(self.data_folder)
+
+        writers = {}
+        rows = {name: 0 for name in self.data_file_details}
+
+        try:
+            for start_id in range(0, employees, chunk_size):
+                emp_ids = np.array([
+                    f'E{emp_no:09d}' for emp_no in range(
+                        start_id, min(start_id + chunk_size, employees))],
+                    dtype='object')
+
+                for name, details in self.data_file_details.items():
+                    table = pa.Table.from_pandas(
+                        getattr(self, name)(emp_ids, start_id),
+                        preserve_index=False)
+
+                    if name not in writers:
+                        writers[name] = pq.ParquetWriter(
+                            f'{self.data_folder}/{details["file_name"]}',
+                            table.schema)
+
+                    writers[name].write_table(table)
+                    rows[name] += table.num_rows
+
+                self.logger.debug(f'{start_id + len(emp_ids)} employees '
+                                  f'generated')
+        finally:
+            for writer in writers.values():
+                writer.close()
+
+        self.logger.info(f'Synthetic data rows - {rows}')
+
+        return rows
+
+
+def main():
+    '''Generates the synthetic data files'''
+    parser = argparse.ArgumentParser(
+        description='Generates synthetic data files of the score '
+                    'calculation.')
+    parser.add_argument('--employees', default='10k',
+                        help=f'no. of employees or one of {list(SIZES)}')
+    parser.add_argument('--data-folder', default='data')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--chunk-size', type=int, default=250_000,
+                        help='employees of a row group')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+
+    with open('data_file_meta_data.json') as f:
+        data_file_details = json.load(f)
+
+    employees = SIZES.get(args.employees.lower()) or int(args.employees)
+
+    SyntheticData(data_file_details, args.data_folder,
+                  args.seed).generate(employees, args.chunk_size)
+
+
+if __name__ == '__main__':
+    main()
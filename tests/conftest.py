@@ -0,0 +1,97 @@
+'''Shared fixtures of the score calculation tests.
+
+Details:
+    The tests run on the synthetic data files of synthetic_data.py, the
+    repository root is added to the module search path so the flat
+    modules are imported as in effulgenz_score.py. Score store table of
+    the full score mode is shared by the equivalence tests.
+'''
+
+import json
+import os
+import sys
+from datetime import datetime
+
+import pytest
+
+ROOT_FOLDER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+sys.path.insert(0, ROOT_FOLDER)
+
+from parquet_loader import ParquetLoader  # noqa: E402
+from population_statistics import PopulationStatistics  # noqa: E402
+from score_pipeline import ScorePipeline  # noqa: E402
+from score_store import ScoreStore  # noqa: E402
+from synthetic_data import SyntheticData  # noqa: E402
+
+
+@pytest.fixture(scope='session')
+def data_file_details():
+    with open(f'{ROOT_FOLDER}/data_file_meta_data.json') as f:
+        return json.load(f)
+
+
+@pytest.fixture(scope='session')
+def data_folder(data_file_details, tmp_path_factory):
+    data_folder = str(tmp_path_factory.mktemp('data'))
+    SyntheticData(data_file_details, data_folder, seed=7).generate(
+        600, chunk_size=200)
+
+    return data_folder
+
+
+@pytest.fixture(scope='session')
+def loader(data_file_details, data_folder):
+    return ParquetLoader(data_file_details, data_folder)
+
+
+@pytest.fixture
+def tables(loader):
+    '''Returns every data file as a dataframe'''
+    return {name: loader.load(name) for name in loader.data_file_details}
+
+
+RUN = datetime(2021, 1, 1)
+
+
+def _score_table(loader, backend='pandas', personal_score_engine='pandas',
+                 lean=False):
+    '''Score store table of the full score mode of effulgenz_score.py'''
+    sp = ScorePipeline(personal_score_engine, lean=lean, backend=backend)
+    load = loader.load_table if backend == 'arrow' else loader.load
+
+    personal_info_df = loader.load('personal_info')
+    score_eligible_prof_df = personal_info_df[
+        personal_info_df.recalculate_score_eligible == 'Y']
+
+    population_dfs = sp.population_frames(
+        personal_info_df, load('work_info'),
+        load('employee_technology_stack'), load('certificate_info'))
+
+    stats = PopulationStatistics()
+    stats.build(population_dfs)
+
+    eligible_dfs = sp.eligible_frames(
+        score_eligible_prof_df, population_dfs, load('certificate_info'),
+        load('education_info'), load('interview_schedule'))
+
+    return ScoreStore().build(
+        sp.market_scores(eligible_dfs, stats.ratios()),
+        sp.personal_scores(eligible_dfs, score_eligible_prof_df['emp_id']),
+        RUN)
+
+
+def normalized(score_table):
+    '''Score store rows with the category lists in category order, the row
+                                        order of the Arrow backend differs'''
+    score_df = score_table.to_pandas()
+
+    for score_cols in ScoreStore.LIST_COLUMNS.values():
+        pairs = [sorted(zip(*values), key=str)
+                 for values in zip(*[score_df[col] for col in score_cols])]
+
+        for position, col in enumerate(score_cols):
+            score_df[col] = [[pair[position] for pair in row_pairs]
+                             for row_pairs in pairs]
+
+    return score_df
@@ -0,0 +1,228 @@
+'''Tests of the parquet pull of the cassandra result sets.'''
+
+import os
+import threading
+import time
+from datetime import datetime
+from types import SimpleNamespace
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+from cassandra import cqltypes
+
+import cassandra_connection as cc
+
+
+class FakeResult:
+    '''Paged result set of the cassandra driver with canned pages'''
+
+    def __init__(self, column_names, column_types, pages, row_factory):
+        self.column_names = column_names
+        self.column_types = column_types
+        self.pages = [row_factory(column_names, rows) for rows in pages]
+        self._current_rows = self.pages.pop(0)
+
+    @property
+    def has_more_pages(self):
+        return bool(self.pages)
+
+    def fetch_next_page(self):
+        self._current_rows = self.pages.pop(0)
+
+
+class FakeSession:
+    '''Session which returns the canned pages of one query'''
+
+    keyspace = 'keyspace'
+
+    def __init__(self, column_names, column_types, pages):
+        self.column_names = column_names
+        self.column_types = column_types
+        self.pages = pages
+
+    def prepare(self, query):
+        return FakeStatement()
+
+    def execute(self, statement, timeout=None, execution_profile=None):
+        pandas_profile = cc.CassandraCluster.PANDAS_PROFILE
+        row_factory = (cc.pandas_factory
+                       if execution_profile == pandas_profile
+                       else cc.column_factory)
+
+        return FakeResult(self.column_names, self.column_types,
+                          self.pages, row_factory)
+
+
+class FakeStatement:
+    is_idempotent = False
+
+    def bind(self, parameters):
+        return self
+
+
+class FakeScanSession(FakeSession):
+    '''Session with the table metadata used by token_range_scan, the
+                        canned pages of a query depend on its token range'''
+
+    def __init__(self, tables, range_pages=lambda parameters: [[]]):
+        super().__init__(COLUMN_NAMES, COLUMN_TYPES, None)
+        self.range_pages = range_pages
+        self.queries = []
+        self.parameters = []
+        self.cluster = SimpleNamespace(metadata=SimpleNamespace(keyspaces={
+            'keyspace': SimpleNamespace(tables={
+                table: SimpleNamespace(
+                    partition_key=[SimpleNamespace(name='emp_id')])
+                for table in tables})}))
+
+    def prepare(self, query):
+        self.queries.append(query)
+        return FakeRangeStatement()
+
+    def execute(self, statement, timeout=None, execution_profile=None):
+        self.parameters.append(statement.parameters)
+        row_factory = (cc.pandas_factory
+                       if execution_profile == cc.CassandraCluster
+                       .PANDAS_PROFILE else cc.column_factory)
+
+        return FakeResult(self.column_names, self.column_types,
+                          self.range_pages(statement.parameters),
+                          row_factory)
+
+
+class FakeRangeStatement(FakeStatement):
+    def bind(self, parameters):
+        return SimpleNamespace(parameters=tuple(parameters))
+
+
+COLUMN_NAMES = ['emp_id', 'no_of_certs', 'updated_time']
+COLUMN_TYPES = [cqltypes.UTF8Type, cqltypes.Int32Type,
+                cqltypes.DateType]
+
+# First page has only missing values, the second page has an integer
+# column with a missing value
+PAGES = [
+    [('E1', None, None), ('E2', None, None)],
+    [('E3', 4, datetime(2021, 1, 1)), ('E4', None, datetime(2021, 2, 1))],
+    [('E5', 7, datetime(2021, 3, 1))],
+]
+
+
+@pytest.mark.parametrize('pull_engine', ['pandas', 'arrow'])
+def test_parquet_result_set_cql_types(pull_engine, tmp_path):
+    cas_con = cc.CassandraCluster('127.0.0.1', 9042, 'user', 'pwd',
+                                  pull_engine)
+    file_path = str(tmp_path / 'table.parquet')
+    tables = []
+
+    rows = cas_con.parquet_result_set(
+        FakeSession(COLUMN_NAMES, COLUMN_TYPES, PAGES), 'keyspace',
+        'SELECT * FROM table', file_path, 2, tables=tables)
+
+    table = pq.read_table(file_path)
+
+    assert rows == 5
+    assert table.schema.types == [pa.string(), pa.int32(),
+                                  pa.timestamp('us')]
+    assert table.column('no_of_certs').to_pylist() == [
+        None, None, 4, None, 7]
+    assert all(page_table.schema.equals(tables[0].schema)
+               for page_table in tables)
+
+
+def test_empty_result_set_cql_types(tmp_path):
+    cas_con = cc.CassandraCluster('127.0.0.1', 9042, 'user', 'pwd',
+                                  'pandas')
+    file_path = str(tmp_path / 'table.parquet')
+
+    rows = cas_con.parquet_result_set(
+        FakeSession(COLUMN_NAMES, COLUMN_TYPES, [[]]), 'keyspace',
+        'SELECT * FROM table', file_path)
+
+    assert rows == 0
+    assert pq.read_schema(file_path).types == [
+        pa.string(), pa.int32(), pa.timestamp('us')]
+
+
+def test_export_tables_share_in_flight_budget(tmp_path):
+    cas_con = cc.CassandraCluster('127.0.0.1', 9042, 'user', 'pwd')
+    tables = ['work', 'skills', 'education', 'interview']
+    lock = threading.Lock()
+    queries = {'running': 0, 'max_running': 0}
+
+    def parquet_result_set(session, keyspace, query, file_path,
+                           fetch_size=5000, parameters=None, tables=None):
+        with lock:
+            queries['running'] += 1
+            queries['max_running'] = max(queries['max_running'],
+                                         queries['running'])
+        time.sleep(0.01)
+        pq.write_table(pa.table({'emp_id': ['E1']}), file_path)
+
+        with lock:
+            queries['running'] -= 1
+
+        return 1
+
+    cas_con.parquet_result_set = parquet_result_set
+
+    # Token ranges of 2 tables and 2 other tables, 3 queries at a time
+    export_df = cas_con.export_tables(
+        FakeScanSession(tables), 'keyspace',
+        {table: f'SELECT * FROM {table}' for table in tables},
+        str(tmp_path), max_in_flight=3,
+        token_splits={'work': 8, 'skills': 8})
+
+    assert export_df['rows'].tolist() == [8, 8, 1, 1]
+    assert queries['max_running'] <= 3
+
+
+def test_token_range_scan(tmp_path):
+    cas_con = cc.CassandraCluster('127.0.0.1', 9042, 'user', 'pwd')
+    dataset_path = str(tmp_path / 'work.parquet')
+    bounds = [cc.MIN_TOKEN + (cc.MAX_TOKEN - cc.MIN_TOKEN) * split // 4
+              for split in range(4)] + [cc.MAX_TOKEN]
+
+    # Rows only in the second and the last token range
+    def range_pages(parameters):
+        if parameters[0] in (bounds[1], bounds[3]):
+            return [[('E1', 1, datetime(2021, 1, 1))]]
+        return [[]]
+
+    # Previous single file snapshot and a temporary directory of a failed
+    # scan are replaced
+    pq.write_table(pa.table({'emp_id': ['E0']}), dataset_path)
+    (tmp_path / 'work.parquet.tmp').mkdir()
+    (tmp_path / 'work.parquet.tmp' / 'part-00009.parquet').write_text('')
+
+    session = FakeScanSession(['work'], range_pages)
+    rows = cas_con.token_range_scan(session, 'keyspace', 'work',
+                                    'SELECT * FROM work', dataset_path, 4)
+
+    assert rows == 2
+    assert session.queries == [
+        'SELECT * FROM work WHERE token(emp_id) > ? AND token(emp_id) <= ?']
+    assert sorted(session.parameters) == list(zip(bounds, bounds[1:]))
+    assert sorted(os.listdir(tmp_path)) == ['work.parquet']
+
+    # Empty token ranges are removed
+    assert sorted(os.listdir(dataset_path)) == ['part-00001.parquet',
+                                                'part-00003.parquet']
+    assert pq.read_table(dataset_path).column('emp_id').to_pylist() == [
+        'E1', 'E1']
+
+
+def test_token_range_scan_of_empty_table(tmp_path):
+    cas_con = cc.CassandraCluster('127.0.0.1', 9042, 'user', 'pwd')
+    dataset_path = str(tmp_path / 'work.parquet')
+
+    rows = cas_con.token_range_scan(FakeScanSession(['work']), 'keyspace',
+                                    'work', 'SELECT * FROM work',
+                                    dataset_path, 4)
+
+    # First fragment is kept for the column types of the table
+    assert rows == 0
+    assert os.listdir(dataset_path) == ['part-00000.parquet']
+    assert pq.read_schema(f'{dataset_path}/part-00000.parquet').types == [
+        pa.string(), pa.int32(), pa.timestamp('us')]
@@ -0,0 +1,86 @@
+'''Tests of the upsert of the incremental pull.'''
+
+import os
+from datetime import datetime
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from delta_pull import DeltaPull
+
+SCHEMA = pa.schema([('emp_id', pa.string()), ('no_of_certs', pa.int32()),
+                    ('updated_time', pa.timestamp('us'))])
+
+
+def _table(rows):
+    return pa.Table.from_pylist(
+        [dict(zip(SCHEMA.names, row)) for row in rows], schema=SCHEMA)
+
+
+def _rows(file_path):
+    return sorted(pq.read_table(file_path).to_pylist(),
+                  key=lambda row: row['emp_id'])
+
+
+def test_upsert_keeps_snapshot_schema(tmp_path):
+    file_path = str(tmp_path / 'table.parquet')
+    delta_path = f'{file_path}.delta'
+    pq.write_table(_table([('E1', 1, datetime(2021, 1, 1)),
+                           ('E2', None, datetime(2021, 1, 1))]), file_path)
+
+    # Pandas engine may write a delta without the integer type
+    pq.write_table(pa.table({
+        'emp_id': ['E2', 'E3'], 'no_of_certs': [3.0, None],
+        'updated_time': pa.array([datetime(2021, 2, 1)] * 2,
+                                 pa.timestamp('ns'))}), delta_path)
+
+    delta_pull = DeltaPull(None, None, 'keyspace', str(tmp_path))
+    delta_table = delta_pull.upsert_snapshot(file_path, delta_path,
+                                             ['emp_id'])
+
+    assert delta_table.num_rows == 2
+    assert pq.read_schema(file_path).types == SCHEMA.types
+    assert [row['no_of_certs'] for row in _rows(file_path)] == [1, 3, None]
+
+
+def test_upsert_rewrites_affected_fragments(tmp_path):
+    dataset_path = str(tmp_path / 'table.parquet')
+    delta_path = f'{dataset_path}.delta'
+    os.makedirs(dataset_path)
+
+    fragments = [[('E1', 1, datetime(2021, 1, 1))],
+                 [('E2', 2, datetime(2021, 1, 1)),
+                  ('E5', 5, datetime(2021, 1, 1))],
+                 [('E3', 3, datetime(2021, 1, 1))]]
+    for part, rows in enumerate(fragments):
+        pq.write_table(_table(rows),
+                       f'{dataset_path}/part-{part:05d}.parquet')
+
+    untouched_path = f'{dataset_path}/part-00000.parquet'
+    mtime_ns = os.stat(untouched_path).st_mtime_ns
+
+    # Same key twice in the delta, the last row is kept
+    pq.write_table(_table([('E2', 4, datetime(2021, 2, 1)),
+                           ('E3', 5, datetime(2021, 2, 1)),
+                           ('E3', 6, datetime(2021, 3, 1)),
+                           ('E4', None, datetime(2021, 3, 1))]), delta_path)
+
+    delta_pull = DeltaPull(None, None, 'keyspace', str(tmp_path))
+    delta_pull.upsert_snapshot(dataset_path, delta_path, ['emp_id'])
+
+    # Fragment without an upserted key is not written, a fragment whose
+    # rows are all upserted is removed
+    assert os.stat(untouched_path).st_mtime_ns == mtime_ns
+    assert sorted(os.listdir(dataset_path)) == [
+        'delta-00000.parquet', 'part-00000.parquet', 'part-00001.parquet']
+    assert _rows(dataset_path) == [
+        {'emp_id': 'E1', 'no_of_certs': 1,
+         'updated_time': datetime(2021, 1, 1)},
+        {'emp_id': 'E2', 'no_of_certs': 4,
+         'updated_time': datetime(2021, 2, 1)},
+        {'emp_id': 'E3', 'no_of_certs': 6,
+         'updated_time': datetime(2021, 3, 1)},
+        {'emp_id': 'E4', 'no_of_certs': None,
+         'updated_time': datetime(2021, 3, 1)},
+        {'emp_id': 'E5', 'no_of_certs': 5,
+         'updated_time': datetime(2021, 1, 1)}]
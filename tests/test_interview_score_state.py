@@ -0,0 +1,198 @@
+'''Tests of the interview score state.'''
+
+import pandas as pd
+import pandas.testing as pdt
+
+import segment_kernels as sk
+from interview_score_state import InterviewScoreState
+from personal_score_calculator import PersonalScoreCalculator
+from score_pipeline import ScorePipeline
+from stage_cache import StageCache
+
+
+def _run(tables, cache, state_folder):
+    '''One run of effulgenz_score.py with the stage cache and the state'''
+    interview_state = InterviewScoreState(state_folder)
+    if interview_state.exists():
+        interview_state.load()
+
+    sp = ScorePipeline(interview_state=interview_state)
+
+    personal_info_df = tables['personal_info']
+    score_eligible_prof_df = personal_info_df[
+        personal_info_df.recalculate_score_eligible == 'Y']
+
+    population_dfs = cache.get_or_compute(
+        'population_frames', 'population',
+        lambda: sp.population_frames(
+            personal_info_df, tables['work_info'],
+            tables['employee_technology_stack'],
+            tables['certificate_info']))
+    eligible_dfs = cache.get_or_compute(
+        'eligible_frames', 'eligible',
+        lambda: sp.eligible_frames(
+            score_eligible_prof_df, population_dfs,
+            tables['certificate_info'], tables['education_info'],
+            tables['interview_schedule']))
+
+    score_dfs = sp.personal_scores(eligible_dfs,
+                                   score_eligible_prof_df['emp_id'])
+    interview_state.save()
+
+    return eligible_dfs, score_dfs['interview_score_df']
+
+
+def test_cached_pipeline_rerun(tables, tmp_path):
+    cache = StageCache(str(tmp_path / 'cache'))
+    state_folder = str(tmp_path / 'state')
+
+    eligible_dfs, first_df = _run(tables, cache, state_folder)
+    # Eligible frames are read from the cache, eligible_frames is not run
+    assert cache.contains('eligible_frames', 'eligible')
+    _, second_df = _run(tables, cache, state_folder)
+
+    expected_df = PersonalScoreCalculator().interview_score(
+        eligible_dfs['int'])[['emp_id', 'interview_score']]
+    expected_df = expected_df.sort_values('emp_id').reset_index(drop=True)
+
+    for score_df in (first_df, second_df):
+        pdt.assert_frame_equal(
+            score_df.reset_index(drop=True), expected_df,
+            check_dtype=False)
+
+
+def _expected_scores(interview_df):
+    expected_df = PersonalScoreCalculator().interview_score(interview_df)
+
+    return expected_df[['emp_id', 'interview_score']].sort_values(
+        'emp_id').reset_index(drop=True)
+
+
+def _changed_interviews(interview_df):
+    '''Changes a status, removes an interview and adds a late interview'''
+    updated_time = interview_df['updated_time'].max() + pd.Timedelta(
+        days=1)
+    interview_df = interview_df.copy()
+    interview_df['int_status_desc'] = interview_df[
+        'int_status_desc'].astype('object')
+
+    interview_df.loc[0, ['int_status_desc', 'updated_time']] = [
+        'Selected' if interview_df.loc[0, 'int_status_desc'] == 'Rejected'
+        else 'Rejected', updated_time]
+    late_df = interview_df.iloc[[2]].assign(
+        int_id=interview_df['int_id'].max() + 1,
+        int_date=interview_df['int_date'].min() - pd.Timedelta(days=1),
+        int_status_desc='Selected', updated_time=updated_time)
+
+    return pd.concat([interview_df.drop(index=1), late_df],
+                     ignore_index=True)
+
+
+def test_fold_matches_recalculation(tables, tmp_path):
+    interview_df = tables['interview_schedule']
+    emp_ids = tables['personal_info']['emp_id']
+
+    interview_state = InterviewScoreState(str(tmp_path), partitions=4)
+    interview_state.fold(interview_df, emp_ids)
+    interview_state.save()
+
+    changed_df = _changed_interviews(interview_df)
+
+    interview_state = InterviewScoreState(str(tmp_path), partitions=4)
+    interview_state.load()
+    interview_state.fold(changed_df, emp_ids)
+
+    pdt.assert_frame_equal(interview_state.scores(emp_ids),
+                           _expected_scores(changed_df), check_dtype=False)
+
+
+def test_fold_skips_interviews_before_watermark(tables, tmp_path):
+    interview_df = tables['interview_schedule']
+    emp_ids = tables['personal_info']['emp_id']
+
+    interview_state = InterviewScoreState(str(tmp_path), partitions=4)
+    interview_state.fold(interview_df, emp_ids)
+    interview_state.save()
+
+    watermark = interview_df.groupby('emp_id', observed=True)[
+        'updated_time'].max()
+    pdt.assert_series_equal(
+        interview_state.employees['updated_time'].sort_index(),
+        watermark.reindex(interview_state.employees.index).sort_index(),
+        check_names=False)
+
+    # Changed interview with an old updated_time is not compared again
+    stale_df = interview_df.copy()
+    stale_df['int_status_desc'] = stale_df['int_status_desc'].astype(
+        'object')
+    stale_df.loc[0, 'int_status_desc'] = (
+        'Selected' if stale_df.loc[0, 'int_status_desc'] == 'Rejected'
+        else 'Rejected')
+    stale_df.loc[0, 'updated_time'] = interview_df['updated_time'].min()
+
+    interview_state.fold(stale_df, emp_ids)
+    pdt.assert_frame_equal(interview_state.scores(emp_ids),
+                           _expected_scores(interview_df),
+                           check_dtype=False)
+    assert not interview_state.changed_parts
+
+
+def test_save_writes_changed_partitions(tables, tmp_path):
+    interview_df = tables['interview_schedule']
+    emp_ids = tables['personal_info']['emp_id']
+
+    interview_state = InterviewScoreState(str(tmp_path), partitions=4)
+    interview_state.fold(interview_df, emp_ids)
+    interview_state.save()
+
+    changed_df = _changed_interviews(interview_df)
+    interview_state.fold(changed_df, emp_ids)
+
+    changed_parts = set(sk.emp_partitions(
+        interview_df.loc[[0, 1, 2], 'emp_id'], 4).tolist())
+    assert interview_state.changed_parts == changed_parts
+
+    interview_state.save()
+
+    reloaded_state = InterviewScoreState(str(tmp_path), partitions=4)
+    reloaded_state.load()
+    pdt.assert_frame_equal(reloaded_state.scores(emp_ids),
+                           _expected_scores(changed_df), check_dtype=False)
+
+
+def test_fold_after_employee_is_not_folded(tables, tmp_path):
+    interview_df = tables['interview_schedule']
+    emp_ids = tables['personal_info']['emp_id']
+
+    interview_state = InterviewScoreState(str(tmp_path), partitions=4)
+    interview_state.fold(interview_df, emp_ids)
+    interview_state.save()
+
+    # Employee which is not score eligible gets a new interview, another
+    # employee gets a later one in the same run
+    skipped_id, folded_id = interview_df['emp_id'].unique()[:2]
+    updated_time = interview_df['updated_time'].max()
+    new_df = interview_df.iloc[[0, 1]].assign(
+        int_id=[interview_df['int_id'].max() + 1,
+                interview_df['int_id'].max() + 2],
+        emp_id=[skipped_id, folded_id],
+        int_date=interview_df['int_date'].max() + pd.Timedelta(days=1),
+        int_status_desc='Selected',
+        updated_time=[updated_time + pd.Timedelta(days=1),
+                      updated_time + pd.Timedelta(days=2)])
+    new_interview_df = pd.concat([interview_df, new_df], ignore_index=True)
+
+    eligible_ids = emp_ids[emp_ids != skipped_id]
+    interview_state.fold(
+        new_interview_df[new_interview_df['emp_id'].isin(eligible_ids)],
+        eligible_ids)
+    interview_state.save()
+
+    # Employee is score eligible again
+    interview_state = InterviewScoreState(str(tmp_path), partitions=4)
+    interview_state.load()
+    interview_state.fold(new_interview_df, emp_ids)
+
+    pdt.assert_frame_equal(interview_state.scores(emp_ids),
+                           _expected_scores(new_interview_df),
+                           check_dtype=False)
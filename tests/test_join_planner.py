@@ -0,0 +1,73 @@
+'''Tests of the shared semi joins.'''
+
+import numpy as np
+import pandas as pd
+import pandas.testing as pdt
+import pyarrow as pa
+import pytest
+
+from join_planner import JoinPlanner
+
+
+@pytest.fixture
+def joins():
+    joins = JoinPlanner()
+    joins.key_set('eligible', pd.Series(['e02', 'e05', 'e05', 'e09', None]))
+
+    return joins
+
+
+def _expected(dataframe, keys=('e02', 'e05', 'e09')):
+    return dataframe[dataframe['emp_id'].isin(keys)]
+
+
+def test_sorted_merge_matches_hash_join(joins):
+    rng = np.random.default_rng(7)
+    sorted_df = pd.DataFrame({
+        'emp_id': np.sort(rng.choice([f'e{i:02d}' for i in range(12)],
+                                     60)).astype('object'),
+        'value': np.arange(60)})
+
+    assert sorted_df['emp_id'].is_monotonic_increasing
+
+    # Sorted merge keeps the rows in order, so does the hash join
+    pdt.assert_frame_equal(joins.semi_join(sorted_df, 'eligible'),
+                           _expected(sorted_df))
+
+    unsorted_df = sorted_df.sample(frac=1, random_state=7)
+    pdt.assert_frame_equal(joins.semi_join(unsorted_df, 'eligible'),
+                           _expected(unsorted_df))
+
+
+def test_sorted_merge_without_matches(joins):
+    sorted_df = pd.DataFrame({'emp_id': ['e00', 'e01', 'e10'],
+                              'value': [1, 2, 3]})
+
+    assert joins.semi_join(sorted_df, 'eligible').empty
+
+
+def test_key_set_is_replaced(joins):
+    sorted_df = pd.DataFrame({'emp_id': ['e02', 'e03', 'e05'],
+                              'value': [1, 2, 3]})
+    joins.semi_join(sorted_df, 'eligible')
+
+    joins.key_set('eligible', pd.Series(['e03']))
+
+    pdt.assert_frame_equal(joins.semi_join(sorted_df, 'eligible'),
+                           _expected(sorted_df, ['e03']))
+
+
+def test_arrow_semi_join(joins):
+    dataframe = pd.DataFrame({'emp_id': ['e09', 'e01', 'e05', 'e02', 'e05'],
+                              'value': [1, 2, 3, 4, 5]})
+    table = pa.Table.from_pandas(dataframe, preserve_index=False)
+
+    pdt.assert_frame_equal(
+        joins.semi_join(table, 'eligible').to_pandas(),
+        _expected(dataframe).reset_index(drop=True))
+
+    # Key set is cast to the type of a dictionary encoded join column
+    dict_table = table.set_column(0, 'emp_id',
+                                  table.column('emp_id').dictionary_encode())
+    assert (joins.semi_join(dict_table, 'eligible').column('emp_id')
+            .to_pylist() == ['e09', 'e05', 'e02', 'e05'])
@@ -0,0 +1,124 @@
+'''Equivalence tests of the partitioned score mode.'''
+
+import shutil
+
+import pandas as pd
+import pandas.testing as pdt
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+from conftest import _score_table, normalized
+from interview_score_state import InterviewScoreState
+from parquet_loader import ParquetLoader
+from partitioned_scoring import PartitionedScorer
+from personal_score_calculator import PersonalScoreCalculator
+from score_pipeline import ScorePipeline
+from score_store import ScoreStore
+
+
+def _sorted(score_df):
+    return (score_df.drop(columns='run').sort_values('emp_id')
+            .reset_index(drop=True))
+
+
+def test_partitioned_matches_full(loader, tables, tmp_path):
+    interview_state = InterviewScoreState(str(tmp_path / 'state'))
+    score_store = ScoreStore(str(tmp_path / 'score'))
+
+    # Small memory budget, the data files are spilled into more partitions
+    # than workers and at most one partition is in flight
+    scorer = PartitionedScorer(
+        loader, ScorePipeline(interview_state=interview_state), 64 * 1024,
+        str(tmp_path / 'spill'), workers=2, max_in_flight=1)
+    scorer.run(score_store)
+
+    assert scorer.partitions > 2
+
+    score_df = normalized(pa.Table.from_pandas(score_store.read()))
+    pdt.assert_frame_equal(_sorted(score_df),
+                           _sorted(normalized(_score_table(loader))))
+
+    # Interview score state is folded by this process
+    personal_info_df = tables['personal_info']
+    emp_ids = personal_info_df.loc[
+        personal_info_df.recalculate_score_eligible == 'Y', 'emp_id']
+    interview_df = tables['interview_schedule']
+
+    expected_df = PersonalScoreCalculator().interview_score(
+        interview_df[interview_df['emp_id'].isin(emp_ids)])
+    expected_df = expected_df[['emp_id', 'interview_score']].sort_values(
+        'emp_id').reset_index(drop=True)
+
+    pdt.assert_frame_equal(interview_state.scores(emp_ids), expected_df,
+                           check_dtype=False)
+
+
+def _with_new_interviews(loader, data_folder):
+    '''Copy of the data files with a new interview for every score
+    eligible profile. Later profiles get older updated_time, so the new
+    interviews of every partition are older than the ones of some other
+    partition.'''
+    shutil.copytree(loader.data_folder, data_folder)
+    new_loader = ParquetLoader(loader.data_file_details, data_folder)
+
+    personal_info_df = loader.load('personal_info')
+    emp_ids = personal_info_df.loc[
+        personal_info_df.recalculate_score_eligible == 'Y', 'emp_id']
+
+    file_path = new_loader.file_path('interview_schedule')
+    interview_table = pq.read_table(file_path)
+    interview_df = interview_table.to_pandas()
+
+    new_df = pd.DataFrame({
+        'int_id': interview_df['int_id'].max() + 1 + pd.RangeIndex(
+            len(emp_ids)),
+        'emp_id': emp_ids.values,
+        'int_status_desc': 'Selected',
+        'int_date': interview_df['int_date'].max() + pd.Timedelta(days=1),
+        'updated_time': (interview_df['updated_time'].max()
+                         + pd.to_timedelta(range(len(emp_ids), 0, -1),
+                                           unit='s'))})
+    interview_df = pd.concat([interview_df, new_df], ignore_index=True)[
+        interview_table.schema.names]
+
+    shutil.rmtree(file_path, ignore_errors=True)
+    pq.write_table(pa.Table.from_pandas(interview_df,
+                                        schema=interview_table.schema,
+                                        preserve_index=False), file_path)
+
+    return new_loader, emp_ids, interview_df
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_partitioned_folds_new_interviews(loader, tmp_path, workers):
+    state_folder = str(tmp_path / 'state')
+
+    def run(run_loader):
+        interview_state = InterviewScoreState(state_folder)
+        if interview_state.exists():
+            interview_state.load()
+
+        scorer = PartitionedScorer(
+            run_loader, ScorePipeline(interview_state=interview_state),
+            64 * 1024, str(tmp_path / 'spill'), workers=workers)
+        scorer.run(ScoreStore(str(tmp_path / 'score')))
+        interview_state.save()
+
+        return scorer, interview_state
+
+    run(loader)
+
+    new_loader, emp_ids, interview_df = _with_new_interviews(
+        loader, str(tmp_path / 'data'))
+    scorer, interview_state = run(new_loader)
+
+    assert scorer.partitions > 2
+
+    expected_df = PersonalScoreCalculator().interview_score(
+        interview_df[interview_df['emp_id'].isin(emp_ids)])
+    expected_df = expected_df[['emp_id', 'interview_score']].sort_values(
+        'emp_id').reset_index(drop=True)
+
+    pdt.assert_frame_equal(interview_state.scores(emp_ids), expected_df,
+                           check_dtype=False)
@@ -0,0 +1,93 @@
+'''Equivalence tests of the pipelined score mode.'''
+
+import asyncio
+
+import pandas.testing as pdt
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from parquet_loader import ParquetLoader
+from pipelined_scoring import PipelinedScorer
+from population_statistics import PopulationStatistics
+from score_pipeline import ScorePipeline
+
+KEYSPACE = 'emp_score_dev'
+
+
+class FakeSession:
+    '''Session which only keeps the keyspace'''
+
+    def __init__(self):
+        self.keyspace = None
+
+    def set_keyspace(self, keyspace):
+        self.keyspace = keyspace
+
+
+class FakeCassandraConnection:
+    '''Pulls canned tables page by page, the query is the table name'''
+
+    def __init__(self, tables):
+        self.tables = tables
+
+    def parquet_result_set(self, session, keyspace, query, file_path,
+                           fetch_size=5000, parameters=None, tables=None):
+        table = self.tables[query]
+
+        with pq.ParquetWriter(file_path, table.schema) as writer:
+            for batch in table.to_batches(max_chunksize=fetch_size):
+                page_table = pa.Table.from_batches([batch])
+                writer.write_table(page_table)
+
+                if tables is not None:
+                    tables.append(page_table)
+
+        return table.num_rows
+
+
+def _sorted(score_df):
+    return score_df.sort_values(list(score_df.columns)).reset_index(
+        drop=True)
+
+
+def test_pipelined_matches_full(loader, tables, data_file_details,
+                                tmp_path):
+    canned_tables = {
+        details['table_name']: pq.read_table(loader.file_path(name))
+        for name, details in data_file_details.items()}
+
+    sp = ScorePipeline()
+    score_eligible_prof_df, market_score_dfs, personal_score_dfs = (
+        asyncio.run(PipelinedScorer(
+            FakeCassandraConnection(canned_tables), FakeSession(), KEYSPACE,
+            ParquetLoader(data_file_details, str(tmp_path)), sp,
+            PopulationStatistics(), fetch_size=100, score_workers=4).run(
+                {table: table for table in canned_tables})))
+
+    # Full score mode on the data files
+    personal_info_df = tables['personal_info']
+    expected_prof_df = personal_info_df[
+        personal_info_df.recalculate_score_eligible == 'Y']
+
+    population_dfs = sp.population_frames(
+        personal_info_df, tables['work_info'],
+        tables['employee_technology_stack'], tables['certificate_info'])
+    stats = PopulationStatistics()
+    stats.build(population_dfs)
+    eligible_dfs = sp.eligible_frames(
+        expected_prof_df, population_dfs, tables['certificate_info'],
+        tables['education_info'], tables['interview_schedule'])
+
+    assert (sorted(score_eligible_prof_df['emp_id'])
+            == sorted(expected_prof_df['emp_id']))
+
+    for score_dfs, expected_dfs in (
+            (market_score_dfs, sp.market_scores(eligible_dfs,
+                                                stats.ratios())),
+            (personal_score_dfs, sp.personal_scores(
+                eligible_dfs, expected_prof_df['emp_id']))):
+        assert score_dfs.keys() == expected_dfs.keys()
+
+        for name, expected_df in expected_dfs.items():
+            pdt.assert_frame_equal(_sorted(score_dfs[name]),
+                                   _sorted(expected_df), obj=name)
@@ -0,0 +1,195 @@
+'''Tests of the population statistics kept between the runs.'''
+
+import logging
+
+import pandas as pd
+import pandas.testing as pdt
+
+import segment_kernels as sk
+from population_statistics import PopulationStatistics
+from score_pipeline import ScorePipeline
+
+
+def _population_frames(tables, emp_ids=None):
+    '''Population frames of effulgenz_score.py, only of emp_ids as the
+                                            incremental mode reads them'''
+    if emp_ids is not None:
+        tables = {name: table_df[table_df['emp_id'].isin(emp_ids)]
+                  for name, table_df in tables.items()}
+
+    return ScorePipeline().population_frames(
+        tables['personal_info'], tables['work_info'],
+        tables['employee_technology_stack'], tables['certificate_info'])
+
+
+def _sorted_counts(stats, category):
+    category_cols = stats.CATEGORIES[category]
+    count_df = stats.counts[category].astype(
+        {column: 'object' for column in category_cols
+         if str(stats.counts[category][column].dtype) == 'category'})
+
+    return count_df.sort_values(category_cols).reset_index(drop=True)
+
+
+def _changed_tables(tables, changed_ids, removed_ids):
+    '''Removes the first job of the changed and all rows of the removed
+        employees, the certificate rows of the first removed employee are
+                                                                    kept'''
+    kept_ids = removed_ids[:1]
+    tables = {name: table_df[~table_df['emp_id'].isin(removed_ids)
+                             | ((name == 'certificate_info')
+                                & table_df['emp_id'].isin(kept_ids))]
+              for name, table_df in tables.items()}
+    work_df = tables['work_info']
+    first_jobs = (work_df['emp_id'].isin(changed_ids)
+                  & ~work_df['emp_id'].duplicated())
+    tables['work_info'] = work_df[~first_jobs]
+
+    return tables
+
+
+def _with_orphan_certificate(tables):
+    '''Adds a certificate row of an employee without personal_info'''
+    certificate_df = tables['certificate_info']
+    orphan_df = certificate_df.iloc[[0]].copy()
+    orphan_df['emp_id'] = 'E999999999'
+
+    return dict(tables, certificate_info=pd.concat(
+        [certificate_df, orphan_df], ignore_index=True))
+
+
+def _apply_changes(stats, changed_tables, changed_ids):
+    '''Updates the loaded statistics as the incremental mode of
+                                                    effulgenz_score.py'''
+    removed_ids = stats.update_population(
+        changed_tables['personal_info']['emp_id'])
+    stats.apply_delta(changed_ids, _population_frames(
+        changed_tables, pd.concat([changed_ids, removed_ids])), removed_ids)
+
+    return removed_ids
+
+
+def _market_scores(tables, stats, emp_ids):
+    '''Market scores of emp_ids with the ratios of the statistics'''
+    sp = ScorePipeline()
+    tables = {name: table_df[table_df['emp_id'].isin(emp_ids)]
+              for name, table_df in tables.items()}
+
+    eligible_dfs = sp.eligible_frames(
+        tables['personal_info'], _population_frames(tables),
+        tables['certificate_info'], tables['education_info'],
+        tables['interview_schedule'])
+    score_dfs = sp.market_scores(eligible_dfs, stats.ratios())
+
+    return {name: score_df.sort_values(list(score_df.columns))
+            .reset_index(drop=True)
+            for name, score_df in score_dfs.items()}
+
+
+def test_apply_delta_matches_rebuild(tables, tmp_path):
+    emp_ids = tables['personal_info']['emp_id']
+    changed_ids, removed_ids = emp_ids[:20], emp_ids[20:25]
+
+    # Certificate rows without personal_info are counted by a rebuild
+    tables = _with_orphan_certificate(tables)
+
+    stats = PopulationStatistics(str(tmp_path), partitions=4)
+    stats.build(_population_frames(tables), emp_ids)
+    stats.save()
+
+    changed_tables = _changed_tables(tables, changed_ids, removed_ids)
+
+    stats = PopulationStatistics(str(tmp_path), partitions=4)
+    assert stats.exists()
+    stats.load()
+    assert set(_apply_changes(stats, changed_tables, changed_ids)) == set(
+        removed_ids)
+
+    expected_stats = PopulationStatistics(str(tmp_path / 'expected'))
+    expected_stats.build(_population_frames(changed_tables))
+
+    for category in stats.CATEGORIES:
+        pdt.assert_frame_equal(_sorted_counts(stats, category),
+                               _sorted_counts(expected_stats, category),
+                               check_dtype=False)
+
+        # Certificate rows of the first removed employee are still counted
+        dropped_ids = (removed_ids[1:] if category == 'certificate_name'
+                       else removed_ids)
+        assert not stats.contributions[category]['emp_id'].isin(
+            dropped_ids).any()
+
+
+def test_incremental_scores_match_recompute(tables, tmp_path):
+    emp_ids = tables['personal_info']['emp_id']
+    changed_ids, removed_ids = emp_ids[:30], emp_ids[30:40]
+
+    stats = PopulationStatistics(str(tmp_path), partitions=4)
+    stats.build(_population_frames(tables), emp_ids)
+    stats.save()
+
+    changed_tables = _changed_tables(tables, changed_ids, removed_ids)
+
+    # Statistics saved with 4 partitions are loaded with 8
+    stats = PopulationStatistics(str(tmp_path), partitions=8)
+    stats.load()
+    assert stats.changed_parts == set(range(8))
+    _apply_changes(stats, changed_tables, changed_ids)
+
+    expected_stats = PopulationStatistics(str(tmp_path / 'expected'))
+    expected_stats.build(_population_frames(changed_tables))
+
+    score_dfs = _market_scores(changed_tables, stats, changed_ids)
+    expected_dfs = _market_scores(changed_tables, expected_stats,
+                                  changed_ids)
+
+    for name, expected_df in expected_dfs.items():
+        pdt.assert_frame_equal(score_dfs[name], expected_df, obj=name)
+
+
+def test_save_writes_changed_partitions(tables, tmp_path):
+    emp_ids = tables['personal_info']['emp_id']
+    changed_ids, removed_ids = emp_ids[:3], emp_ids[3:4]
+
+    stats = PopulationStatistics(str(tmp_path), partitions=8)
+    stats.build(_population_frames(tables), emp_ids)
+    stats.save()
+
+    changed_tables = _changed_tables(tables, changed_ids, removed_ids)
+
+    stats = PopulationStatistics(str(tmp_path), partitions=8)
+    stats.load()
+    _apply_changes(stats, changed_tables, changed_ids)
+
+    # Only the partitions of the changed and removed employees are read
+    changed_parts = set(sk.emp_partitions(emp_ids[:4], 8).tolist())
+    assert stats.loaded_parts == changed_parts
+    assert stats.changed_parts == changed_parts
+
+    stats.save()
+
+    reloaded_stats = PopulationStatistics(str(tmp_path), partitions=8)
+    reloaded_stats.load()
+    assert reloaded_stats.update_population(
+        changed_tables['personal_info']['emp_id']).empty
+
+    stats.load_contributions()
+    reloaded_stats.load_contributions()
+
+    for category in stats.CATEGORIES:
+        pdt.assert_frame_equal(
+            reloaded_stats.contributions[category].sort_values(
+                ['emp_id'] + stats.CATEGORIES[category]).reset_index(
+                    drop=True),
+            stats.contributions[category].sort_values(
+                ['emp_id'] + stats.CATEGORIES[category]).reset_index(
+                    drop=True), check_dtype=False, check_categorical=False)
+
+
+def test_approximate_categories_are_not_incremental(tmp_path, caplog):
+    stats = PopulationStatistics(str(tmp_path), ['domain'])
+
+    with caplog.at_level(logging.WARNING):
+        assert not stats.exists()
+
+    assert 'can not be updated incrementally' in caplog.text
@@ -0,0 +1,19 @@
+'''Equivalence tests of the score pipeline engines and backends.'''
+
+import pandas.testing as pdt
+import pytest
+
+from conftest import _score_table, normalized
+from score_pipeline import ScorePipeline
+
+
+@pytest.mark.parametrize('lean', [False, True])
+def test_arrow_backend_matches_pandas(loader, lean):
+    pdt.assert_frame_equal(
+        normalized(_score_table(loader, 'arrow', lean=lean)),
+        normalized(_score_table(loader, lean=lean)))
+
+
+def test_arrow_backend_takes_pandas_engine():
+    with pytest.raises(ValueError):
+        ScorePipeline('fused', backend='arrow')
@@ -0,0 +1,75 @@
+'''Tests of the score store merge.'''
+
+import json
+from datetime import datetime
+
+import pandas as pd
+import pandas.testing as pdt
+import pyarrow as pa
+import pytest
+
+from conftest import _score_table
+from score_store import ScoreStore
+
+
+@pytest.fixture(scope='module')
+def score_table(loader):
+    return _score_table(loader)
+
+
+def _rescored(score_table, emp_ids):
+    '''Score table of the rescored employees with a new run'''
+    rescored_table = score_table.filter(pa.array(
+        score_table.column('emp_id').to_pandas().isin(emp_ids)))
+
+    return rescored_table.set_column(
+        1, 'run', pa.array([datetime(2021, 1, 2)] * rescored_table.num_rows,
+                           ScoreStore.SCHEMA.field('run').type))
+
+
+def _sorted(score_df):
+    return score_df.sort_values('emp_id').reset_index(drop=True)
+
+
+@pytest.mark.parametrize('partitions', [4, 8])
+def test_write_merges_rescored_employees(score_table, tmp_path, partitions):
+    emp_ids = score_table.column('emp_id').to_pandas()[::3]
+    rescored_table = _rescored(score_table, emp_ids)
+
+    ScoreStore(str(tmp_path), 4).write(score_table)
+
+    # Store written with 4 partitions is merged with 4 or 8 partitions
+    score_store = ScoreStore(str(tmp_path), partitions)
+    rows = score_store.write(rescored_table, emp_ids)
+
+    kept_df = score_table.to_pandas()
+    expected_df = _sorted(pd.concat(
+        [kept_df[~kept_df['emp_id'].isin(emp_ids)],
+         rescored_table.to_pandas()]))
+
+    assert rows == score_table.num_rows
+    pdt.assert_frame_equal(_sorted(score_store.read()), expected_df)
+    pdt.assert_frame_equal(
+        _sorted(score_store.read(emp_ids=emp_ids)),
+        _sorted(rescored_table.to_pandas()))
+
+    with open(f'{tmp_path}/score_store/_score_store.json') as f:
+        assert json.load(f)['partitions'] == partitions
+    assert len(list((tmp_path / 'score_store').glob('*.parquet'))) \
+        == partitions
+
+
+def test_read_with_other_partitions(score_table, tmp_path):
+    ScoreStore(str(tmp_path), 4).write(score_table)
+
+    emp_ids = score_table.column('emp_id').to_pandas()[:10]
+    score_df = ScoreStore(str(tmp_path), 8).read(emp_ids=emp_ids)
+
+    assert sorted(score_df['emp_id']) == sorted(emp_ids)
+
+
+def test_partition_hashes_emp_id_as_string():
+    score_store = ScoreStore()
+
+    assert (score_store.partition([1, 22, 333]).tolist()
+            == score_store.partition(['1', '22', '333']).tolist())
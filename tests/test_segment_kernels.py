@@ -0,0 +1,88 @@
+'''Tests of the segment kernels and of the fused personal score engine.'''
+
+import numpy as np
+import pandas as pd
+import pandas.testing as pdt
+import pytest
+
+import segment_kernels as sk
+from conftest import _score_table, normalized
+
+
+@pytest.fixture
+def rows():
+    '''Rows of 8 employees, e07 has no rows'''
+    rng = np.random.default_rng(7)
+    size = 200
+
+    return pd.DataFrame({
+        'emp_id': rng.choice([f'e{i:02d}' for i in range(7)], size),
+        'value': rng.integers(0, 50, size),
+        'category': pd.Series(rng.choice(['a', 'b', 'c', None], size),
+                              dtype='category')})
+
+
+def _sorted_codes(rows, emp_index, by_category=False):
+    codes = sk.employee_codes(emp_index, rows['emp_id'])
+    value_codes = sk.category_codes(rows['category'])
+    order = (np.lexsort((value_codes, codes)) if by_category
+             else np.argsort(codes, kind='stable'))
+
+    return codes[order], value_codes[order], order
+
+
+def test_segment_reductions_match_groupby(rows):
+    emp_index = pd.Index([f'e{i:02d}' for i in range(8)])
+    sorted_codes, sorted_values, order = _sorted_codes(rows, emp_index,
+                                                       by_category=True)
+    grouped = rows.groupby('emp_id')
+
+    expected_sum = grouped['value'].sum().reindex(emp_index, fill_value=0)
+    expected_count = grouped.size().reindex(emp_index, fill_value=0)
+    expected_nunique = grouped['category'].nunique().reindex(
+        emp_index, fill_value=0)
+
+    assert (sk.segment_sum(sorted_codes, rows['value'].values[order], 8)
+            .tolist() == expected_sum.tolist())
+    assert (sk.segment_count(sorted_codes, 8).tolist()
+            == expected_count.tolist())
+    assert (sk.segment_nunique(sorted_codes, sorted_values, 8).tolist()
+            == expected_nunique.tolist())
+
+
+def test_segment_dense_rank_matches_rank(rows):
+    emp_index = pd.Index(sorted(rows['emp_id'].unique()))
+    codes = sk.employee_codes(emp_index, rows['emp_id'])
+    order = np.lexsort((rows['value'].values, codes))
+
+    expected = rows.groupby('emp_id')['value'].rank(method='dense')
+
+    assert (sk.segment_dense_rank(codes[order],
+                                  rows['value'].values[order]).tolist()
+            == expected.values[order].astype('int64').tolist())
+
+
+def test_employee_values_keeps_integers():
+    values = sk.employee_values(np.array([3, 5]), np.array([2, 0]), 4)
+
+    assert str(values.dtype) == 'Int64'
+    assert values.tolist() == [5, pd.NA, 3, pd.NA]
+
+    floats = sk.employee_values(np.array([0.5]), np.array([1]), 2)
+    assert np.isnan(floats[0]) and floats[1] == 0.5
+
+
+def test_empty_segments():
+    empty = np.zeros(0, dtype='int64')
+
+    assert sk.segment_starts(empty).tolist() == []
+    assert sk.segment_sum(empty, empty, 2).tolist() == [0, 0]
+    assert sk.segment_dense_rank(empty, empty).tolist() == []
+
+
+@pytest.mark.parametrize('lean', [False, True])
+def test_fused_engine_matches_pandas(loader, lean):
+    pdt.assert_frame_equal(
+        normalized(_score_table(loader, personal_score_engine='fused',
+                                lean=lean)),
+        normalized(_score_table(loader, lean=lean)))
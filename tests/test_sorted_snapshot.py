@@ -0,0 +1,36 @@
+'''Tests of the emp_id sorted snapshots.'''
+
+import os
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from sorted_snapshot import SortedSnapshot
+
+
+def test_rewrite_tables_skips_current_snapshots(tmp_path):
+    file_path = str(tmp_path / 'work.parquet')
+    other_path = str(tmp_path / 'other.parquet')
+    pq.write_table(pa.table({'emp_id': ['E3', 'E1', 'E2'],
+                             'domain': ['a', 'b', 'c']}), file_path)
+    pq.write_table(pa.table({'name': ['x']}), other_path)
+
+    snapshot = SortedSnapshot()
+    assert snapshot.rewrite_tables([file_path, other_path]) == {
+        file_path: 1, other_path: None}
+    assert pq.read_table(file_path).column('emp_id').to_pylist() == [
+        'E1', 'E2', 'E3']
+
+    # Snapshot which is not changed since it is sorted is not written
+    mtime_ns = os.stat(file_path).st_mtime_ns
+    assert snapshot.rewrite_tables([file_path]) == {file_path: 1}
+    assert os.stat(file_path).st_mtime_ns == mtime_ns
+
+    # Upserted snapshot is sorted again
+    pq.write_table(pa.table({'emp_id': ['E4', 'E0'],
+                             'domain': ['d', 'e']}), file_path)
+    assert snapshot.read_index(file_path) is None
+    snapshot.rewrite_tables([file_path])
+    assert pq.read_table(file_path).column('emp_id').to_pylist() == [
+        'E0', 'E4']
+    assert snapshot.read_index(file_path) is not None
@@ -0,0 +1,76 @@
+'''Tests of the stage cache.'''
+
+import os
+
+import pandas as pd
+import pandas.testing as pdt
+import pyarrow as pa
+
+from stage_cache import StageCache
+
+
+def test_stage_key_changes_with_inputs(tmp_path):
+    file_path = tmp_path / 'work_info.parquet'
+    pd.DataFrame({'emp_id': ['1', '2']}).to_parquet(file_path)
+
+    cache = StageCache(str(tmp_path / 'cache'))
+    params = {'backend': 'pandas',
+              'columns': {'work_info': {'rel_cols': ['emp_id']}}}
+
+    key = cache.stage_key('population_frames', [str(file_path)], params)
+
+    assert key == cache.stage_key('population_frames', [str(file_path)],
+                                  dict(params))
+    assert key != cache.stage_key(
+        'population_frames', [str(file_path)],
+        dict(params, columns={'work_info': {'rel_cols': ['emp_id',
+                                                         'domain']}}))
+    assert key != cache.stage_key('population_frames', [str(file_path)],
+                                  dict(params, backend='arrow'))
+    assert key != cache.stage_key('population_frames', [str(file_path)],
+                                  params, upstream=[key])
+
+    os.utime(file_path, ns=(0, 0))
+    assert key != cache.stage_key('population_frames', [str(file_path)],
+                                  params)
+
+
+def test_get_or_compute_keeps_frames_and_tables(tmp_path):
+    cache = StageCache(str(tmp_path))
+    frames = {'work_agg': pd.DataFrame({'emp_id': ['1', '2'],
+                                        'total_exp': [3, 4]},
+                                       index=[5, 6]),
+              'tech': pa.table({'emp_id': ['1'],
+                                'technology_description': ['python']})}
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return frames
+
+    first = cache.get_or_compute('eligible_frames', 'key', compute)
+    assert cache.contains('eligible_frames', 'key')
+    second = cache.get_or_compute('eligible_frames', 'key', compute)
+
+    assert len(calls) == 1
+    # Index of the dataframes is not kept
+    pdt.assert_frame_equal(second['work_agg'],
+                           frames['work_agg'].reset_index(drop=True))
+    assert isinstance(second['tech'], pa.Table)
+    assert second['tech'].equals(first['tech'])
+
+
+def test_evict_removes_least_recently_used(tmp_path):
+    cache = StageCache(str(tmp_path))
+    frame = pd.DataFrame({'emp_id': ['1']})
+
+    cache.get_or_compute('first', 'key', lambda: frame)
+    os.utime(tmp_path / 'first-key', (0, 0))
+
+    # Cache folder keeps one entry, the older one is removed
+    cache.max_bytes = os.path.getsize(
+        tmp_path / 'first-key' / f'{StageCache.FRAME_NAME}.feather')
+    cache.get_or_compute('second', 'key', lambda: frame)
+
+    assert not cache.contains('first', 'key')
+    assert cache.contains('second', 'key')